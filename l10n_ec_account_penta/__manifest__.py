@@ -48,6 +48,7 @@
         'views/account_journal_views.xml',
         'views/account_asset_views.xml',
         'views/account_asset_template_views.xml',
+        'views/account_asset_code_log_views.xml',
         'views/res_config_settings_views.xml',
         'views/l10n_latam_document_type_views.xml',
         'views/res_partner_category_views.xml',
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 
+from . import account_account
 from . import account_journal
 from . import account_payment
 from . import account_cards
 from . import account_move
 from . import account_move_line
 from . import account_asset
+from . import account_asset_code_log
 from . import account_assets_report
 from . import account_asset_template
 from . import res_company
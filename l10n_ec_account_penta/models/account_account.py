@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models, tools
+
+# Clases del plan de cuentas sin distribución analítica: Activo, Pasivo y Patrimonio
+BALANCE_SHEET_CODE_PREFIXES = ('1', '2', '3')
+
+
+class AccountAccount(models.Model):
+    _inherit = 'account.account'
+
+    @api.model
+    @tools.ormcache('self.env.company.id')
+    def _get_balance_sheet_account_ids(self):
+        """
+        IDs de las cuentas cuyo código (en la compañía activa) empieza por
+        1, 2 o 3. Se guarda en la caché del registro y se invalida al crear,
+        eliminar o cambiar el código de una cuenta.
+        """
+        domain = ['|'] * (len(BALANCE_SHEET_CODE_PREFIXES) - 1) + [
+            ('code', '=like', f'{prefix}%') for prefix in BALANCE_SHEET_CODE_PREFIXES
+        ]
+        return frozenset(self.with_context(active_test=False).sudo().search(domain).ids)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        accounts = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return accounts
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'code' in vals or 'code_store' in vals:
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
@@ -2,10 +2,18 @@
 from odoo import api, fields, models, _
 from datetime import date
 import re
+from collections import Counter
 from html import unescape
 from odoo.exceptions import ValidationError, UserError
 from odoo.tools import month_name_es
 
+# Caracteres imprimibles ASCII: letras, números, espacios y símbolos como _ - / *
+ASSET_CODE_PATTERN = re.compile(r'^[\x20-\x7E]+$')
+# Contexto del modo masivo (importación / renumeración): valida el lote
+# completo antes de escribir, no genera mensajes en el chatter y registra los
+# cambios en ``account.asset.code.log``
+BULK_ASSET_CODE_KEY = 'asset_code_bulk'
+
 
 class AccountAsset(models.Model):
     _inherit = 'account.asset'
@@ -34,6 +42,11 @@ class AccountAsset(models.Model):
         tracking=True,
     )
 
+    _sql_constraints = [
+        ('asset_code_unique', 'unique(asset_code)',
+         'Ya existe un activo con el mismo código. El código del activo debe ser único.'),
+    ]
+
     @api.depends('analytic_distribution')
     def _compute_analytic_distribution_text(self):
         for rec in self:
@@ -56,38 +69,75 @@ class AccountAsset(models.Model):
             rec.analytic_distribution_text = ', '.join(names)
 
     @api.constrains('asset_code')
-    def _check_asset_code_unique(self):
-        """Validar que el código del activo sea único"""
-        for record in self:
-            if record.asset_code:
-                # Buscar otros registros con el mismo código (excluyendo el registro actual)
-                existing_asset = self.search([
-                    ('asset_code', '=', record.asset_code),
-                    ('id', '!=', record.id)
-                ], limit=1)
-                
-                if existing_asset:
-                    raise ValidationError(
-                        _("El código ingresado ya existe, por favor ingrese uno diferente.")
-                    )
+    def _check_asset_code(self):
+        """Validar formato y unicidad del código para todo el lote en una sola consulta"""
+        if self.env.context.get(BULK_ASSET_CODE_KEY):
+            # En modo masivo el lote completo se valida antes de escribir
+            return
+        self._raise_asset_code_errors(self.mapped('asset_code'), self.ids)
 
-    @api.constrains('asset_code')
-    def _check_asset_code_format(self):
-        """Validar el formato del código del activo"""
-        # Permitir letras, números y caracteres especiales imprimibles (por ejemplo: _ - / *)
-        # Se permiten espacios y cualquier caracter imprimible ASCII.
-        pattern = r'^[\x20-\x7E]+$'
-        for record in self:
-            if record.asset_code:
-                if not re.match(pattern, record.asset_code):
-                    raise ValidationError(
-                        _(
-                            "El código del activo sólo puede contener caracteres imprimibles (letras, números y símbolos como _ - / *)."
-                        )
-                    )
+    @api.model
+    def _get_asset_code_errors(self, codes, exclude_ids=()):
+        """
+        Valida un lote de códigos: formato, repetidos dentro del lote y
+        códigos ya usados por otros activos (una sola consulta).
+
+        :param codes: códigos a asignar (los vacíos se ignoran)
+        :param exclude_ids: activos del lote, cuyos códigos actuales no cuentan
+        :return: lista de mensajes de error
+        """
+        codes = [code for code in codes if code]
+        if not codes:
+            return []
+        errors = []
+        invalid = sorted({code for code in codes if not ASSET_CODE_PATTERN.match(code)})
+        if invalid:
+            errors.append(_(
+                "El código del activo sólo puede contener caracteres imprimibles "
+                "(letras, números y símbolos como _ - / *): %s", ', '.join(invalid)
+            ))
+        repeated = sorted(code for code, count in Counter(codes).items() if count > 1)
+        if repeated:
+            errors.append(_("Códigos de activo repetidos en el lote: %s", ', '.join(repeated)))
+        self.flush_model(['asset_code'])
+        self.env.cr.execute("""
+            SELECT DISTINCT asset_code
+              FROM account_asset
+             WHERE asset_code = ANY(%s)
+               AND NOT id = ANY(%s)
+        """, [list(set(codes)), list(exclude_ids)])
+        existing = sorted(row[0] for row in self.env.cr.fetchall())
+        if existing:
+            errors.append(_(
+                "Ya existe un activo con el código: %s. El código del activo debe ser único.",
+                ', '.join(existing)
+            ))
+        return errors
+
+    @api.model
+    def _raise_asset_code_errors(self, codes, exclude_ids=()):
+        errors = self._get_asset_code_errors(codes, exclude_ids)
+        if errors:
+            raise ValidationError('\n'.join(errors))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        if not self.env.context.get(BULK_ASSET_CODE_KEY):
+            return super().create(vals_list)
+        self._raise_asset_code_errors([vals.get('asset_code') for vals in vals_list])
+        assets = super(AccountAsset, self.with_context(tracking_disable=True)).create(vals_list)
+        assets._log_asset_code_changes({})
+        return assets.with_env(self.env)
 
     def write(self, vals):
         """Sobrescribir write para registrar cambios en el chatter"""
+        if 'asset_code' in vals and self.env.context.get(BULK_ASSET_CODE_KEY):
+            self._raise_asset_code_errors([vals['asset_code']] * len(self), self.ids)
+            old_codes = {record.id: record.asset_code for record in self}
+            result = super(AccountAsset, self.with_context(tracking_disable=True)).write(vals)
+            self._log_asset_code_changes(old_codes)
+            return result
+
         old_codes = {}
         if 'asset_code' in vals:
             for record in self:
@@ -119,19 +169,63 @@ class AccountAsset(models.Model):
         
         return result
 
-    @api.constrains('asset_code')
-    def _check_asset_code_unique(self):
-        """Validar que el código del activo sea único"""
-        for record in self:
-            if record.asset_code:
-                existing = self.search([
-                    ('asset_code', '=', record.asset_code),
-                    ('id', '!=', record.id)
-                ], limit=1)
-                if existing:
-                    raise ValidationError(_(
-                        'Ya existe un activo con el código "%s". El código del activo debe ser único.'
-                    ) % record.asset_code)
+    # ---------------------------
+    # Modo masivo (importación / renumeración)
+    # ---------------------------
+    def _log_asset_code_changes(self, old_codes):
+        """
+        Registra en ``account.asset.code.log``, como un solo lote, los activos
+        cuyo código cambió respecto a ``old_codes`` ({id: código anterior}).
+        """
+        batch = self.env.context.get('asset_code_batch') or '%s - %s' % (
+            fields.Datetime.to_string(fields.Datetime.now()), self.env.user.name,
+        )
+        return self.env['account.asset.code.log'].sudo().create([
+            {
+                'batch': batch,
+                'asset_id': asset.id,
+                'old_code': old_codes.get(asset.id) or False,
+                'new_code': asset.asset_code,
+            }
+            for asset in self
+            if (old_codes.get(asset.id) or False) != (asset.asset_code or False)
+        ])
+
+    @api.model
+    def _bulk_set_asset_codes(self, codes):
+        """
+        Renumeración masiva del registro de activos fijos. Valida el lote
+        completo antes de escribir, actualiza los códigos con dos sentencias
+        y deja los cambios en la bitácora en lugar de un mensaje por activo.
+
+        :param codes: {id del activo: código nuevo}
+        :return: filas de ``account.asset.code.log`` creadas
+        """
+        assets = self.browse(list(codes))
+        assets.check_access('write')
+        self._raise_asset_code_errors(list(codes.values()), assets.ids)
+        old_codes = {asset.id: asset.asset_code for asset in assets}
+        changed = {
+            asset_id: code or None
+            for asset_id, code in codes.items()
+            if (old_codes[asset_id] or False) != (code or False)
+        }
+        if not changed:
+            return self.env['account.asset.code.log']
+        cr = self.env.cr
+        # Primero se liberan los códigos para que los intercambios dentro del
+        # lote no choquen con el índice único
+        cr.execute("UPDATE account_asset SET asset_code = NULL WHERE id = ANY(%s)", [list(changed)])
+        cr.execute("""
+            UPDATE account_asset asset
+               SET asset_code = new.code,
+                   write_uid = %s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%s::int[], %s::varchar[]) AS new(id, code)
+             WHERE asset.id = new.id
+        """, [self.env.uid, list(changed), list(changed.values())])
+        assets.invalidate_recordset(['asset_code', 'write_uid', 'write_date'])
+        return assets._log_asset_code_changes(old_codes)
 
     @api.model
     def _name_search(self, name='', args=None, operator='ilike', limit=100, name_get_uid=None):
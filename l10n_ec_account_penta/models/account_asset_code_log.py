@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+
+class AccountAssetCodeLog(models.Model):
+    """
+    Bitácora compacta de cambios de código de activo hechos en modo masivo
+    (importación o renumeración, ver ``account.asset._bulk_set_asset_codes``).
+    Reemplaza al mensaje de chatter por activo: una fila por cambio, agrupadas
+    por lote.
+    """
+    _name = 'account.asset.code.log'
+    _description = 'Cambio de código de activo'
+    _order = 'id desc'
+
+    batch = fields.Char('Lote', required=True, readonly=True, index=True)
+    asset_id = fields.Many2one('account.asset', string='Activo', required=True, readonly=True,
+                               ondelete='cascade', index=True)
+    company_id = fields.Many2one(related='asset_id.company_id', string='Compañía')
+    old_code = fields.Char('Código anterior', readonly=True)
+    new_code = fields.Char('Código nuevo', readonly=True)
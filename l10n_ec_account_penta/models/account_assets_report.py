@@ -1,13 +1,47 @@
 # -*- coding: utf-8 -*-
 from odoo import fields, models, _
+from odoo.tools import SQL
 from collections import defaultdict
 
 MAX_NAME_LENGTH = 50
 
+# Atributos propios del activo que se agregan a cada fila de ``_query_values``
+ASSET_CUSTOM_ATTRIBUTES = ('asset_code', 'analytic_distribution_text')
+
+# Columnas que suma ``_get_account_totals`` (mismas etiquetas que ``_get_parent_asset_values``)
+ASSET_TOTAL_COLUMNS = (
+    'assets_date_from', 'assets_plus', 'assets_minus', 'assets_date_to',
+    'depre_date_from', 'depre_plus', 'depre_minus', 'depre_date_to', 'balance',
+)
+
 
 class AssetsReportCustomHandler(models.AbstractModel):
     _inherit = 'account.asset.report.handler'
 
+    def _query_values(self, options, prefix_to_match=None, forced_account_id=None):
+        """
+        Agrega a cada fila los atributos propios del activo (código,
+        distribución analítica) con una sola consulta, sin leer los activos
+        por el ORM.
+        """
+        asset_lines = super()._query_values(options, prefix_to_match=prefix_to_match, forced_account_id=forced_account_id)
+        asset_ids = list({al['asset_id'] for al in asset_lines})
+        attributes = {}
+        if asset_ids:
+            self.env['account.asset'].flush_model(ASSET_CUSTOM_ATTRIBUTES)
+            self._cr.execute("""
+                SELECT id, asset_code, analytic_distribution_text
+                  FROM account_asset
+                 WHERE id = ANY(%s)
+            """, [asset_ids])
+            attributes = {row['id']: row for row in self._cr.dictfetchall()}
+        for al in asset_lines:
+            row = attributes.get(al['asset_id'], {})
+            for attribute in ASSET_CUSTOM_ATTRIBUTES:
+                # Asegurar que sea string vacío si es None
+                al[attribute] = row.get(attribute) or ''
+        return asset_lines
+
     def _query_lines(self, options, prefix_to_match=None, forced_account_id=None):
         """
         Extender el método original para incluir el asset_code
@@ -23,23 +57,13 @@ class AssetsReportCustomHandler(models.AbstractModel):
             else:
                 parent_lines += [al]
 
-        # Cache de activos para obtener el código
-        asset_ids = [al['asset_id'] for al in parent_lines]
-        assets_cache = {asset.id: asset for asset in self.env['account.asset'].browse(asset_ids)}
-
         for al in parent_lines:
             asset_children_lines = children_lines[al['asset_id']]
             asset_parent_values = self._get_parent_asset_values(options, al, asset_children_lines)
-            
-            # Obtener el asset_code del cache
-            asset = assets_cache.get(al['asset_id'])
-            asset_code = getattr(asset, 'asset_code', None) if asset else None
-            # Asegurar que sea string vacío si es None o False
-            asset_code = asset_code or ''
 
             # Format the data - AGREGAR asset_code
             columns_by_expr_label = {
-                "asset_code": asset_code,  # NUEVA COLUMNA
+                "asset_code": al['asset_code'],  # NUEVA COLUMNA
                 "acquisition_date": al["asset_acquisition_date"] and self._format_date_for_report(al["asset_acquisition_date"]) or "",
                 "first_depreciation": al["asset_date"] and self._format_date_for_report(al["asset_date"]) or "",
                 "method": (al["asset_method"] == "linear" and _("Linear")) or (al["asset_method"] == "degressive" and _("Declining")) or _("Dec. then Straight"),
@@ -48,7 +72,7 @@ class AssetsReportCustomHandler(models.AbstractModel):
 
             lines.append((al['account_id'], al['asset_id'], al['asset_group_id'], columns_by_expr_label))
         return lines
-    
+
     def _format_date_for_report(self, date_value):
         """Helper para formatear fechas"""
         try:
@@ -59,7 +83,7 @@ class AssetsReportCustomHandler(models.AbstractModel):
 
     def _custom_options_initializer(self, report, options, previous_options):
         super()._custom_options_initializer(report, options, previous_options=previous_options)
-        
+
         # Actualizar los subheaders para incluir la nueva columna
         options['custom_columns_subheaders'] = [
             {"name": _("Características"), "colspan": 5},  # Aumentado de 4 a 5
@@ -67,3 +91,242 @@ class AssetsReportCustomHandler(models.AbstractModel):
             {"name": _("Depreciación"), "colspan": 4},
             {"name": _("Valor contable"), "colspan": 1}
         ]
+        # Carga diferida: con un límite de "cargar más" en el reporte, las
+        # cuentas se envían plegadas y sus activos se cargan al desplegarlas
+        options['assets_lazy_unfold'] = bool(report.load_more_limit)
+
+    # ---------------------------
+    # Carga diferida por cuenta
+    # ---------------------------
+    def _dynamic_lines_generator(self, report, options, all_column_groups_expression_totals, warnings=None):
+        """
+        En modo diferido (agrupado por cuenta), solo se arman las líneas de
+        cuenta con sus totales; los activos se cargan por páginas al
+        desplegar la cuenta (ver
+        ``_report_expand_unfoldable_line_assets_report_account``). Las cuentas
+        ya desplegadas las vuelve a expandir el reporte con esa misma función.
+        """
+        if not options.get('assets_lazy_unfold') or self._context.get('print_mode') \
+                or options.get('assets_grouping_field', 'account_id') != 'account_id':
+            return super()._dynamic_lines_generator(report, options, all_column_groups_expression_totals, warnings=warnings)
+        return [(0, line) for line in self._get_lazy_account_lines(report, options)]
+
+    def _get_lazy_account_lines(self, report, options):
+        """Líneas de cuenta y total, con los totales por cuenta de ``_get_account_totals``."""
+        totals_by_account = defaultdict(dict)
+        for column_group_key, column_group_options in report._split_options_per_column_group(options).items():
+            for account_id, totals in self._get_account_totals(report, column_group_options).items():
+                totals_by_account[account_id][column_group_key] = totals
+        if not totals_by_account:
+            return []
+
+        def build_columns(totals_by_column_group):
+            return [
+                report._build_column_dict(
+                    totals_by_column_group.get(column['column_group_key'], {}).get(column['expression_label'], 0.0)
+                    if column.get('figure_type') == 'monetary' else '',
+                    column,
+                    options=options,
+                )
+                for column in options['columns']
+            ]
+
+        lines = []
+        grand_totals = defaultdict(lambda: defaultdict(float))
+        accounts = self.env['account.account'].browse(list(totals_by_account)).sorted('code')
+        for account in accounts:
+            account_totals = totals_by_account[account.id]
+            for column_group_key, values in account_totals.items():
+                for expression_label, value in values.items():
+                    grand_totals[column_group_key][expression_label] += value
+            line_id = report._build_line_id([(None, 'account.account', account.id)])
+            lines.append({
+                'id': line_id,
+                'name': f"{account.code} {account.name}",
+                'level': 1,
+                'columns': build_columns(account_totals),
+                'unfoldable': True,
+                'unfolded': bool(options.get('unfold_all')) or line_id in options.get('unfolded_lines', []),
+                'expand_function': '_report_expand_unfoldable_line_assets_report_account',
+            })
+        lines.append({
+            'id': report._get_generic_line_id(None, None, markup='total'),
+            'name': _('Total'),
+            'level': 1,
+            'columns': build_columns(grand_totals),
+            'unfoldable': False,
+            'unfolded': False,
+        })
+        return lines
+
+    def _get_account_totals(self, report, options):
+        """
+        Totales por cuenta de una sola agrupación de columnas:
+        ``{account_id: {etiqueta: monto}}``.
+
+        Una sola consulta agrupada que repite el cálculo de
+        ``_get_parent_asset_values`` (activo principal más sus hijos, y baja
+        del activo cerrado y totalmente depreciado) sin armar las líneas de
+        cada activo. Con filtro analítico o compañías en otra moneda que la
+        del reporte, los montos se suman desde ``_query_lines``.
+        """
+        company_ids = list(report.get_report_company_ids(options))
+        companies = self.env['res.company'].browse(company_ids)
+        if options.get('analytic_accounts') or len(companies.currency_id) > 1:
+            totals_by_account = defaultdict(lambda: defaultdict(float))
+            for account_id, _asset_id, _asset_group_id, values in self._query_lines(options):
+                for expression_label in ASSET_TOTAL_COLUMNS:
+                    totals_by_account[account_id][expression_label] += values.get(expression_label) or 0.0
+            return totals_by_account
+
+        self.env['account.asset'].flush_model()
+        self.env['account.move'].flush_model(['asset_id', 'state', 'date', 'depreciation_value', 'asset_number_days'])
+        date_from = fields.Date.to_date(options['date']['date_from'])
+        date_to = fields.Date.to_date(options['date']['date_to'])
+        include_draft = bool(options.get('all_entries'))
+        journal_ids = [
+            journal['id'] for journal in options.get('journals', [])
+            if journal.get('model') == 'account.journal' and journal.get('selected')
+        ]
+        journal_condition = SQL("AND asset.journal_id = ANY(%s)", journal_ids) if journal_ids else SQL()
+        currency = companies.currency_id[:1] or self.env.company.currency_id
+        self._cr.execute(SQL("""
+            WITH asset_values AS (
+                SELECT asset.id,
+                       asset.parent_id,
+                       asset.account_asset_id AS account_id,
+                       asset.state,
+                       asset.original_value,
+                       asset.disposal_date,
+                       COALESCE(asset.acquisition_date, MIN(move.date)) < %(date_from)s AS opening,
+                       COALESCE(SUM(move.depreciation_value) FILTER (WHERE move.date < %(date_from)s AND move.state = 'posted'), 0)
+                           + COALESCE(asset.already_depreciated_amount_import, 0) AS depreciated_before,
+                       COALESCE(SUM(move.depreciation_value) FILTER (WHERE move.date BETWEEN %(date_from)s AND %(date_to)s AND move.state = 'posted'), 0) AS depreciated_during,
+                       COALESCE(SUM(move.depreciation_value) FILTER (
+                           WHERE move.date BETWEEN %(date_from)s AND %(date_to)s AND move.state = 'posted' AND move.asset_number_days IS NULL
+                       ), 0) AS disposal_value
+                  FROM account_asset asset
+                  LEFT JOIN account_move move ON move.asset_id = asset.id AND move.state != 'cancel'
+                 WHERE asset.company_id = ANY(%(company_ids)s)
+                   AND asset.active
+                   AND (asset.acquisition_date <= %(date_to)s OR move.date <= %(date_to)s)
+                   AND (asset.disposal_date >= %(date_from)s OR asset.disposal_date IS NULL)
+                   AND (asset.state NOT IN ('model', 'draft', 'cancelled') OR (asset.state = 'draft' AND %(include_draft)s))
+                   %(journal_condition)s
+              GROUP BY asset.id
+            ),
+            parent_values AS (
+                SELECT parent.account_id,
+                       parent.state = 'close' AND parent.disposal_date <= %(date_to)s AS disposed,
+                       parent.disposal_value,
+                       CASE WHEN parent.opening THEN parent.original_value ELSE 0 END
+                           + COALESCE(SUM(child.original_value) FILTER (WHERE child.opening), 0) AS assets_date_from,
+                       CASE WHEN parent.opening THEN 0 ELSE parent.original_value END
+                           + COALESCE(SUM(child.original_value) FILTER (WHERE NOT child.opening), 0) AS assets_plus,
+                       parent.depreciated_before + COALESCE(SUM(child.depreciated_before), 0) AS depre_date_from,
+                       parent.depreciated_during + COALESCE(SUM(child.depreciated_during), 0) AS depre_plus
+                  FROM asset_values parent
+                  LEFT JOIN asset_values child ON child.parent_id = parent.id
+                 WHERE parent.parent_id IS NULL
+              GROUP BY parent.id, parent.account_id, parent.state, parent.disposal_date, parent.disposal_value,
+                       parent.opening, parent.original_value, parent.depreciated_before, parent.depreciated_during
+            ),
+            asset_totals AS (
+                SELECT *,
+                       -- Activo cerrado y totalmente depreciado: sale del saldo
+                       disposed AND ROUND((assets_date_from + assets_plus - depre_date_from - depre_plus)::numeric, %(digits)s) = 0 AS written_off
+                  FROM parent_values
+            )
+            SELECT account_id,
+                   SUM(assets_date_from) AS assets_date_from,
+                   SUM(assets_plus) AS assets_plus,
+                   SUM(CASE WHEN written_off THEN assets_date_from + assets_plus ELSE 0 END) AS assets_minus,
+                   SUM(CASE WHEN written_off THEN 0 ELSE assets_date_from + assets_plus END) AS assets_date_to,
+                   SUM(depre_date_from) AS depre_date_from,
+                   SUM(depre_plus - CASE WHEN written_off THEN disposal_value ELSE 0 END) AS depre_plus,
+                   SUM(CASE WHEN written_off THEN depre_date_from + depre_plus - disposal_value ELSE 0 END) AS depre_minus,
+                   SUM(CASE WHEN written_off THEN 0 ELSE depre_date_from + depre_plus END) AS depre_date_to
+              FROM asset_totals
+          GROUP BY account_id
+        """,
+            date_from=date_from,
+            date_to=date_to,
+            company_ids=company_ids,
+            include_draft=include_draft,
+            journal_condition=journal_condition,
+            digits=currency.decimal_places,
+        ))
+        totals_by_account = {}
+        for row in self._cr.dictfetchall():
+            account_id = row.pop('account_id')
+            totals = {label: currency.round(amount or 0.0) for label, amount in row.items()}
+            totals['balance'] = totals['assets_date_to'] - totals['depre_date_to']
+            totals_by_account[account_id] = totals
+        return totals_by_account
+
+    def _get_account_asset_page(self, options, account_id, offset, limit):
+        """
+        Activos principales de la cuenta (sin ``parent_id``) de la página
+        pedida, en SQL; los filtros de fecha y estado los aplica después
+        ``_query_values``, por lo que una página puede tener menos líneas.
+
+        :return: (ids de la página, si hay más páginas)
+        """
+        report = self.env['account.report'].browse(options['report_id'])
+        self._cr.execute("""
+            SELECT id
+              FROM account_asset
+             WHERE account_asset_id = %(account_id)s
+               AND parent_id IS NULL
+               AND company_id = ANY(%(company_ids)s)
+               AND state != 'model'
+          ORDER BY acquisition_date, id
+            OFFSET %(offset)s
+             LIMIT %(limit)s
+        """, {
+            'account_id': account_id,
+            'company_ids': list(report.get_report_company_ids(options)),
+            'offset': offset,
+            'limit': limit + 1,
+        })
+        asset_ids = [row[0] for row in self._cr.fetchall()]
+        return asset_ids[:limit], len(asset_ids) > limit
+
+    def _report_expand_unfoldable_line_assets_report_account(self, line_dict_id, groupby, options, progress, offset, unfold_all_batch_data=None):
+        """Activos de una cuenta, de a ``load_more_limit`` por página."""
+        report = self.env['account.report'].browse(options['report_id'])
+        account_id = report._get_res_id_from_line_id(line_dict_id, 'account.account')
+        limit = report.load_more_limit if not self._context.get('print_mode') else None
+        if not limit:
+            lines, _totals_by_column_group = self._generate_report_lines_without_grouping(
+                report, options, parent_id=line_dict_id, forced_account_id=account_id,
+            )
+            return {'lines': lines, 'offset_increment': len(lines), 'has_more': False}
+
+        asset_ids, has_more = self._get_account_asset_page(options, account_id, offset, limit)
+        lines = []
+        if asset_ids:
+            lines, _totals_by_column_group = self._generate_report_lines_without_grouping(
+                report, options, parent_id=line_dict_id,
+                forced_account_id=self._get_account_page_filter(account_id, asset_ids),
+            )
+            position = {asset_id: index for index, asset_id in enumerate(asset_ids)}
+            lines.sort(key=lambda line: position.get(report._get_res_id_from_line_id(line['id'], 'account.asset'), len(position)))
+        return {
+            'lines': lines,
+            'offset_increment': len(asset_ids),
+            'has_more': has_more,
+        }
+
+    def _get_account_page_filter(self, account_id, asset_ids):
+        """
+        Valor de ``forced_account_id`` para la consulta de ``_query_values``
+        que además limita a los activos de la página y sus hijos. La consulta
+        original lo compara con el id de la cuenta (``<cuenta> = %s``), por lo
+        que la condición de la página queda dentro del WHERE y la base de
+        datos solo lee esos activos.
+        """
+        return SQL(
+            "%s AND (asset.id = ANY(%s) OR asset.parent_id = ANY(%s))",
+            account_id, asset_ids, asset_ids,
+        )
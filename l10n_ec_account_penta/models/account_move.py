@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, _
+from odoo import models, fields, tools, _
 from odoo.exceptions import UserError, ValidationError
 import re
+from collections import defaultdict
 from datetime import datetime
 
 
@@ -11,13 +12,30 @@ class AccountMove(models.Model):
     
     REGEX_PATTERN_DOC_TYPE = r"^\s+|\s+$" # Only leading and trailing spaces
 
+    def init(self):
+        super().init()
+        # Búsqueda de duplicados de _check_authorization_unique
+        if tools.column_exists(self.env.cr, self._table, 'l10n_ec_authorization_number'):
+            tools.create_index(
+                self.env.cr, 'account_move_l10n_ec_authorization_doc_type_index', self._table,
+                ['l10n_ec_authorization_number', 'l10n_latam_document_type_id'],
+                where='l10n_ec_authorization_number IS NOT NULL',
+            )
+
+    def _get_authorization_moves(self):
+        """Movimientos cuyo tipo de documento exige número de autorización
+        (longitud configurada y tipo de movimiento permitido)."""
+        codes_by_doc_type = {
+            doc_type: set(doc_type.penta_cb_move_type.mapped('code'))
+            for doc_type in self.l10n_latam_document_type_id
+            if doc_type.penta_cb_length_auth_number > 0
+        }
+        return self.filtered(
+            lambda m: m.move_type in codes_by_doc_type.get(m.l10n_latam_document_type_id, ())
+        )
+
     def _check_move_type(self):
-        for record in self:
-            document_type = record.l10n_latam_document_type_id
-            if document_type.penta_cb_length_auth_number <= 0 or \
-            record.move_type not in record.l10n_latam_document_type_id.penta_cb_move_type.mapped('code'):
-                return False
-        return True
+        return self._get_authorization_moves() == self
 
     
     def write(self, vals):
@@ -30,61 +48,103 @@ class AccountMove(models.Model):
 
         return res
 
-    def _check_authorization_length(self):
+    def _get_authorization_length_errors(self):
+        errors = []
         for move in self:
             document_type = move.l10n_latam_document_type_id
             auth_number = move.l10n_ec_authorization_number or ''
             if not document_type or not auth_number:
-                raise ValidationError(
-                    f"El número de autorización y el tipo de documento son obligatorios para el movimiento contable {move.name.strip()}."
+                errors.append(
+                    f"El número de autorización y el tipo de documento son obligatorios para el movimiento contable {(move.name or move.display_name).strip()}."
                 )
+                continue
 
-            
             if document_type.penta_cb_length_auth_number and \
                 document_type.penta_cb_length_auth_number > 0  and \
                 (len(auth_number) != document_type.penta_cb_length_auth_number):
                 length = re.sub(r"\s+", "", str(document_type.penta_cb_length_auth_number))
                 doc_name = re.sub(self.REGEX_PATTERN_DOC_TYPE, "", str(document_type.display_name))  # solo inicio/fin
-                raise ValidationError(
+                errors.append(
                     f"El número de autorización debe contener exactamente {length} dígitos para el tipo de documento {doc_name}."
                 )
-                
-    def _check_authorization_unique(self):
-        for move in self:
-            if move.l10n_latam_document_type_id.code == '02':
-                continue
-            auth_number = move.l10n_ec_authorization_number or ''
-            if not auth_number:
-                continue
+        return errors
 
-            record_account = self.env['account.move'].search([
-                ('l10n_ec_authorization_number', '=', auth_number),
-                ('l10n_latam_document_type_id', '=', move.l10n_latam_document_type_id.id),
-                ('id', '!=', move.id)
-            ], limit=1)
-            if record_account and len(record_account) > 0:
+    def _get_authorization_unique_errors(self):
+        moves = self.filtered(
+            lambda m: m.l10n_ec_authorization_number and m.l10n_latam_document_type_id.code != '02'
+        )
+        if not moves:
+            return []
+        # Una sola búsqueda para todo el lote (incluye los propios movimientos)
+        candidates = self.env['account.move'].search([
+            ('l10n_ec_authorization_number', 'in', list(set(moves.mapped('l10n_ec_authorization_number')))),
+            ('l10n_latam_document_type_id', 'in', moves.l10n_latam_document_type_id.ids),
+        ])
+        by_key = defaultdict(list)
+        for candidate in candidates:
+            by_key[(candidate.l10n_ec_authorization_number, candidate.l10n_latam_document_type_id.id)].append(candidate)
+
+        errors = []
+        for move in moves:
+            key = (move.l10n_ec_authorization_number, move.l10n_latam_document_type_id.id)
+            record_account = next((c for c in by_key.get(key, []) if c.id != move.id), None)
+            if record_account:
                 auth_number = re.sub(r"\s+", "", str(record_account.l10n_ec_authorization_number))
                 doc_name = re.sub(self.REGEX_PATTERN_DOC_TYPE, "", str(record_account.name))  # solo inicio/fin
                 doc_type_name = re.sub(self.REGEX_PATTERN_DOC_TYPE, "", str(record_account.l10n_latam_document_type_id.display_name))  # solo inicio/fin
-                raise ValidationError(
+                errors.append(
                     f"El número de autorización {auth_number} ya existe en el documento {doc_name} con el tipo de documento {doc_type_name}."
                 )
-            
-    def action_post(self):
-        # 1) Validación de control de asientos por mes actual
-        for record in self:
-            if record.journal_id and record.journal_id.entry_control == 'current_month':
-                now = fields.Datetime.context_timestamp(record, datetime.now())
-                # Validamos que la fecha del asiento esté en el mismo mes y año
-                if record.date.month != now.month or record.date.year != now.year:
-                    raise UserError(_("This journal only allows entries within the current month."))
-
-        # 2) Llamamos al super para que se contabilice el asiento
-        res = super(AccountMove, self).action_post()
+        return errors
 
-        # 3) Validaciones de tipo de documento y autorización
-        if self._check_move_type():
-            self._check_authorization_length()
-            self._check_authorization_unique()
+    def _check_authorization_length(self):
+        errors = self._get_authorization_length_errors()
+        if errors:
+            raise ValidationError("\n".join(errors))
+
+    def _check_authorization_unique(self):
+        errors = self._get_authorization_unique_errors()
+        if errors:
+            raise ValidationError("\n".join(errors))
+
+    def _check_entry_control(self):
+        """Diarios con control 'current_month': la fecha debe estar en el mes actual."""
+        moves = self.filtered(lambda m: m.journal_id.entry_control == 'current_month')
+        if not moves:
+            return
+        now = fields.Datetime.context_timestamp(self, datetime.now())
+        if any(move.date.month != now.month or move.date.year != now.year for move in moves):
+            raise UserError(_("This journal only allows entries within the current month."))
 
+    def _get_generated_authorization_moves(self):
+        """Documentos cuyo número de autorización lo genera la facturación
+        electrónica al contabilizar (l10n_ec_edi): ventas de diarios con
+        emisión. En el resto lo ingresa el usuario."""
+        return self.filtered(lambda m: m.is_sale_document() and m.journal_id.l10n_ec_require_emission)
+
+    def _raise_authorization_errors(self):
+        """Longitud y duplicados del número de autorización, todos juntos."""
+        errors = self._get_authorization_length_errors() + self._get_authorization_unique_errors()
+        if errors:
+            raise ValidationError("\n".join(errors))
+
+    def _check_before_post(self):
+        """
+        Validaciones del lote antes de contabilizar: control de mes del diario y
+        número de autorización de los documentos que lo exigen y en los que lo
+        ingresa el usuario. Los errores de autorización se informan todos juntos.
+        """
+        self._check_entry_control()
+        moves = self._get_authorization_moves()
+        (moves - moves._get_generated_authorization_moves())._raise_authorization_errors()
+
+    def _check_after_post(self):
+        """Número de autorización de los documentos que lo generan al contabilizar."""
+        moves = self._get_authorization_moves()
+        moves._get_generated_authorization_moves()._raise_authorization_errors()
+
+    def action_post(self):
+        self._check_before_post()
+        res = super(AccountMove, self).action_post()
+        self._check_after_post()
         return res
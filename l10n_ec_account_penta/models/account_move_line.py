@@ -7,30 +7,20 @@ class AccountMoveLine(models.Model):
     
     @api.model_create_multi
     def create(self, vals_list):
-        for vals in vals_list:
-            account_id = vals.get('account_id')
-            if account_id:
-                account = self.env['account.account'].browse(account_id)
+        if any(vals.get('analytic_distribution') for vals in vals_list):
+            balance_sheet_ids = self.env['account.account']._get_balance_sheet_account_ids()
+            for vals in vals_list:
                 # Si la cuenta pertenece al grupo de Activo, Pasivo o Patrimonios
-                if account.code[0] in ['1', '2', '3'] and vals.get('analytic_distribution'):
+                if vals.get('analytic_distribution') and vals.get('account_id') in balance_sheet_ids:
                     # Borrar la distribución analítica
                     vals.pop('analytic_distribution', None)
         return super().create(vals_list)
     
     def write(self, vals):
-        account_by_vals = None
-        if vals.get('account_id'):
-            account_by_vals = self.env['account.account'].browse(vals['account_id'])
-        
-        for line in self:
-            account = account_by_vals or line.account_id
-            if (
-                account 
-                and account.code 
-                and isinstance(account.code, str)
-                and account.code[:1] in ['1', '2', '3']
-                and vals.get('analytic_distribution')
-            ):
+        if vals.get('analytic_distribution'):
+            balance_sheet_ids = self.env['account.account']._get_balance_sheet_account_ids()
+            account_ids = {vals['account_id']} if vals.get('account_id') else set(self.account_id.ids)
+            if not account_ids.isdisjoint(balance_sheet_ids):
                 vals.pop('analytic_distribution', None)
 
-        return super().write(vals)
\ No newline at end of file
+        return super().write(vals)
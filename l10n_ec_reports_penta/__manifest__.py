@@ -27,12 +27,16 @@
         'report_xlsx',
         'account_followup',
         'account_reports',
-        'account_batch_payment'
+        'account_batch_payment',
+        'mail',
+        'stock_account',
         ],
     "data": [
         "security/ir.model.access.csv",
+        "security/pentalab_report_job_security.xml",
         
         'data/mail_templates.xml',
+        'data/ir_cron.xml',
         
         'report/report_export_stock_quant_xlsx.xml',
         'report/account_move_inventory_report.xml',
@@ -61,6 +65,9 @@
         'views/view_account_form_inherit_hide_in_report.xml',
         'views/account_move_report_action.xml',
         "views/bank_recon_report_wizard_views.xml",
+        "views/res_partner_views.xml",
+        "views/pentalab_report_job_views.xml",
+        "views/pentalab_report_run_views.xml",
         "data/report_paperformat.xml", 
         "data/report_action.xml",
         "report/report_bank_recon_pdf.xml",
@@ -1,57 +1,127 @@
 from odoo import http
 from odoo.http import request
-import io
+import tempfile
 import xlsxwriter
 from dateutil.relativedelta import relativedelta
-from datetime import datetime
+from datetime import datetime, timedelta
+
+# Filas que se traen por cada FETCH del cursor del servidor
+EXPORT_ITERSIZE = 2000
+# Tamaño de los bloques con que se envía el archivo al navegador
+STREAM_CHUNK_SIZE = 64 * 1024
+
+HEADERS = [
+    "Almacén", "Nombre corto", "Referencia interna", "Producto",
+    "Línea", "Grupo", "Artículo", "Cantidad a la mano", "Costo", "Precio", "Fecha de ingreso"
+]
+# Sin almacén: las transferencias entre almacenes no generan capas de
+# valoración, así que el cierre solo es exacto por producto
+MONTH_END_HEADERS = [
+    "Referencia interna", "Producto",
+    "Nivel 1", "Nivel 2", "Nivel 3", "Nivel 4", "Nivel 5", "Nivel 6",
+    "Cantidad al cierre", "Valor al cierre"
+]
+
 
 class InventoryExportController(http.Controller):
 
     @http.route('/inventory_export_xlsx', type='http', auth='user')
-    def export_inventory_xlsx(self, month, year, **kwargs):
+    def export_inventory_xlsx(self, month, year, export_type='in_date', **kwargs):
         start = datetime(int(year), int(month), 1)
-        print('Fecha de inicio:', start)
         end = (start + relativedelta(months=1))
-        print('Fecha de fin:', end)
 
-        records = request.env['stock.quant.aggregated'].sudo().search([
-            ('in_date', '>=', start),
-            ('in_date', '<', end),
-            ('location_usage', '=', 'internal'),
-        ])
+        if export_type == 'month_end':
+            headers = MONTH_END_HEADERS
+            rows = self._fetch_rows(*self._month_end_query((end - timedelta(days=1)).date()))
+        else:
+            headers = HEADERS
+            rows = self._fetch_rows(*self._in_date_query(start, end))
 
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output)
+        # constant_memory: xlsxwriter escribe cada fila a disco apenas se completa
+        output = tempfile.TemporaryFile()
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
         sheet = workbook.add_worksheet("Inventario")
+        date_format = workbook.add_format({'num_format': 'dd/mm/yyyy hh:mm'})
 
-        headers = [
-            "Almacén", "Nombre corto", "Referencia interna", "Producto",
-            "Línea", "Grupo", "Artículo", "Cantidad a la mano", "Costo", "Precio", "Fecha de ingreso"
-        ]
         for col, header in enumerate(headers):
             sheet.write(0, col, header)
 
         row = 1
-        for rec in records:
-            sheet.write(row, 0, rec.warehouse_id.name if rec.warehouse_id else '')
-            sheet.write(row, 1, rec.location_parent_id.name if rec.location_parent_id.name else '')
-            sheet.write(row, 2, rec.default_code or '')
-            sheet.write(row, 3, rec.product_name or '')
-            sheet.write(row, 4, rec.product_line or '')
-            sheet.write(row, 5, rec.product_group or '')
-            sheet.write(row, 6, rec.product_category or '')
-            sheet.write(row, 7, rec.quantity)
-            sheet.write(row, 8, rec.standard_price or 0.0)
-            sheet.write(row, 9, rec.list_price or 0.0)
-            sheet.write(row, 9, rec.in_date or '')
+        for values in rows:
+            for col, value in enumerate(values):
+                if isinstance(value, datetime):
+                    sheet.write_datetime(row, col, value, date_format)
+                elif value is not None:
+                    sheet.write(row, col, value)
             row += 1
 
         workbook.close()
         output.seek(0)
         return request.make_response(
-            output.read(),
+            self._stream_file(output),
             headers=[
                 ('Content-Type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
                 ('Content-Disposition', f'attachment; filename="inventario_{month}_{year}.xlsx"')
             ]
-        )
\ No newline at end of file
+        )
+
+    def _in_date_query(self, start, end):
+        """Stock agrupado ingresado en el mes, con los nombres de almacén y
+        ubicación ya resueltos en la consulta."""
+        query = """
+            SELECT COALESCE(w.name, ''),
+                   COALESCE(loc.name, ''),
+                   COALESCE(sqa.default_code, ''),
+                   COALESCE(sqa.product_name, ''),
+                   COALESCE(sqa.product_line, ''),
+                   COALESCE(sqa.product_group, ''),
+                   COALESCE(sqa.product_category, ''),
+                   sqa.quantity,
+                   COALESCE(sqa.standard_price, 0.0),
+                   COALESCE(sqa.list_price, 0.0),
+                   sqa.in_date
+              FROM stock_quant_aggregated sqa
+              LEFT JOIN stock_warehouse w ON w.id = sqa.warehouse_id
+              LEFT JOIN stock_location loc ON loc.id = sqa.location_parent_id
+             WHERE sqa.in_date >= %s
+               AND sqa.in_date < %s
+               AND sqa.location_usage = 'internal'
+             ORDER BY sqa.id
+        """
+        return query, [start, end]
+
+    def _month_end_query(self, cutoff):
+        """Existencias por producto al cierre del mes (ver ``pentalab.stock.checkpoint``)."""
+        query, params = request.env['pentalab.stock.checkpoint']._stock_at_query(cutoff, request.env.companies.ids)
+        query = f"""
+            SELECT default_code, product_name,
+                   cat_l1_name, cat_l2_name, cat_l3_name, cat_l4_name, cat_l5_name, cat_l6_name,
+                   SUM(quantity), SUM(value)
+              FROM ({query}) stock
+             GROUP BY product_id, default_code, product_name,
+                      cat_l1_name, cat_l2_name, cat_l3_name, cat_l4_name, cat_l5_name, cat_l6_name
+            HAVING SUM(quantity) <> 0 OR SUM(value) <> 0
+             ORDER BY default_code, product_id
+        """
+        return query, params
+
+    def _fetch_rows(self, query, params):
+        """Filas de ``query`` leídas con un cursor del servidor, de a ``EXPORT_ITERSIZE``."""
+        cr = request.env.cr
+        cr.execute(f"DECLARE inventory_export NO SCROLL CURSOR FOR {query}", params)
+        try:
+            while True:
+                cr.execute("FETCH %s FROM inventory_export", [EXPORT_ITERSIZE])
+                rows = cr.fetchall()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cr.execute("CLOSE inventory_export")
+
+    def _stream_file(self, file):
+        try:
+            while chunk := file.read(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            file.close()
@@ -1,4 +1,8 @@
+from . import pentalab_report_output
+from . import pentalab_report_run
+from . import pentalab_report_job
 from . import account_move
+from . import account_partial_reconcile
 from . import account_payment
 from . import account_tax
 from . import cobros_por_ventas
@@ -6,15 +10,20 @@ from . import export_inventory_wizard
 from . import invoice_report
 from . import pagos_por_compras
 from . import pentalab_report_wizard
+from . import product_category
 from . import product_product
+from . import product_template
 from . import res_company
 from . import res_config_settings
 from . import stock_quant_aggregated
 from . import stock_quant
+from . import pentalab_stock_checkpoint
 from . import account_account
 from . import pentalab_report_balance_wizard
 from . import pentalab_report_estado_wizard
 from . import pentalab_report_custom
+from . import pentalab_report_lines
+from . import pentalab_partner_aging
 from . import res_partner
 from . import bank_recon_report_wizard
 
@@ -1,7 +1,14 @@
-from odoo import models, fields
+from collections import defaultdict
+
+from odoo import api, models, fields
+
+from .invoice_report import SOURCE_MOVE_FIELDS
 
 ACCOUNT_MOVE_MODEL = 'account.move'
 
+# Campos del asiento que cambian sus apuntes publicados (saldos y cartera)
+LEDGER_MOVE_FIELDS = frozenset({'state', 'line_ids', 'invoice_line_ids', 'partner_id', 'date'})
+
 class AccountMoveInventoryReportAction(models.Model):
     _inherit = ACCOUNT_MOVE_MODEL
     
@@ -25,6 +32,47 @@ class AccountMoveInventoryReportAction(models.Model):
             ])
             move.valuation_moves_ids = valuation_layers.mapped('account_move_id')
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        moves = super().create(vals_list)
+        self.env['pentalab.invoice.report.line']._schedule_refresh(moves.ids)
+        moves._pentalab_posted()._pentalab_schedule_ledger_refresh()
+        return moves
+
+    def write(self, vals):
+        ledger_change = not LEDGER_MOVE_FIELDS.isdisjoint(vals)
+        if ledger_change:
+            # Estado previo: un asiento que vuelve a borrador o cambia de contacto
+            posted_before = self._pentalab_posted()
+            partner_ids_before = posted_before.line_ids.partner_id.ids
+        res = super().write(vals)
+        if not SOURCE_MOVE_FIELDS.isdisjoint(vals):
+            self.env['pentalab.invoice.report.line']._schedule_refresh(self.ids)
+        if ledger_change:
+            (posted_before | self._pentalab_posted())._pentalab_schedule_ledger_refresh(partner_ids_before)
+        return res
+
+    def unlink(self):
+        self.env['pentalab.invoice.report.line']._schedule_refresh(self.ids)
+        self._pentalab_posted()._pentalab_schedule_ledger_refresh()
+        return super().unlink()
+
+    def _pentalab_posted(self):
+        return self.filtered(lambda move: move.state == 'posted')
+
+    def _pentalab_schedule_ledger_refresh(self, partner_ids=()):
+        """
+        Programa el recálculo de la antigüedad de los contactos de ``self``
+        (asientos publicados, o que lo estaban antes del cambio) más
+        ``partner_ids`` y sube la versión del libro de sus compañías. Los
+        borradores no mueven la cartera ni los saldos: no se llama por ellos.
+        """
+        if not self:
+            return
+        partner_ids = set(partner_ids) | set(self.line_ids.partner_id.ids)
+        self.env['pentalab.partner.aging']._schedule_refresh(list(partner_ids))
+        self.env['pentalab.report.lines.service']._bump_ledger_version(self.company_id.ids)
+
 
     def _get_report_values(self, docids, data=None):
         docs = self.env[ACCOUNT_MOVE_MODEL].browse(docids)
@@ -49,4 +97,122 @@ class AccountMoveInventoryReportAction(models.Model):
         return {
             'doc_model': ACCOUNT_MOVE_MODEL,
             'docs': docs,
-        }
\ No newline at end of file
+        }
+
+    def _get_report_tax_group_amounts(self, tax_groups):
+        """
+        Bases e impuestos de las facturas agrupados por conjunto de etiquetas
+        y grupo de impuestos, para los reportes A1 y A2.
+
+        Las bases salen del subtotal de las líneas de producto y los impuestos
+        de las líneas de impuesto ya contabilizadas; el impuesto de cada
+        ``tax_line_id`` (o de su impuesto de grupo) se reparte entre los
+        conjuntos de etiquetas en proporción a su base. Todo en la moneda de la factura.
+
+        Retorna ``{move_id: [(etiquetas, {grupo: base}, {grupo: impuesto}), ...]}``
+        con los conjuntos de etiquetas en el orden de las líneas de la factura.
+        """
+        result = {move.id: [] for move in self}
+        if not self:
+            return result
+        self.env['account.move.line'].flush_model()
+        self.env['account.account.tag'].flush_model(['name'])
+        lang = self.env.lang or 'en_US'
+        self.env.cr.execute("""
+            SELECT aml.move_id,
+                   aml.id AS line_id,
+                   aml.price_subtotal,
+                   tax.id AS tax_id,
+                   tax.tax_group_id,
+                   ARRAY(
+                       SELECT COALESCE(tag.name->>%(lang)s, tag.name->>'en_US')
+                         FROM account_account_tag_account_move_line_rel tag_rel
+                         JOIN account_account_tag tag ON tag.id = tag_rel.account_account_tag_id
+                        WHERE tag_rel.account_move_line_id = aml.id
+                   ) AS tag_names
+              FROM account_move_line aml
+         LEFT JOIN (account_move_line_account_tax_rel tax_rel
+                    JOIN account_tax tax ON tax.id = tax_rel.account_tax_id
+                                        AND tax.tax_group_id = ANY(%(tax_group_ids)s))
+                ON tax_rel.account_move_line_id = aml.id
+             WHERE aml.move_id = ANY(%(move_ids)s)
+               AND aml.display_type = 'product'
+          ORDER BY aml.move_id, aml.sequence, aml.id
+        """, {'lang': lang, 'tax_group_ids': tax_groups.ids, 'move_ids': self.ids})
+        base_lines = self.env.cr.dictfetchall()
+
+        # Impuesto contabilizado por factura e impuesto, con signo de documento
+        self.env.cr.execute("""
+            SELECT aml.move_id,
+                   aml.tax_line_id,
+                   SUM(aml.amount_currency) * CASE
+                       WHEN move.move_type IN ('out_invoice', 'in_refund', 'out_receipt') THEN -1
+                       ELSE 1
+                   END AS amount
+              FROM account_move_line aml
+              JOIN account_move move ON move.id = aml.move_id
+             WHERE aml.move_id = ANY(%s)
+               AND aml.tax_line_id IS NOT NULL
+          GROUP BY aml.move_id, aml.tax_line_id, move.move_type
+        """, [self.ids])
+        tax_lines = self.env.cr.fetchall()
+
+        # Las líneas de producto llevan el impuesto de grupo y las de impuesto
+        # sus hijos: cada hijo se imputa a su grupo (children_tax_ids)
+        group_ids = list({line['tax_id'] for line in base_lines if line['tax_id']})
+        parents_by_child = defaultdict(list)
+        if group_ids:
+            self.env['account.tax'].flush_model(['children_tax_ids'])
+            self.env.cr.execute("""
+                SELECT child_tax, parent_tax
+                  FROM account_tax_filiation_rel
+                 WHERE parent_tax = ANY(%s)
+            """, [group_ids])
+            for child_id, parent_id in self.env.cr.fetchall():
+                parents_by_child[child_id].append(parent_id)
+
+        # Conjuntos de etiquetas por factura (en orden de aparición) y bases
+        tag_order = defaultdict(list)
+        base_by_tax = defaultdict(lambda: defaultdict(float))
+        group_by_tax = {}
+        for line in base_lines:
+            move_id = line['move_id']
+            tag_name = ", ".join(sorted(name or '' for name in line['tag_names']))
+            if tag_name not in tag_order[move_id]:
+                tag_order[move_id].append(tag_name)
+            if line['tax_id']:
+                base_by_tax[(move_id, line['tax_id'])][tag_name] += line['price_subtotal'] or 0.0
+                group_by_tax[line['tax_id']] = line['tax_group_id']
+
+        tax_amounts = defaultdict(float)
+        for move_id, tax_id, amount in tax_lines:
+            for candidate_id in [tax_id, *parents_by_child.get(tax_id, [])]:
+                if (move_id, candidate_id) in base_by_tax:
+                    tax_amounts[(move_id, candidate_id)] += amount
+                    break
+
+        bases = defaultdict(lambda: defaultdict(float))
+        amounts = defaultdict(lambda: defaultdict(float))
+        for (move_id, tax_id), base_by_tag in base_by_tax.items():
+            group_id = group_by_tax[tax_id]
+            tax_amount = tax_amounts.get((move_id, tax_id), 0.0)
+            total_base = sum(base_by_tag.values())
+            for tag_name, base in base_by_tag.items():
+                bases[(move_id, tag_name)][group_id] += base
+                if total_base:
+                    share = base / total_base
+                else:
+                    share = 1.0 / len(base_by_tag)
+                amounts[(move_id, tag_name)][group_id] += tax_amount * share
+
+        for move_id in result:
+            tag_names = tag_order.get(move_id, [])
+            # Las líneas sin etiquetas solo generan fila si ninguna línea tiene etiquetas
+            tagged = [tag for tag in tag_names if tag]
+            for tag_name in tagged or ['']:
+                result[move_id].append((
+                    tag_name,
+                    dict(bases.get((move_id, tag_name), {})),
+                    dict(amounts.get((move_id, tag_name), {})),
+                ))
+        return result
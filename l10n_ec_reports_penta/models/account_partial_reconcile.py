@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+
+
+class AccountPartialReconcile(models.Model):
+    _inherit = 'account.partial.reconcile'
+
+    def _pentalab_aging_partner_ids(self):
+        return (self.debit_move_id.partner_id | self.credit_move_id.partner_id).ids
+
+    def _pentalab_company_ids(self):
+        return (self.debit_move_id.company_id | self.credit_move_id.company_id).ids
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        partials = super().create(vals_list)
+        self.env['pentalab.partner.aging']._schedule_refresh(partials._pentalab_aging_partner_ids())
+        self.env['pentalab.report.lines.service']._bump_ledger_version(partials._pentalab_company_ids())
+        return partials
+
+    def unlink(self):
+        self.env['pentalab.partner.aging']._schedule_refresh(self._pentalab_aging_partner_ids())
+        self.env['pentalab.report.lines.service']._bump_ledger_version(self._pentalab_company_ids())
+        return super().unlink()
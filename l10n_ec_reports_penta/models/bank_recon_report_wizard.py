@@ -3,9 +3,8 @@ from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 from odoo.tools.misc import format_date
 from dateutil.relativedelta import relativedelta
-import base64
-import io
 import logging
+from .pentalab_report_run import profiled_report
 _logger = logging.getLogger(__name__)
 
 try:
@@ -16,6 +15,7 @@ except Exception:
 
 class PentaBankReconReportWizard(models.TransientModel):
     _name = 'penta.bank.recon.report.wizard'
+    _inherit = 'pentalab.report.output.mixin'
     _description = 'Reporte de Conciliación Bancaria (Tarjetas / Extracto / Pendientes)'
 
     # --------------------------- CAMPOS ---------------------------
@@ -92,22 +92,34 @@ class PentaBankReconReportWizard(models.TransientModel):
     def _compute_running_balances(self, st_lines):
         """
         Calcula running balance por extracto:
-        balance_start/balance_start_real + sum(amount) siguiendo el orden.
+        balance_start + sum(amount) en orden (fecha, id), con una función de
+        ventana sobre todas las líneas de los extractos involucrados.
         """
         rb_map = {}
         if not st_lines:
             _logger.debug("[WIZ] _compute_running_balances: no hay líneas.")
             return rb_map
 
-        for st in st_lines.mapped('statement_id'):
-            lines_all = st.line_ids.sorted(key=lambda l: (l.date, l.id))
-            bal_init = (st.balance_start or getattr(st, 'balance_start_real', 0.0) or 0.0)
-            _logger.debug("[WIZ] Statement %s: balance_start=%s, balance_start_real=%s -> usado=%s (total líneas=%s)",
-                          st.id, st.balance_start, getattr(st, 'balance_start_real', None), bal_init, len(lines_all))
-            bal = bal_init
-            for l in lines_all:
-                bal += (l.amount or 0.0)
-                rb_map[l.id] = bal
+        self.env['account.bank.statement.line'].flush_model(['amount', 'statement_id'])
+        self.env['account.bank.statement'].flush_model(['balance_start'])
+        self.env['account.move'].flush_model(['date'])
+        self.env.cr.execute("""
+            SELECT st_line.id,
+                   COALESCE(st.balance_start, 0.0)
+                   + SUM(COALESCE(st_line.amount, 0.0)) OVER (
+                       PARTITION BY st_line.statement_id
+                       ORDER BY move.date, st_line.id
+                   ) AS running_balance
+              FROM account_bank_statement_line st_line
+              JOIN account_bank_statement st ON st.id = st_line.statement_id
+              JOIN account_move move ON move.id = st_line.move_id
+             WHERE st_line.statement_id IN (
+                       SELECT statement_id
+                         FROM account_bank_statement_line
+                        WHERE id = ANY(%s)
+                   )
+        """, [st_lines.ids])
+        rb_map = dict(self.env.cr.fetchall())
 
         _logger.debug("[WIZ] _compute_running_balances: map size=%s", len(rb_map))
         return rb_map
@@ -137,16 +149,35 @@ class PentaBankReconReportWizard(models.TransientModel):
         return val
 
     # --------------------------- MAPEOS ---------------------------
+    def _payments_by_move(self, moves):
+        """ Primer account.payment de cada asiento, en una sola consulta. """
+        if not moves:
+            return {}
+        self.env['account.payment'].flush_model(['move_id'])
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (move_id) move_id, id
+              FROM account_payment
+             WHERE move_id = ANY(%s)
+          ORDER BY move_id, id
+        """, [moves.ids])
+        pay_ids = dict(self.env.cr.fetchall())
+        payments = self.env['account.payment'].sudo().browse(list(pay_ids.values()))
+        pay_by_id = {pay.id: pay for pay in payments}
+        return {move_id: pay_by_id[pay_id] for move_id, pay_id in pay_ids.items()}
+
     def _payment_from_move(self, move):
         if not move:
             return self.env['account.payment']
-        pay = self.env['account.payment'].sudo().search([('move_id', '=', move.id)], limit=1)
+        pay = self._payments_by_move(move).get(move.id, self.env['account.payment'])
         _logger.debug("[WIZ] _payment_from_move: move_id=%s -> payment_id=%s", move.id if move else None, pay and pay.id)
         return pay
 
-    def _map_st_line_to_row(self, st_line, rb_map):
+    def _map_st_line_to_row(self, st_line, rb_map, pay_map=None):
         move = st_line.move_id
-        pay = self._payment_from_move(move)
+        if pay_map is None:
+            pay = self._payment_from_move(move)
+        else:
+            pay = pay_map.get(move.id, self.env['account.payment'])
 
         amt = st_line.amount or 0.0
         debe = amt if amt > 0 else 0.0
@@ -187,14 +218,14 @@ class PentaBankReconReportWizard(models.TransientModel):
             _logger.info("[WIZ] No hay líneas de extracto para el rango dado.")
             return []
         rb_map = self._compute_running_balances(st_lines)
-        rows = [self._map_st_line_to_row(l, rb_map) for l in st_lines]
+        pay_map = self._payments_by_move(st_lines.move_id)
+        rows = [self._map_st_line_to_row(l, rb_map, pay_map) for l in st_lines]
         _logger.info("[WIZ] Sección 1 (extracto): filas=%s", len(rows))
         return rows
 
     # --------------------------- SECCIÓN 2: PENDIENTES ---------------------------
     def _pending_section_rows(self, direction):
         self.ensure_one()
-        AML = self.env['account.move.line'].sudo()
         Pay = self.env['account.payment'].sudo()
         journal = self.journal_id
         company = self.company_id
@@ -209,41 +240,66 @@ class PentaBankReconReportWizard(models.TransientModel):
         rows = []
 
         if account_ids:
-            # 2) Dominio calcado del reporte (ver handler del Bank Reconciliation)
-            dom = [
-                ('company_id', '=', company.id),
-                ('journal_id', '=', journal.id),
-                ('account_id', 'in', account_ids),   # <- aquí el cambio
-                ('parent_state', '=', 'posted'),
-                ('display_type', '=', False),
-                ('statement_line_id', '=', False),
-                ('reconciled', '=', False),
-                ('date', '<=', self.date_to),
-            ]
-            ml = AML.search(dom, order='date asc, id asc')
-            _logger.info("[SEC2] ML outstanding encontrados: %s", len(ml))
-
-            # 3) Partir por IN/OUT según balance (idéntico al reporte)
-            if direction == 'in':
-                ml = ml.filtered(lambda l: l.balance > 0)
-            else:
-                ml = ml.filtered(lambda l: l.balance < 0)
-
-            _logger.info("[SEC2] ML dir=%s: %s", direction, len(ml))
-
-            # 4) Agrupar por move y construir filas
-            by_move = {}
-            for l in ml:
-                by_move.setdefault(l.move_id, []).append(l)
-
-            for move, lines in by_move.items():
-                pay = Pay.search([('move_id', '=', move.id)], limit=1)
+            # 2) Filtro calcado del reporte (ver handler del Bank Reconciliation),
+            # 3) partido por IN/OUT según balance de cada línea (idéntico al reporte) y
+            # 4) agrupado por asiento junto con su pago
+            self.env.flush_all()
+            self.env.cr.execute("""
+                WITH pending AS (
+                    SELECT aml.move_id,
+                           SUM(aml.balance) AS balance,
+                           (ARRAY_AGG(aml.name ORDER BY aml.date, aml.id))[1] AS first_line_name,
+                           MIN(aml.date) AS first_date,
+                           MIN(aml.id) AS first_id
+                      FROM account_move_line aml
+                     WHERE aml.company_id = %(company_id)s
+                       AND aml.journal_id = %(journal_id)s
+                       AND aml.account_id = ANY(%(account_ids)s)
+                       AND aml.parent_state = 'posted'
+                       AND aml.display_type IS NULL
+                       AND aml.statement_line_id IS NULL
+                       AND NOT COALESCE(aml.reconciled, FALSE)
+                       AND aml.date <= %(date_to)s
+                       AND CASE WHEN %(direction)s = 'in' THEN aml.balance > 0 ELSE aml.balance < 0 END
+                  GROUP BY aml.move_id
+                )
+                SELECT pending.move_id,
+                       pending.balance,
+                       pending.first_line_name,
+                       pay.id AS payment_id
+                  FROM pending
+             LEFT JOIN LATERAL (
+                       SELECT id
+                         FROM account_payment
+                        WHERE move_id = pending.move_id
+                     ORDER BY id
+                        LIMIT 1
+                   ) pay ON TRUE
+              ORDER BY pending.first_date, pending.first_id
+            """, {
+                'company_id': company.id,
+                'journal_id': journal.id,
+                'account_ids': account_ids,
+                'date_to': self.date_to,
+                'direction': direction,
+            })
+            pending = self.env.cr.dictfetchall()
+            _logger.info("[SEC2] Asientos pendientes dir=%s: %s", direction, len(pending))
+
+            moves = self.env['account.move'].sudo().browse([p['move_id'] for p in pending])
+            payments = Pay.browse([p['payment_id'] for p in pending if p['payment_id']])
+            move_by_id = {move.id: move for move in moves}
+            pay_by_id = {pay.id: pay for pay in payments}
+
+            for values in pending:
+                move = move_by_id[values['move_id']]
+                pay = pay_by_id.get(values['payment_id'], Pay)
                 metodo = (pay.payment_method_line_id.name if pay.payment_method_line_id else 'Método')
                 numero = pay.name or move.name or ''
                 ref_cont = move.ref or move.name or ''
                 memo = pay.payment_reference or getattr(pay, 'communication', False) or ref_cont or ''
 
-                balance_sum = sum(x.balance for x in lines)
+                balance_sum = values['balance'] or 0.0
                 debe = balance_sum if balance_sum > 0 else 0.0
                 haber = -balance_sum if balance_sum < 0 else 0.0
 
@@ -257,7 +313,7 @@ class PentaBankReconReportWizard(models.TransientModel):
                     'haber': round(haber, 2),
                     'saldo': 0.0,
                     'estado': 'Pendiente',
-                    'memo': memo or (lines[0].name or ''),
+                    'memo': memo or (values['first_line_name'] or ''),
                 })
 
         # 5) fallback a account.payment
@@ -431,9 +487,10 @@ class PentaBankReconReportWizard(models.TransientModel):
             row += 1
         return row + 1
 
+    @profiled_report
     def action_export_xlsx(self):
         """
-        Genera el XLSX en memoria y lo descarga como adjunto.
+        Genera el XLSX en un archivo temporal y lo descarga como adjunto.
         Usa exactamente los mismos datos que el PDF (get_report_values()).
         """
         self.ensure_one()
@@ -451,8 +508,13 @@ class PentaBankReconReportWizard(models.TransientModel):
 
         _logger.info("[WIZ][XLSX] tamaños -> rows=%s, pagos=%s, cobros=%s", len(rows), len(pagos), len(cobros))
 
-        output = io.BytesIO()
-        wb = xlsxwriter.Workbook(output, {"in_memory": True})
+        with self._report_tmp_path() as path:
+            attachment = self._xls_write_report(path, header, rows, pagos, cobros, section2, summary)
+        _logger.info("[WIZ][XLSX] Adj creado id=%s tamaño=%s bytes", attachment.id, attachment.file_size)
+        return {"type": "ir.actions.act_url", "url": f"/web/content/{attachment.id}?download=1", "target": "self"}
+
+    def _xls_write_report(self, path, header, rows, pagos, cobros, section2, summary):
+        wb = self._report_new_workbook(path)
 
         # formatos
         fmt_title = wb.add_format({"bold": True, "font_size": 14})
@@ -531,17 +593,6 @@ class PentaBankReconReportWizard(models.TransientModel):
         ws.write_number(row, 1, float(summary.get("saldo_banco_final", 0.0)), fmt_bold_num); row += 1
 
         wb.close()
-        data = output.getvalue()
-        output.close()
 
         fname = "reporte_conciliacion_bancaria_%s_%s.xlsx" % (self.date_from, self.date_to)
-        attachment = self.env["ir.attachment"].create({
-            "name": fname,
-            "type": "binary",
-            "mimetype": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            "datas": base64.b64encode(data),
-            "res_model": self._name,
-            "res_id": self.id,
-        })
-        _logger.info("[WIZ][XLSX] Adj creado id=%s tamaño=%s bytes", attachment.id, len(data))
-        return {"type": "ir.actions.act_url", "url": f"/web/content/{attachment.id}?download=1", "target": "self"}
+        return self._report_attach_file(path, fname)
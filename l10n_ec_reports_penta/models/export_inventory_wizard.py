@@ -29,11 +29,31 @@ class ExportInventoryMonthWizard(models.TransientModel):
         [(str(y), str(y)) for y in range(2022, fields.Date.today().year + 1)],
         string="Año", required=True
     )
+    export_type = fields.Selection([
+        ('in_date', 'Ingresos del mes'),
+        ('month_end', 'Existencias al cierre del mes'),
+    ], string="Exportar", default='in_date', required=True)
+    refreshed_at = fields.Datetime(
+        string="Inventario actualizado al",
+        default=lambda self: self.env['stock.quant.aggregated']._get_refreshed_at(),
+        readonly=True,
+    )
 
     def export_xlsx(self):
-        print('Exportando inventario para el mes:', self.month, 'año:', self.year)
         return {
             'type': 'ir.actions.act_url',
-            'url': f'/inventory_export_xlsx?month={self.month}&year={self.year}',
+            'url': f'/inventory_export_xlsx?month={self.month}&year={self.year}&export_type={self.export_type}',
             'target': 'self',
         }
+
+    def action_refresh_inventory(self):
+        """Actualiza el stock agrupado antes de exportar y reabre el wizard."""
+        self.env['stock.quant.aggregated'].action_refresh()
+        self.refreshed_at = self.env['stock.quant.aggregated']._get_refreshed_at()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
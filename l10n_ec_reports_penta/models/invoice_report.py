@@ -1,7 +1,36 @@
 # -*- coding: utf-8 -*-
-from odoo import fields, models, tools
+import logging
+
+from odoo import api, fields, models, tools
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+REFRESH_MOVES_KEY = 'pentalab.invoice.report.line.move_ids'
+
+# Facturas que el cron recalcula por transacción
+REFRESH_BATCH_SIZE = 500
+
+# Campos de account.move (y sus líneas) que lee ``_source_query``: solo las
+# escrituras que los tocan refrescan la factura
+SOURCE_MOVE_FIELDS = frozenset({
+    'state', 'name', 'date', 'invoice_date', 'ref', 'invoice_origin',
+    'company_id', 'journal_id', 'partner_id', 'currency_id',
+    'l10n_latam_document_type_id', 'l10n_ec_authorization_number',
+    'invoice_payment_term_id', 'preferred_payment_method_line_id',
+    'line_ids', 'invoice_line_ids',
+})
+
 
 class PentalabInvoiceReportLine(models.Model):
+    """
+    Detalle de compras materializado en una tabla.
+
+    La tabla se reconstruye completa al actualizar el módulo. Las facturas
+    creadas, modificadas o eliminadas se refrescan al final de la transacción
+    (ver ``_schedule_refresh``) y el cron nocturno vuelve a refrescarlas todas
+    por lotes, sin bloquear la tabla.
+    """
     _name = "pentalab.invoice.report.line"
     _description = "Anexo de Compras (Facturas publicadas de diarios de Compras)"
     _auto = False
@@ -44,10 +73,13 @@ class PentalabInvoiceReportLine(models.Model):
     price_total = fields.Monetary("Total", currency_field="currency_id", readonly=True)
     currency_id = fields.Many2one("res.currency", string="Moneda", readonly=True)
 
-    @property
-    def _table_query(self):
+    def _source_query(self, move_filter=False):
+        """
+        Consulta que alimenta la tabla. Con ``move_filter`` se limita a las
+        facturas pasadas como parámetro ``%(move_ids)s``.
+        """
         # SOLO asientos publicados y SOLO diarios de tipo 'purchase'
-        return """
+        query = """
             SELECT
                 aml.id AS id,
 
@@ -216,7 +248,72 @@ class PentalabInvoiceReportLine(models.Model):
                 AND am.state = 'posted'
                 AND j.type = 'purchase'
         """
+        if move_filter:
+            query += "\n                AND am.id = ANY(%(move_ids)s)"
+        return query
 
     def init(self):
-        tools.drop_view_if_exists(self.env.cr, self._table)
-        self.env.cr.execute(f"CREATE OR REPLACE VIEW {self._table} AS ({self._table_query})")
\ No newline at end of file
+        self._rebuild_table()
+
+    def _rebuild_table(self):
+        cr = self.env.cr
+        # Versiones anteriores lo creaban como vista
+        tools.drop_view_if_exists(cr, self._table)
+        cr.execute(f"DROP TABLE IF EXISTS {self._table}")
+        cr.execute(f"CREATE TABLE {self._table} AS ({self._source_query()})")
+        cr.execute(f"ALTER TABLE {self._table} ADD PRIMARY KEY (id)")
+        for column in ('date', 'invoice_date', 'partner_id', 'journal_id', 'company_id', 'invoice_id'):
+            tools.create_index(cr, f'{self._table}_{column}_index', self._table, [column])
+
+    @api.model
+    def _cron_rebuild_table(self):
+        """
+        Recalcula todas las facturas (nombres de contactos, productos, etc.
+        que no pasan por una factura) con el mismo DELETE/INSERT por factura
+        del refresco incremental, con un commit por lote: solo se bloquean
+        las filas del lote y las lecturas siguen viendo la tabla completa.
+        """
+        self.env.flush_all()
+        cr = self.env.cr
+        cr.execute(f"""
+            SELECT am.id
+              FROM account_move am
+              JOIN account_journal j ON j.id = am.journal_id
+             WHERE am.state = 'posted'
+               AND j.type = 'purchase'
+             UNION
+            SELECT invoice_id
+              FROM {self._table}
+             ORDER BY 1
+        """)
+        move_ids = [row[0] for row in cr.fetchall()]
+        for batch in split_every(REFRESH_BATCH_SIZE, move_ids, list):
+            self._refresh_moves(batch)
+            cr.commit()
+        _logger.info("Tabla %s recalculada (%s facturas)", self._table, len(move_ids))
+
+    @api.model
+    def _schedule_refresh(self, move_ids):
+        """Marca facturas para refrescar sus filas al final de la transacción."""
+        if not move_ids:
+            return
+        precommit = self.env.cr.precommit
+        pending = precommit.data.get(REFRESH_MOVES_KEY)
+        if pending is None:
+            pending = precommit.data[REFRESH_MOVES_KEY] = set()
+            precommit.add(self._refresh_scheduled_moves)
+        pending.update(move_ids)
+
+    def _refresh_scheduled_moves(self):
+        move_ids = self.env.cr.precommit.data.pop(REFRESH_MOVES_KEY, set())
+        if move_ids:
+            self._refresh_moves(list(move_ids))
+
+    @api.model
+    def _refresh_moves(self, move_ids):
+        """Reemplaza las filas de las facturas ``move_ids`` por su estado actual."""
+        self.env.flush_all()
+        cr = self.env.cr
+        cr.execute(f"DELETE FROM {self._table} WHERE invoice_id = ANY(%(move_ids)s)", {'move_ids': move_ids})
+        cr.execute(f"INSERT INTO {self._table} {self._source_query(move_filter=True)}", {'move_ids': move_ids})
+        self.invalidate_model()
\ No newline at end of file
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+REFRESH_PARTNERS_KEY = 'pentalab.partner.aging.partner_ids'
+
+AGING_ACCOUNT_TYPES = ('asset_receivable', 'liability_payable')
+
+# Columnas numéricas que se suman al leer el snapshot
+AGING_AMOUNT_FIELDS = (
+    'amount_residual', 'amount_issued', 'amount_not_due',
+    'amount_1_30', 'amount_31_60', 'amount_61_90', 'amount_91_120', 'amount_older',
+)
+
+
+class PentalabPartnerAging(models.Model):
+    """
+    Antigüedad de saldos por contacto, compañía y tipo de cuenta.
+
+    Guarda la misma cartera que calcula ``res.partner._get_followup_totals``
+    (residuales con signo de líneas publicadas y no conciliadas) ya agrupada,
+    con los tramos de vencimiento a la fecha ``snapshot_date``.
+
+    Los contactos afectados por publicaciones, cancelaciones y conciliaciones
+    se refrescan al final de la transacción (ver ``_schedule_refresh``) con
+    un upsert; el cron nocturno rehace la tabla completa para mover los
+    tramos de fecha.
+    """
+    _name = 'pentalab.partner.aging'
+    _description = 'Antigüedad de saldos por contacto'
+    _log_access = False
+    _rec_name = 'partner_id'
+
+    partner_id = fields.Many2one('res.partner', string='Contacto', readonly=True, index=True, ondelete='cascade')
+    company_id = fields.Many2one('res.company', string='Compañía', readonly=True, index=True, ondelete='cascade')
+    account_type = fields.Selection([
+        ('asset_receivable', 'Por cobrar'),
+        ('liability_payable', 'Por pagar'),
+    ], string='Tipo de cuenta', readonly=True)
+    snapshot_date = fields.Date('Fecha de cálculo', readonly=True, index=True)
+    amount_residual = fields.Float('Cartera', readonly=True)
+    # Líneas vencidas o pagos (antes de aplicar max(.., 0))
+    amount_issued = fields.Float('Vencido bruto', readonly=True)
+    amount_not_due = fields.Float('En fecha', readonly=True)
+    amount_1_30 = fields.Float('1-30', readonly=True)
+    amount_31_60 = fields.Float('31-60', readonly=True)
+    amount_61_90 = fields.Float('61-90', readonly=True)
+    amount_91_120 = fields.Float('91-120', readonly=True)
+    amount_older = fields.Float('Más de 120', readonly=True)
+
+    _sql_constraints = [
+        ('partner_company_type_uniq', 'unique(partner_id, company_id, account_type)',
+         'Solo puede existir una fila de antigüedad por contacto, compañía y tipo de cuenta.'),
+    ]
+
+    def _source_query(self, partner_filter=False):
+        """
+        Consulta que alimenta la tabla a la fecha ``%(today)s``. Con
+        ``partner_filter`` se limita a los contactos ``%(partner_ids)s``.
+        """
+        partner_condition = "AND aml.partner_id = ANY(%(partner_ids)s)" if partner_filter else ""
+        return f"""
+            SELECT partner_id, company_id, account_type, %(today)s AS snapshot_date,
+                   SUM(amt) AS amount_residual,
+                   SUM(amt) FILTER (WHERE days > 0 OR is_payment) AS amount_issued,
+                   SUM(amt) FILTER (WHERE days IS NULL OR days <= 0) AS amount_not_due,
+                   SUM(amt) FILTER (WHERE days BETWEEN 1 AND 30) AS amount_1_30,
+                   SUM(amt) FILTER (WHERE days BETWEEN 31 AND 60) AS amount_31_60,
+                   SUM(amt) FILTER (WHERE days BETWEEN 61 AND 90) AS amount_61_90,
+                   SUM(amt) FILTER (WHERE days BETWEEN 91 AND 120) AS amount_91_120,
+                   SUM(amt) FILTER (WHERE days > 120) AS amount_older
+              FROM (
+                    SELECT aml.partner_id,
+                           aml.company_id,
+                           account.account_type,
+                           CASE WHEN aml.currency_id IS NOT NULL
+                                THEN aml.amount_residual_currency
+                                ELSE aml.amount_residual END AS amt,
+                           %(today)s::date - COALESCE(aml.date_maturity, aml.date) AS days,
+                           aml.payment_id IS NOT NULL AS is_payment
+                      FROM account_move_line aml
+                      JOIN account_account account ON account.id = aml.account_id
+                     WHERE aml.parent_state = 'posted'
+                       AND aml.reconciled IS NOT TRUE
+                       AND aml.partner_id IS NOT NULL
+                       AND account.account_type IN %(account_types)s
+                       {partner_condition}
+                   ) lines
+             GROUP BY partner_id, company_id, account_type
+        """
+
+    def _insert_rows(self, partner_ids=None):
+        columns = ('partner_id', 'company_id', 'account_type', 'snapshot_date') + AGING_AMOUNT_FIELDS
+        params = {
+            'today': fields.Date.context_today(self),
+            'account_types': AGING_ACCOUNT_TYPES,
+            'partner_ids': partner_ids,
+        }
+        self.env.cr.execute(f"""
+            INSERT INTO {self._table} ({', '.join(columns)})
+            {self._source_query(partner_filter=partner_ids is not None)}
+        """, params)
+
+    def init(self):
+        self.env.cr.execute(f"DELETE FROM {self._table}")
+        self._insert_rows()
+
+    @api.model
+    def _cron_refresh_all(self):
+        """Recalcula todos los contactos a la fecha de hoy."""
+        self.env.flush_all()
+        self.init()
+        self.invalidate_model()
+        _logger.info("Tabla %s recalculada", self._table)
+
+    @api.model
+    def _schedule_refresh(self, partner_ids):
+        """Marca contactos para recalcular su antigüedad al final de la transacción."""
+        if not partner_ids:
+            return
+        precommit = self.env.cr.precommit
+        pending = precommit.data.get(REFRESH_PARTNERS_KEY)
+        if pending is None:
+            pending = precommit.data[REFRESH_PARTNERS_KEY] = set()
+            precommit.add(self._refresh_scheduled_partners)
+        pending.update(partner_ids)
+
+    def _refresh_scheduled_partners(self):
+        partner_ids = self.env.cr.precommit.data.pop(REFRESH_PARTNERS_KEY, set())
+        if partner_ids:
+            self._refresh_partners(list(partner_ids))
+
+    @api.model
+    def _refresh_partners(self, partner_ids):
+        """
+        Actualiza las filas de ``partner_ids`` a su estado actual: inserta o
+        actualiza (``partner_company_type_uniq``) las que tienen saldo y borra
+        las que ya no lo tienen. Con el upsert, dos transacciones que publican
+        para el mismo contacto no chocan con la restricción única.
+        """
+        self.env.flush_all()
+        columns = ('partner_id', 'company_id', 'account_type', 'snapshot_date') + AGING_AMOUNT_FIELDS
+        updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in columns[3:])
+        self.env.cr.execute(f"""
+            WITH upserted AS (
+                INSERT INTO {self._table} ({', '.join(columns)})
+                {self._source_query(partner_filter=True)}
+                ON CONFLICT (partner_id, company_id, account_type) DO UPDATE SET {updates}
+                RETURNING id
+            )
+            DELETE FROM {self._table}
+             WHERE partner_id = ANY(%(partner_ids)s)
+               AND id NOT IN (SELECT id FROM upserted)
+        """, {
+            'today': fields.Date.context_today(self),
+            'account_types': AGING_ACCOUNT_TYPES,
+            'partner_ids': sorted(partner_ids),
+        })
+        self.invalidate_model()
+
+    @api.model
+    def _get_totals(self, partner_ids, company_ids, account_types=AGING_ACCOUNT_TYPES):
+        """
+        Suma las filas del snapshot por contacto.
+
+        :return: ``{partner_id: {campo: monto}}`` con los campos de
+            ``AGING_AMOUNT_FIELDS``; los contactos sin saldo no aparecen.
+        """
+        groups = self._read_group(
+            [
+                ('partner_id', 'in', list(partner_ids)),
+                ('company_id', 'in', list(company_ids)),
+                ('account_type', 'in', list(account_types)),
+            ],
+            ['partner_id'],
+            [f'{name}:sum' for name in AGING_AMOUNT_FIELDS],
+        )
+        return {
+            partner.id: dict(zip(AGING_AMOUNT_FIELDS, (amount or 0.0 for amount in amounts)))
+            for partner, *amounts in groups
+        }
+
+    @api.model
+    def _is_current(self):
+        """True si el snapshot fue calculado hoy (o la tabla está vacía)."""
+        self.env.cr.execute(f"SELECT MIN(snapshot_date) FROM {self._table}")
+        snapshot_date = self.env.cr.fetchone()[0]
+        return not snapshot_date or snapshot_date >= fields.Date.context_today(self)
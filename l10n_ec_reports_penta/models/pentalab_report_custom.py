@@ -1,196 +1,290 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
 import io
-import openpyxl
+from types import SimpleNamespace
 from odoo import models, fields, api
 import re
 import logging
 import json
-from openpyxl.styles import Alignment
-from openpyxl.styles import Font
+from odoo.tools.misc import xlsxwriter
+
+# Filas de encabezado que deja account.report al exportar a XLSX
+REPORT_HEADER_ROWS = 3
+NUMERIC_FIGURE_TYPES = ('monetary', 'float', 'integer', 'percentage')
+
+
+class ReportLinesSheet:
+    """
+    Hoja de solo lectura sobre las filas de ``_get_report_rows`` con la misma
+    interfaz que se usaba de openpyxl: ``cell(row=, column=).value`` (índices
+    desde 1) y ``max_row``.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    @property
+    def max_row(self):
+        return len(self._rows)
+
+    def cell(self, row, column):
+        values = self._rows[row - 1]['values'] if 0 < row <= len(self._rows) else []
+        return SimpleNamespace(value=values[column - 1] if 0 < column <= len(values) else None)
+
 
 class PentalabReportCustom(models.Model):
     _name = 'pentalab.report.custom'
     _description = 'Reportes modificados Pentalab'
 
-    def generar_reporte_modificado(self, company_id, report_id, options):
+    # -----------------------------------------------
+    # FILAS DEL REPORTE (sin pasar por export_to_xlsx)
+    # -----------------------------------------------
+
+    def _get_report_rows(self, report, options):
+        """
+        Filas del reporte con la misma distribución que ``export_to_xlsx``:
+        3 filas de encabezado, una fila en blanco antes de cada línea de nivel 0
+        y, si hay líneas de cuentas, el código en la columna A y el nombre en la B.
+
+        Cada fila es un diccionario con ``values`` (valores de las celdas) y
+        ``styles`` (clave de estilo por celda, ver ``_get_row_formats``).
+        """
+        options = report.get_options(previous_options={**options, 'export_mode': 'print'})
+        lines = report._filter_out_folded_children(
+            self.env['pentalab.report.lines.service']._get_lines(report, options)
+        )
+
+        Account = self.env['account.account']
+        split_names = {}
+        for line in lines:
+            model, dummy = report._get_model_info_from_id(line['id'])
+            if model == 'account.account':
+                split_names[line['id']] = Account._split_code_name(line['name'])
+        x_offset = 1 if split_names else 0
+
+        columns = options.get('columns', [])
+        rows = [
+            {'values': [report.name], 'styles': ['title']},
+            {'values': [''] * (1 + x_offset) + [options.get('date', {}).get('string', '')], 'styles': ['title'] * (2 + x_offset)},
+            {
+                'values': [''] * (1 + x_offset) + [column.get('name', '') for column in columns],
+                'styles': ['title'] * (1 + x_offset + len(columns)),
+            },
+        ]
+        for line in lines:
+            level = line.get('level') or 0
+            if line.get('caret_options'):
+                style = 'line'
+            elif level == 0:
+                rows.append({'values': [], 'styles': []})
+                style = 'level_0'
+            elif level in (1, 2):
+                style = 'level_%s' % level
+            else:
+                style = 'line'
+
+            if line['id'] in split_names:
+                code, name = split_names[line['id']]
+                values = [code, name]
+            else:
+                values = [''] * x_offset + [line.get('name', '')]
+            for column in line.get('columns', []):
+                if column.get('figure_type') in NUMERIC_FIGURE_TYPES and column.get('no_format') is not None:
+                    values.append(column['no_format'])
+                else:
+                    values.append(column.get('name', ''))
+            rows.append({'values': values, 'styles': [style] * len(values)})
+        return rows
+
+    def _get_row_formats(self, workbook):
+        """Formatos xlsxwriter por clave de estilo: (texto, número)."""
+        def _pair(**props):
+            return (
+                workbook.add_format(dict(props, font_name='Arial')),
+                workbook.add_format(dict(props, font_name='Arial', num_format='#,##0.00')),
+            )
+        return {
+            'title': _pair(bold=True, bottom=2, font_size=12),
+            'level_0': _pair(bold=True, bottom=6, font_size=13, font_color='#666666'),
+            'level_1': _pair(bold=True, bottom=1, font_size=13, font_color='#666666'),
+            'level_2': _pair(bold=True, font_size=12, font_color='#666666'),
+            'line': _pair(font_size=12, font_color='#666666'),
+            'company': _pair(bold=True, font_size=14, align='center'),
+            'report_name': _pair(bold=True, font_size=12, align='center'),
+            'report_date': _pair(font_size=10),
+        }
+
+    def _write_rows(self, rows, sheet_name='Reporte'):
+        """Escribe las filas en un libro en memoria y retorna su contenido."""
+        output = io.BytesIO()
+        workbook = xlsxwriter.Workbook(output, {'in_memory': True, 'strings_to_formulas': False})
+        sheet = workbook.add_worksheet(sheet_name[:31])
+        formats = self._get_row_formats(workbook)
+        sheet.set_column(0, 0, 15)
+        sheet.set_column(1, 1, 50)
+        sheet.set_column(2, 20, 18)
+        for row_idx, row in enumerate(rows):
+            for col_idx, value in enumerate(row['values']):
+                style = row['styles'][col_idx] if col_idx < len(row['styles']) else None
+                text_format, number_format = formats.get(style, (None, None))
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    sheet.write_number(row_idx, col_idx, value, number_format)
+                elif value is None or value == '':
+                    if text_format:
+                        sheet.write_blank(row_idx, col_idx, None, text_format)
+                else:
+                    sheet.write(row_idx, col_idx, value, text_format)
+        workbook.close()
+        return output.getvalue()
+
+    @staticmethod
+    def _get_cell(row, col):
+        return row['values'][col] if col < len(row['values']) else None
+
+    @staticmethod
+    def _set_cell(row, col, value, style=None):
+        values, styles = row['values'], row['styles']
+        while len(values) <= col:
+            values.append(None)
+        while len(styles) <= col:
+            styles.append(None)
+        values[col] = value
+        if style is not None:
+            styles[col] = style
+
+    # -----------------------------------------------
+    # BALANCE GENERAL / ESTADO DE RESULTADOS
+    # -----------------------------------------------
 
+    def generar_reporte_modificado(self, company_id, report_id, options):
+        """
+        Genera el balance o estado de resultados modificado directamente desde
+        las líneas del reporte y retorna el contenido del XLSX.
+        """
         company = self.env['res.company'].browse(company_id)
         report = self.env['account.report'].with_company(company).with_context(lang='es_EC').browse(report_id)
 
-        # 1) Exportamos y guardamos el archivo original
-        xlsx_data_mensual = report.export_to_xlsx(options)
-        workbook_mensual = openpyxl.load_workbook(io.BytesIO(xlsx_data_mensual['file_content']))
-        file = 'reporte_modificado.xlsx'
-        workbook_mensual.save(file)
-
-        # 2) Reabrimos el archivo para modificarlo
-        wb = openpyxl.load_workbook(file)
-        ws = wb.active  # Usamos la primera hoja
+        rows = self._get_report_rows(report, options)
+        header, body = rows[:REPORT_HEADER_ROWS], rows[REPORT_HEADER_ROWS:]
+        get_cell, set_cell = self._get_cell, self._set_cell
 
         # -----------------------------------------------
-        # Buscar estilo base de la primera celda no vacía en la col. A (fila >= 4)
+        # Estilo base de la primera celda no vacía en la col. A
         # -----------------------------------------------
 
-        estilo_base = None
-        for row in range(4, ws.max_row + 1):
-            cell_a = ws.cell(row=row, column=1)
-            if cell_a.value:
-                estilo_base = cell_a._style
-                break  # Salimos al primer match
+        estilo_base = next((row['styles'][0] for row in body if get_cell(row, 0)), None)
 
         # -----------------------------------------------
-        # PRIMER FOR:
+        # PRIMER FILTRO:
         # - Eliminar fila si B empieza con "total" (lstrip, lower)
         # - Eliminar fila si C es 0 o '0.00'
-        # - Si A está vacía y B y C tienen valor, eliminar la fila si la fila siguiente tiene el mismo valor en C
         # - Separar texto B -> A si A está vacío y B empieza con número
         # -----------------------------------------------
 
-        for row in range(ws.max_row, 3, -1):  # desde abajo hacia la fila 4
-            cell_b = ws.cell(row=row, column=2)
-            cell_a = ws.cell(row=row, column=1)
-            cell_c = ws.cell(row=row, column=3)
-            if cell_b.value and isinstance(cell_b.value, str):
-                texto_b = cell_b.value.strip().lower()
+        filtered = []
+        for row in body:
+            value_b = get_cell(row, 1)
+            if value_b and isinstance(value_b, str):
+                texto_b = value_b.strip().lower()
                 if "beneficio" in texto_b and "total" in texto_b:
-                    cell_b.value = "Resultado del ejercicio"
+                    value_b = "Resultado del ejercicio"
+                    set_cell(row, 1, value_b)
             # -- 1) Eliminar fila si B comienza con "total"
-            if cell_b.value and isinstance(cell_b.value, str) and cell_b.value.lstrip().lower().startswith("total"):
-                ws.delete_rows(row, 1)
+            if value_b and isinstance(value_b, str) and value_b.lstrip().lower().startswith("total"):
                 continue
-
             # -- 2) Eliminar fila si C == 0 (numérico o string "0", "0.00", etc.)
-            c_value = cell_c.value
-            if self._is_zero_value(c_value):
-                ws.delete_rows(row, 1)
+            if self._is_zero_value(get_cell(row, 2)):
                 continue
-
-            # -- 4) Si A está vacía, y B contiene un número al inicio, pasar esa parte a A
-            if not cell_a.value and cell_b.value and isinstance(cell_b.value, str):
-                original_b = cell_b.value.lstrip()
+            # -- 3) Si A está vacía, y B contiene un número al inicio, pasar esa parte a A
+            if not get_cell(row, 0) and value_b and isinstance(value_b, str):
+                original_b = value_b.lstrip()
                 first_space_idx = original_b.find(' ')
                 if first_space_idx != -1:
                     first_part = original_b[:first_space_idx]
                     if re.match(r'^\d+', first_part):  # empieza con dígitos
-                        new_a_value = first_part
-                        new_b_value = original_b[first_space_idx:].lstrip()
-
-                        cell_a.value = new_a_value
-                        cell_b.value = new_b_value
-                        # Aplicar estilo base a la celda A
-                        if estilo_base:
-                            cell_a._style = estilo_base
-                        
+                        set_cell(row, 0, first_part, estilo_base)
+                        set_cell(row, 1, original_b[first_space_idx:].lstrip())
+            filtered.append(row)
+
         # -----------------------------------------------
-        # SEGUNDO FOR: Eliminar filas con cuentas ocultas (hide_in_report)
+        # SEGUNDO FILTRO: Eliminar filas con cuentas ocultas (hide_in_report)
         # -----------------------------------------------
 
         accounts_dict = {
             acc.code_store.strip(): acc
             for acc in self.env['account.account'].search(['|', ('code_store', '!=', False), ('code_store', '!=', '')])
         }
-        for row in range(ws.max_row, 3, -1):
-            cell_a = ws.cell(row=row, column=1)
-            if cell_a.value and isinstance(cell_a.value, str):
-                code = cell_a.value.strip()
-                account = accounts_dict.get(code)
-                if account and account.hide_in_report:
-                    ws.delete_rows(row, 1)
+        body = [
+            row for row in filtered
+            if not (
+                isinstance(get_cell(row, 0), str)
+                and accounts_dict.get(get_cell(row, 0).strip())
+                and accounts_dict[get_cell(row, 0).strip()].hide_in_report
+            )
+        ]
 
         # -----------------------------------------------
-        # TERCER FOR: Buscar "Ganancias del año actual"
-        # - Reemplazar texto en B por "Resultados del año actual"
-        # - Cambiar A por code_store de la cuenta equity_unaffected
-        # - Eliminar 2 filas arriba/abajo si A está vacía
+        # TERCER PASO: Buscar "Ganancias del año actual"
+        # - Reemplazar texto en B por "Resultado del ejercicio"
+        # - Eliminar la fila siguiente y mover la fila dos posiciones abajo
         # -----------------------------------------------
 
-        for row in range(ws.max_row, 3, -1):
-            cell_b = ws.cell(row=row, column=2)
-            if cell_b.value and isinstance(cell_b.value, str) and ("Ganancias / Pérdida del año actual" in cell_b.value or "Ganancias del año actual" in cell_b.value):
+        for idx in range(len(body) - 1, -1, -1):
+            if idx >= len(body):
+                continue
+            row = body[idx]
+            value_b = get_cell(row, 1)
+            if value_b and isinstance(value_b, str) and ("Ganancias / Pérdida del año actual" in value_b or "Ganancias del año actual" in value_b):
                 estilo_pp_b = None
-                for r in range(ws.max_row, 3, -1):
-                    bval = ws.cell(row=r, column=2).value
-                    if isinstance(bval, str):
-                        txt = bval.strip()
-                        if txt in ("Pasivo + Patrimonio", "Pasivos + Capital"):
-                            estilo_pp_b = ws.cell(row=r, column=2)._style
-                            break
-                
+                for other in reversed(body):
+                    bval = get_cell(other, 1)
+                    if isinstance(bval, str) and bval.strip() in ("Pasivo + Patrimonio", "Pasivos + Capital"):
+                        estilo_pp_b = other['styles'][1]
+                        break
+
                 # 1) Renombrar etiqueta
-                new_text = cell_b.value.replace("Ganancias / Pérdida del año actual", "Resultado del ejercicio").replace("Ganancias del año actual", "Resultado del ejercicio")
-                cell_b.value = new_text
-            
-                # 2) APLICAR estilo de PP AHORA (antes de copiar estilos de la fila)
+                set_cell(row, 1, value_b.replace("Ganancias / Pérdida del año actual", "Resultado del ejercicio").replace("Ganancias del año actual", "Resultado del ejercicio"))
+
+                # 2) Aplicar estilo de PP
                 if estilo_pp_b:
-                    ws.cell(row=row, column=2)._style = estilo_pp_b
-                    ws.cell(row=row, column=3)._style = estilo_pp_b
-                # Guardar valores de la fila antes de eliminarla
-                row_values = [ws.cell(row=row, column=col).value for col in range(1, ws.max_column + 1)]
-                row_styles = [ws.cell(row=row, column=col)._style for col in range(1, ws.max_column + 1)]
-        
-                # Eliminar las filas siguientes (row+1 y row+2)
-                ws.delete_rows(row+1, 1)
-        
-                # Eliminar la fila actual
-                ws.delete_rows(row, 1)
-        
-                # Insertar la fila guardada en la nueva posición (3 filas abajo)
-                new_row = row + 2
-                ws.insert_rows(new_row)
-        
-                for col, value in enumerate(row_values, start=1):
-                    ws.cell(row=new_row, column=col).value = value
-                    ws.cell(row=new_row, column=col)._style = row_styles[col-1]  # Aplicar el estilo original
-        # Variable para almacenar la fila donde se copiarán los valores
+                    set_cell(row, 1, get_cell(row, 1), estilo_pp_b)
+                    set_cell(row, 2, get_cell(row, 2), estilo_pp_b)
+
+                # 3) Eliminar la fila siguiente y la actual, reinsertándola dos filas abajo
+                if idx + 1 < len(body):
+                    del body[idx + 1]
+                del body[idx]
+                body.insert(idx + 2, row)
+
+        # -----------------------------------------------
+        # CUARTO PASO: "Pasivos + Capital" -> "Pasivo + Patrimonio" y copia
+        # como "PASIVO + PATRIMONIO + RESULTADO DEL EJERCICIO" 5 filas abajo
+        # -----------------------------------------------
+
         nueva_fila = None
-        # Buscar la celda en la columna B con "Pasivos + Capital"
-        for row in range(ws.max_row, 3, -1):
-            cell_b = ws.cell(row=row, column=2)
-        
-            if cell_b.value and isinstance(cell_b.value, str) and cell_b.value == "Pasivos + Capital":
-                estilo_pp_b = ws.cell(row=row, column=2)._style
-                # Guardar valores originales de A, B y C
-                valor_a = ws.cell(row=row, column=1).value
-                valor_c = ws.cell(row=row, column=3).value
-        
-                # Guardar estilos originales de A, B y C
-                estilo_a = ws.cell(row=row, column=1)._style
-                estilo_b = ws.cell(row=row, column=2)._style
-                estilo_c = ws.cell(row=row, column=3)._style
-        
-                # Modificar la celda B en la fila original
-                ws.cell(row=row, column=2).value = "Pasivo + Patrimonio"
-        
-                # Copiar los valores y estilos 5 filas más abajo
-                nueva_fila = row + 5
-                ws.cell(nueva_fila, 1).value = valor_a  # Columna A
-                ws.cell(nueva_fila, 2).value = "PASIVO + PATRIMONIO + RESULTADO DEL EJERCICIO"  # Modificar columna B
-                ws.cell(nueva_fila, 3).value = valor_c  # Columna C
-        
-                # Aplicar estilos copiados a las nuevas celdas
-                ws.cell(nueva_fila, 1)._style = estilo_a
-                ws.cell(nueva_fila, 2)._style = estilo_b
-                ws.cell(nueva_fila, 3)._style = estilo_c
-        
-        # Variables para guardar los valores de C cuando A=3 y A=2
+        for idx in range(len(body) - 1, -1, -1):
+            row = body[idx]
+            if get_cell(row, 1) == "Pasivos + Capital":
+                styles = (row['styles'] + [None] * 3)[:3]
+                set_cell(row, 1, "Pasivo + Patrimonio")
+                nueva_fila = idx + 5
+                while len(body) <= nueva_fila:
+                    body.append({'values': [], 'styles': []})
+                target = body[nueva_fila]
+                set_cell(target, 0, get_cell(row, 0), styles[0])
+                set_cell(target, 1, "PASIVO + PATRIMONIO + RESULTADO DEL EJERCICIO", styles[1])
+                set_cell(target, 2, get_cell(row, 2), styles[2])
+
+        # Sumar los valores de C cuando A=3 y A=2 en la fila "Pasivo + Patrimonio"
         valor_c_a3 = None
         valor_c_a2 = None
-        
-        # Buscar las filas donde A=3 y A=2
-        for row in range(1, ws.max_row + 1):
-            cell_a = ws.cell(row=row, column=1)
-            cell_c = ws.cell(row=row, column=3)
-            
-            if cell_a.value == "3":
-                valor_c_a3 = cell_c.value
-            elif cell_a.value == "2":
-                valor_c_a2 = cell_c.value
-        
-        # Si encontramos ambas celdas, sumamos sus valores
+        for row in body:
+            if get_cell(row, 0) == "3":
+                valor_c_a3 = get_cell(row, 2)
+            elif get_cell(row, 0) == "2":
+                valor_c_a2 = get_cell(row, 2)
         if valor_c_a3 is not None and valor_c_a2 is not None and nueva_fila:
-            suma_c = float(valor_c_a3) + float(valor_c_a2)
-            ws.cell(nueva_fila-5, 3, suma_c)  # Guardamos la suma en la celda C de la fila copiada
+            set_cell(body[nueva_fila - 5], 2, float(valor_c_a3) + float(valor_c_a2))
 
         textos_a_eliminar = {
             "Ganancias sin asignar",
@@ -199,52 +293,30 @@ class PentalabReportCustom(models.Model):
             "Ganancias acumuladas",
             "Ganancias no asignados de años anteriores"
         }
-        
-        # Recorrer desde la última fila hasta la cuarta fila (para evitar encabezados)
-        for row in range(ws.max_row, 3, -1):  
-            cell_b = ws.cell(row=row, column=2)
-            
-            if cell_b.value and isinstance(cell_b.value, str) and cell_b.value.strip() in textos_a_eliminar:
-                ws.delete_rows(row, 1)  # Elimina la fila completa
-
-        # Antes de guardar el archivo, agregamos el encabezado con estilos
-        company = self.env['res.company'].browse(company_id)
-        
-        # Insertar una fila extra después de la fila 2
-        ws.insert_rows(1)
-        
-        # Estilo del encabezado
-        header_font = Font(name="Arial", size=14, bold=True)
-        
-        # Fila 1 - Nombre de la empresa
-        ws.cell(row=1, column=2).value = company.name
-        ws.cell(row=1, column=2).font = header_font  # Aplicar estilo
-        ws.cell(row=1, column=2).alignment = Alignment(horizontal="center")
-        # Fila 2 - Nombre del reporte según report_id
+        body = [
+            row for row in body
+            if not (isinstance(get_cell(row, 1), str) and get_cell(row, 1).strip() in textos_a_eliminar)
+        ]
+
+        # -----------------------------------------------
+        # Encabezado: empresa, nombre del reporte y fecha de generación,
+        # seguido de la fila de columnas del reporte
+        # -----------------------------------------------
+
         if options.get('report_id') == 23:
             report_name = "Balance General"
         elif options.get('report_id') == 24:
             report_name = "Estado de Resultados"
         else:
             report_name = "Reporte Financiero"
-        ws.cell(row=2, column=2).value = report_name
-        header_font = Font(name="Arial", size=12, bold=True)
-        
-        # Fila 3 - Fecha de generación del reporte
         fecha_generacion = datetime.today().strftime('%d-%m-%Y')
-        
-        ws.cell(row=2, column=3).font = header_font
-        
-        ws.cell(row=2, column=2).alignment = Alignment(horizontal="center")
-        
-        ws.cell(row=2, column=2).font = header_font  # Aplicar estilo
-        header_font = Font(name="Arial", size=10)
-        ws.cell(row=3, column=2).value = "Fecha de generación del reporte"
-        ws.cell(row=3, column=3).value = fecha_generacion
-        ws.cell(row=3, column=2).font = header_font   # Aplicar estilo
-        ws.cell(row=3, column=3).font = header_font
-
-        wb.save(file)
+        header = [
+            {'values': [None, company.name], 'styles': [None, 'company']},
+            {'values': [None, report_name, None], 'styles': [None, 'report_name', 'report_name']},
+            {'values': [None, "Fecha de generación del reporte", fecha_generacion], 'styles': [None, 'report_date', 'report_date']},
+            header[-1],
+        ]
+        return self._write_rows(header + body, report_name)
 
     # -----------------------------------------------
     # MÉTODOS DE APOYO
@@ -286,4 +358,4 @@ class PentalabReportCustom(models.Model):
             return abs(f1 - f2) < 1e-9  # casi iguales
         except ValueError:
             # No se pudieron convertir a float => comparar como string
-            return str(val1).strip() == str(val2).strip()
\ No newline at end of file
+            return str(val1).strip() == str(val2).strip()
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import psycopg2
+
+from odoo import _, api, fields, models
+from odoo.tools import config, format_datetime
+
+_logger = logging.getLogger(__name__)
+
+# Crons que atienden la cola; cada llamada ejecuta un solo job y vuelve a
+# disparar el cron si quedan pendientes, por lo que pueden ejecutarse tantos
+# jobs en paralelo como crons haya.
+JOB_WORKER_CRONS = (
+    'l10n_ec_reports_penta.ir_cron_pentalab_report_job_worker_1',
+    'l10n_ec_reports_penta.ir_cron_pentalab_report_job_worker_2',
+)
+
+# Un job "en proceso" sin señal de vida (``date_heartbeat``) en este tiempo
+# perdió su worker
+STALE_JOB_MINUTES = 60
+
+# Jobs pendientes que se evalúan en cada intento de tomar uno
+CLAIM_CANDIDATES = 20
+
+
+class PentalabReportJob(models.Model):
+    """
+    Reporte Pentalab generado en segundo plano.
+
+    El wizard guarda sus valores y el método a ejecutar (ver
+    ``pentalab.report.output.mixin.action_report_enqueue``); un cron lo
+    vuelve a crear con el usuario y las compañías originales en un cursor
+    propio, ejecuta el método y deja el archivo adjunto al job, avisando al
+    usuario por el chatter.
+
+    Los jobs con la misma ``lock_key`` (mismo wizard, compañías y
+    parámetros) se atienden de a uno; los demás pueden correr en paralelo.
+
+    En modo multiproceso cada job corre dentro del límite
+    ``limit_time_real_cron`` del worker de crons (por defecto el mismo
+    ``limit_time_real`` de las peticiones): hay que subirlo para los reportes
+    grandes. Un job cuyo worker murió se marca como fallido al pasar ese
+    límite o ``STALE_JOB_MINUTES`` sin avances.
+    """
+    _name = 'pentalab.report.job'
+    _inherit = ['mail.thread']
+    _description = 'Reporte Pentalab en segundo plano'
+    _order = 'id desc'
+
+    name = fields.Char('Reporte', required=True, readonly=True)
+    state = fields.Selection([
+        ('pending', 'En cola'),
+        ('running', 'En proceso'),
+        ('done', 'Terminado'),
+        ('failed', 'Error'),
+    ], string='Estado', default='pending', required=True, readonly=True, index=True, tracking=True)
+    progress = fields.Integer('Avance (%)', default=0, readonly=True)
+    user_id = fields.Many2one('res.users', string='Usuario', required=True, readonly=True,
+                              default=lambda self: self.env.user, index=True)
+    company_id = fields.Many2one('res.company', string='Compañía', required=True, readonly=True,
+                                 default=lambda self: self.env.company)
+    company_ids = fields.Many2many('res.company', string='Compañías', readonly=True,
+                                   default=lambda self: self.env.companies)
+    res_model = fields.Char('Modelo del wizard', required=True, readonly=True)
+    method = fields.Char('Método', required=True, readonly=True)
+    wizard_values = fields.Json('Valores del wizard', readonly=True)
+    lock_key = fields.Char('Clave de exclusión', readonly=True, index=True)
+    date_start = fields.Datetime('Inicio', readonly=True)
+    date_heartbeat = fields.Datetime('Última señal', readonly=True,
+                                     help="Último avance informado por el job mientras corre.")
+    date_end = fields.Datetime('Fin', readonly=True)
+    error = fields.Text('Error', readonly=True)
+    attachment_ids = fields.One2many('ir.attachment', 'res_id', string='Archivos', readonly=True,
+                                     domain=[('res_model', '=', 'pentalab.report.job')])
+
+    @api.model
+    def _enqueue(self, wizard, method):
+        """Crea el job para ``wizard.method()`` y despierta a los workers."""
+        job = self.create({
+            'name': f"{wizard._description} - {format_datetime(self.env, fields.Datetime.now())}",
+            'res_model': wizard._name,
+            'method': method,
+            'wizard_values': wizard._report_job_values(),
+            'lock_key': wizard._report_job_lock_key(),
+        })
+        self._trigger_workers()
+        return job
+
+    @api.model
+    def _trigger_workers(self):
+        for xmlid in JOB_WORKER_CRONS:
+            cron = self.env.ref(xmlid, raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
+
+    def _set_progress(self, percent):
+        """
+        Actualiza el avance en una transacción aparte para que se vea
+        mientras corre; también es la señal de vida del job (``date_heartbeat``).
+        """
+        percent = max(0, min(100, int(percent)))
+        with self.env.registry.cursor() as cr:
+            cr.execute(
+                f"""UPDATE {self._table}
+                       SET progress = %s, date_heartbeat = NOW() AT TIME ZONE 'UTC'
+                     WHERE id = ANY(%s)""",
+                [percent, self.ids],
+            )
+
+    # ---------------------------
+    # Worker
+    # ---------------------------
+    @api.model
+    def _claim_next_job(self):
+        """
+        Toma el siguiente job libre y lo marca en proceso (con commit).
+
+        Los workers se serializan por ``lock_key`` con un advisory lock de la
+        transacción, y además se bloquean todas las filas de la clave: si
+        otro worker tomó un job de la misma clave después de que empezó esta
+        transacción, PostgreSQL lo rechaza por conflicto de serialización y
+        el job queda para la siguiente vuelta.
+        """
+        cr = self.env.cr
+        cr.execute(f"""
+            SELECT job.id, job.lock_key
+              FROM {self._table} job
+             WHERE job.state = 'pending'
+               AND NOT EXISTS (
+                    SELECT 1
+                      FROM {self._table} running
+                     WHERE running.state = 'running'
+                       AND running.lock_key = job.lock_key
+               )
+             ORDER BY job.id
+             LIMIT %s
+        """, [CLAIM_CANDIDATES])
+        for job_id, lock_key in cr.fetchall():
+            if lock_key:
+                cr.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", [lock_key])
+                if not cr.fetchone()[0]:
+                    # Otro worker está tomando un job de esta clave
+                    continue
+            try:
+                with cr.savepoint(flush=False):
+                    if lock_key:
+                        cr.execute(
+                            f"SELECT id FROM {self._table} WHERE lock_key = %s ORDER BY id FOR UPDATE",
+                            [lock_key],
+                        )
+                    cr.execute(
+                        f"SELECT id FROM {self._table} WHERE id = %s AND state = 'pending' FOR UPDATE SKIP LOCKED",
+                        [job_id],
+                    )
+                    claimed = cr.fetchone()
+            except psycopg2.errors.SerializationFailure:
+                _logger.info("El job %s cambió de estado en otro worker, se omite", job_id)
+                continue
+            if not claimed:
+                continue
+            cr.execute(
+                f"""UPDATE {self._table}
+                       SET state = 'running', progress = 0,
+                           date_start = NOW() AT TIME ZONE 'UTC', date_heartbeat = NOW() AT TIME ZONE 'UTC'
+                     WHERE id = %s""",
+                [job_id],
+            )
+            cr.commit()
+            return self.browse(job_id)
+        return self.browse()
+
+    @api.model
+    def _get_max_runtime(self):
+        """Segundos que un job puede correr antes de que maten a su worker (0: sin límite)."""
+        if not config['workers']:
+            return 0
+        limit = config['limit_time_real_cron']
+        return config['limit_time_real'] if limit < 0 else limit
+
+    @api.model
+    def _fail_stale_jobs(self):
+        """Marca como fallidos los jobs en proceso cuyo worker murió."""
+        now = fields.Datetime.now()
+        silent_since = fields.Datetime.subtract(now, minutes=STALE_JOB_MINUTES)
+        domain = [
+            '|', ('date_heartbeat', '<', silent_since),
+            '&', ('date_heartbeat', '=', False), ('date_start', '<', silent_since),
+        ]
+        max_runtime = self._get_max_runtime()
+        if max_runtime:
+            domain = ['|', ('date_start', '<', fields.Datetime.subtract(now, seconds=max_runtime))] + domain
+        self.search([('state', '=', 'running')] + domain).write({
+            'state': 'failed',
+            'error': _("El proceso se interrumpió antes de terminar."),
+        })
+        self.env.cr.commit()
+
+    @api.model
+    def _cron_run_jobs(self):
+        """
+        Ejecuta un job pendiente; si quedan más, vuelve a disparar los
+        workers para que cada job tenga su propia llamada al cron (y su propio
+        límite de tiempo).
+        """
+        self._fail_stale_jobs()
+        job = self._claim_next_job()
+        if not job:
+            return
+        job._run()
+        if self.search_count([('state', '=', 'pending')], limit=1):
+            self._trigger_workers()
+            self.env.cr.commit()
+
+    def _run(self):
+        """
+        Ejecuta el job en un cursor propio, con el usuario y compañías
+        originales. El estado final se escribe después, en el cursor del
+        cron: el cursor del job no toca la fila del job, que mientras tanto
+        recibe los avances desde otras transacciones (``_set_progress``).
+        """
+        self.ensure_one()
+        self.invalidate_recordset()
+        try:
+            with self.env.registry.cursor() as cr:
+                self.with_env(self.env(cr=cr))._execute()
+        except Exception as e:
+            _logger.exception("Falló el reporte en segundo plano %s", self.id)
+            self.invalidate_recordset()
+            self.write({
+                'state': 'failed',
+                'error': str(e),
+                'date_end': fields.Datetime.now(),
+            })
+            self.message_post(
+                body=_("No se pudo generar el reporte: %s", e),
+                partner_ids=self.user_id.partner_id.ids,
+            )
+        else:
+            self._set_done()
+        self.env.cr.commit()
+
+    def _execute(self):
+        """Vuelve a crear el wizard y ejecuta el método; los archivos quedan adjuntos al job."""
+        user = self.user_id
+        env = self.env(user=user, context={
+            **self.env.context,
+            'lang': user.lang,
+            'tz': user.tz,
+            'allowed_company_ids': [self.company_id.id] + (self.company_ids - self.company_id).ids,
+            'pentalab_report_job_id': self.id,
+        })
+        wizard = env[self.res_model].create(self.wizard_values or {})
+        getattr(wizard, self.method)()
+
+    def _set_done(self):
+        self.ensure_one()
+        self.invalidate_recordset()
+        attachments = self.env['ir.attachment'].search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+        ])
+        self.write({
+            'state': 'done',
+            'progress': 100,
+            'date_end': fields.Datetime.now(),
+        })
+        self.message_post(
+            body=_("Reporte listo: %s", self.name),
+            attachment_ids=attachments.ids,
+            partner_ids=self.user_id.partner_id.ids,
+        )
+
+    # ---------------------------
+    # Acciones
+    # ---------------------------
+    def action_retry(self):
+        self.filtered(lambda job: job.state == 'failed').write({
+            'state': 'pending',
+            'progress': 0,
+            'error': False,
+        })
+        self._trigger_workers()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import copy
+import hashlib
+import json
+import logging
+
+from odoo import api, models
+from odoo.tools.lru import LRU
+
+_logger = logging.getLogger(__name__)
+
+# Líneas de account.report ya calculadas, compartidas por los workers del proceso
+_REPORT_LINES_CACHE = LRU(32)
+
+# Contador por compañía de las versiones del libro contable (ver ``_bump_ledger_version``)
+LEDGER_VERSION_TABLE = 'pentalab_ledger_version'
+LEDGER_VERSION_COMPANIES_KEY = 'pentalab.ledger.version.company_ids'
+LEDGER_VERSION_CHANGED_KEY = 'pentalab.ledger.version.changed'
+
+
+class PentalabReportLinesService(models.AbstractModel):
+    """
+    Servicio común para los wizards Pentalab que se apoyan en ``account.report``:
+    arma las opciones genéricas (diarios activos incluidos) y guarda en caché
+    las líneas calculadas por ``_get_lines``.
+
+    La clave de la caché incluye el reporte, el usuario, las compañías, el
+    rango de fechas, los diarios, el resto de opciones y la versión del libro
+    contable de esas compañías: un contador por compañía que cada transacción
+    que publica, modifica o cancela asientos publicados o concilia sube antes
+    de su commit. El contador se lee en la misma transacción (y la misma
+    instantánea) que las líneas, así que una versión siempre corresponde a
+    los datos con que se calcularon.
+    """
+    _name = 'pentalab.report.lines.service'
+    _description = 'Opciones y líneas de reportes contables Pentalab'
+
+    def init(self):
+        self.env.cr.execute("DROP SEQUENCE IF EXISTS pentalab_ledger_version_seq")
+        self.env.cr.execute(f"""
+            CREATE TABLE IF NOT EXISTS {LEDGER_VERSION_TABLE} (
+                company_id integer PRIMARY KEY REFERENCES res_company (id) ON DELETE CASCADE,
+                version bigint NOT NULL DEFAULT 0
+            )
+        """)
+
+    @api.model
+    def _get_active_journals(self, company_ids):
+        """
+        Obtiene los diarios activos para las empresas dadas.
+
+        :param company_ids: ID o lista de IDs de empresas
+        :return: Lista de diccionarios con los diarios activos
+        """
+        if isinstance(company_ids, int):
+            company_ids = [company_ids]
+        journals = self.env['account.journal'].search([('company_id', 'in', company_ids), ('active', '=', True)])
+        return [
+            {
+                'id': journal.id,
+                'model': 'account.journal',
+                'name': journal.name,
+                'selected': False,
+                'title': journal.name,
+                'type': journal.type,
+                'visible': True
+            }
+            for journal in journals
+        ]
+
+    @api.model
+    def _build_options(self, company_id, report_id, date_to, date_from=None):
+        """
+        Genera opciones dinámicas para cualquier reporte financiero en Odoo.
+
+        :param company_id: ID de la empresa
+        :param report_id: ID del reporte
+        :param date_to: Fecha de fin en formato date
+        :param date_from: Fecha de inicio en formato date (opcional)
+        :return: Diccionario con las opciones generadas
+        """
+        company = self.env['res.company'].browse(company_id)
+        date_options = {'date_to': date_to.strftime("%Y-%m-%d")}
+        if date_from:
+            date_options['date_from'] = date_from.strftime("%Y-%m-%d")
+        return {
+            'companies': [{'id': company.id, 'name': company.name, 'currency_id': company.currency_id.id}],
+            'report_id': report_id,
+            'selected_variant_id': report_id,  # Normalmente coincide con report_id
+            'sections_source_id': report_id,  # También suele coincidir
+            'sections': [],
+            'has_inactive_sections': False,
+            'has_inactive_variants': False,
+            'allow_domestic': True,
+            'fiscal_position': 'all',
+            'available_vat_fiscal_positions': [],
+            'date': date_options,
+            'comparison': {
+                'filter': 'no_comparison',
+            },
+            'export_mode': 'file',
+            'all_entries': False,
+            'journals': self._get_active_journals(company_id),  # Obtiene los diarios activos
+            'selected_journal_groups': {},
+            'name_journal_group': 'All Journals',
+            'loading_call_number': 2,
+            'multi_currency': company.currency_id.id is not None,
+            'unreconciled': False,
+            'rounding_unit': 'decimals',
+            'unfold_all': True,
+            'unfolded_lines': [],
+            'show_debug_column': True,
+            'hierarchy': True,
+            'display_hierarchy_filter': True,
+            'readonly_query': True,
+        }
+
+    @api.model
+    def _get_ledger_version(self, company_ids):
+        """Versión del libro contable de ``company_ids`` vista por esta transacción."""
+        self.env.cr.execute(f"""
+            SELECT company_id, version
+              FROM {LEDGER_VERSION_TABLE}
+             WHERE company_id = ANY(%s)
+             ORDER BY company_id
+        """, [list(company_ids)])
+        return tuple(self.env.cr.fetchall())
+
+    @api.model
+    def _bump_ledger_version(self, company_ids):
+        """
+        Sube la versión del libro contable de ``company_ids`` al final de la
+        transacción actual (precommit), en la misma transacción que los
+        cambios: quien lea la versión nueva también ve esos cambios.
+        """
+        if not company_ids:
+            return
+        cr = self.env.cr
+        # Marca que no se borra en el precommit: la caché no se usa hasta el commit
+        cr.postcommit.data[LEDGER_VERSION_CHANGED_KEY] = True
+        pending = cr.precommit.data.get(LEDGER_VERSION_COMPANIES_KEY)
+        if pending is None:
+            pending = cr.precommit.data[LEDGER_VERSION_COMPANIES_KEY] = set()
+
+            @cr.precommit.add
+            def bump():
+                company_ids = sorted(cr.precommit.data.pop(LEDGER_VERSION_COMPANIES_KEY, ()))
+                if company_ids:
+                    cr.execute(f"""
+                        INSERT INTO {LEDGER_VERSION_TABLE} (company_id, version)
+                        SELECT company_id, 1 FROM unnest(%s) AS company_id
+                        ON CONFLICT (company_id) DO UPDATE SET version = {LEDGER_VERSION_TABLE}.version + 1
+                    """, [company_ids])
+        pending.update(company_ids)
+
+    def _get_lines_cache_key(self, report, options):
+        company_ids = tuple(sorted(c['id'] for c in options.get('companies', [])))
+        date_options = options.get('date', {})
+        journal_ids = tuple(sorted(
+            j['id'] for j in options.get('journals', [])
+            if j.get('selected') and j.get('model') == 'account.journal'
+        ))
+        digest = hashlib.sha1(json.dumps(options, sort_keys=True, default=str).encode()).hexdigest()
+        return (
+            self.env.cr.dbname,
+            report.id,
+            self.env.uid,
+            company_ids,
+            date_options.get('date_from'),
+            date_options.get('date_to'),
+            journal_ids,
+            digest,
+            report.env.lang,
+            self._get_ledger_version(company_ids),
+        )
+
+    @api.model
+    def _get_lines(self, report, options):
+        """
+        ``report._get_lines(options)`` con caché. ``options`` ya debe venir de
+        ``report.get_options``. Retorna una copia para que quien la use pueda
+        modificar las líneas libremente.
+        """
+        if self.env.cr.postcommit.data.get(LEDGER_VERSION_CHANGED_KEY):
+            # La transacción tiene cambios contables sin confirmar: no se usa la caché
+            return report._get_lines(options)
+        key = self._get_lines_cache_key(report, options)
+        lines = _REPORT_LINES_CACHE.get(key)
+        if lines is None:
+            lines = report._get_lines(options)
+            _REPORT_LINES_CACHE[key] = lines
+            _logger.debug("Líneas del reporte %s calculadas (%s)", report.id, len(lines))
+        else:
+            _logger.debug("Líneas del reporte %s tomadas de la caché (%s)", report.id, len(lines))
+        return copy.deepcopy(lines)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import _, api, models
+from odoo.exceptions import UserError
+from odoo.tools import json_default
+from odoo.tools.misc import xlsxwriter
+
+_logger = logging.getLogger(__name__)
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+READ_CHUNK_SIZE = 1024 * 1024
+PARALLEL_WORKERS_PARAM = 'l10n_ec_reports_penta.report_parallel_workers'
+DEFAULT_PARALLEL_WORKERS = 4
+
+
+class PentalabReportOutputMixin(models.AbstractModel):
+    """
+    Salida común de los reportes Pentalab.
+
+    El libro se escribe en un archivo temporal (xlsxwriter en modo
+    ``constant_memory``) y el archivo terminado se copia directamente al
+    filestore como ``ir.attachment``, sin pasar por BytesIO ni base64.
+
+    En modo ``constant_memory`` xlsxwriter escribe cada fila al disco en
+    cuanto se pasa a la siguiente, por lo que las filas deben escribirse en
+    orden y no se pueden combinar celdas de varias filas. Los wizards que no
+    cumplan esa condición pueden desactivarlo con ``_report_constant_memory``.
+
+    Los métodos listados en ``_report_job_methods`` también pueden ejecutarse
+    en segundo plano (``pentalab.report.job``): el botón llama a
+    ``action_report_enqueue`` con el método en el contexto
+    (``report_job_method``) y el archivo queda adjunto al job.
+    """
+    _name = 'pentalab.report.output.mixin'
+    _description = 'Salida de reportes Pentalab en archivos temporales'
+
+    _report_constant_memory = True
+    _report_job_methods = ()
+
+    @contextlib.contextmanager
+    def _report_tmp_path(self, suffix='.xlsx'):
+        """Ruta de un archivo temporal que se elimina al salir del contexto."""
+        fd, path = tempfile.mkstemp(prefix='pentalab_report_', suffix=suffix)
+        os.close(fd)
+        try:
+            yield path
+        finally:
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+
+    def _report_new_workbook(self, path):
+        """Libro xlsxwriter escrito directamente sobre ``path``."""
+        return xlsxwriter.Workbook(path, {
+            'constant_memory': self._report_constant_memory,
+            'tmpdir': tempfile.gettempdir(),
+        })
+
+    def _report_attach_file(self, path, file_name, mimetype=XLSX_MIMETYPE):
+        """
+        Crea el adjunto del reporte a partir del archivo temporal ``path``.
+
+        Con almacenamiento en filestore el archivo se copia por bloques a su
+        ubicación definitiva y se registra en el adjunto, sin cargarlo completo
+        en memoria. Con almacenamiento en base de datos se usa ``raw``.
+        """
+        self.ensure_one()
+        Attachment = self.env['ir.attachment']
+        job_id = self.env.context.get('pentalab_report_job_id')
+        vals = {
+            'name': file_name,
+            'type': 'binary',
+            'res_model': 'pentalab.report.job' if job_id else self._name,
+            'res_id': job_id or self.id,
+            'mimetype': mimetype,
+        }
+        if Attachment._storage() != 'file':
+            with open(path, 'rb') as f:
+                vals['raw'] = f.read()
+            return Attachment.create(vals)
+
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        checksum = sha.hexdigest()
+        file_size = os.path.getsize(path)
+
+        # Misma ubicación que usa ir.attachment._file_write()
+        store_fname = checksum[:2] + '/' + checksum
+        full_path = Attachment._full_path(store_fname)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            shutil.copyfile(path, full_path)
+            # Si la transacción se revierte, el archivo queda para el GC del filestore
+            Attachment._mark_for_gc(store_fname)
+
+        attachment = Attachment.create(vals)
+        self.env.cr.execute("""
+            UPDATE ir_attachment
+               SET store_fname = %s,
+                   checksum = %s,
+                   file_size = %s,
+                   db_datas = NULL
+             WHERE id = %s
+        """, [store_fname, checksum, file_size, attachment.id])
+        attachment.invalidate_recordset(['store_fname', 'checksum', 'file_size', 'db_datas', 'raw', 'datas'])
+        _logger.info("Reporte %s adjuntado (id=%s, %s bytes)", file_name, attachment.id, file_size)
+        return attachment
+
+    def _report_download_action(self, attachment):
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'self',
+        }
+
+    # ---------------------------
+    # Cálculo por compañía
+    # ---------------------------
+    def _report_parallel_workers(self):
+        value = self.env['ir.config_parameter'].sudo().get_param(PARALLEL_WORKERS_PARAM)
+        try:
+            return max(1, int(value)) if value else min(DEFAULT_PARALLEL_WORKERS, os.cpu_count() or 1)
+        except ValueError:
+            return 1
+
+    def _report_map_companies(self, method, company_ids, *args):
+        """
+        Ejecuta ``self.env[self._name].method(company_id, *args)`` para cada
+        compañía y retorna los resultados en el orden de ``company_ids``.
+
+        Cada compañía corre en un hilo con su propio cursor (solo ve datos ya
+        confirmados). Los hilos comparten el GIL: solo conviene para métodos
+        cuyo tiempo está en la base de datos (una consulta por compañía), no
+        para armar líneas en Python. ``method`` no debe leer el wizard y debe
+        retornar datos simples (ids, textos, números), no recordsets. Con una
+        sola compañía, un solo worker o en modo test se ejecuta en serie sobre
+        el cursor actual.
+        """
+        company_ids = list(company_ids)
+        workers = min(self._report_parallel_workers(), len(company_ids))
+        registry = self.env.registry
+        if workers <= 1 or registry.in_test_mode():
+            return [
+                getattr(self.env[self._name].with_context(allowed_company_ids=[company_id]), method)(company_id, *args)
+                for company_id in company_ids
+            ]
+
+        uid = self.env.uid
+        context = dict(self.env.context)
+
+        def run(company_id):
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, {**context, 'allowed_company_ids': [company_id]})
+                return getattr(env[self._name], method)(company_id, *args)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pentalab_report') as executor:
+            results = list(executor.map(run, company_ids))
+        _logger.info("%s: %s compañías calculadas con %s hilos", self._name, len(company_ids), workers)
+        return results
+
+    def _report_partner_ranks(self, partner_ids):
+        """
+        Posición de cada contacto ordenado por nombre en SQL (``ORDER BY
+        name, id``), para unir los resultados por compañía con la misma
+        intercalación que la consulta conjunta. Los contactos que no están
+        en el resultado (p. ej. ``None``) quedan al final.
+        """
+        partner_ids = list({partner_id for partner_id in partner_ids if partner_id})
+        if not partner_ids:
+            return {}
+        self.env['res.partner'].flush_model(['name'])
+        self.env.cr.execute("""
+            SELECT id
+              FROM res_partner
+             WHERE id = ANY(%s)
+          ORDER BY name, id
+        """, [partner_ids])
+        return {partner_id: rank for rank, (partner_id,) in enumerate(self.env.cr.fetchall())}
+
+    # ---------------------------
+    # Segundo plano
+    # ---------------------------
+    def _report_job_values(self):
+        """Valores del wizard para volver a crearlo en el job (sin binarios)."""
+        self.ensure_one()
+        fnames = [
+            name for name, field in self._fields.items()
+            if field.store and name not in models.MAGIC_COLUMNS
+            and field.type not in ('binary', 'one2many')
+        ]
+        values = self._convert_to_write({name: self[name] for name in fnames})
+        return json.loads(json.dumps(values, default=json_default))
+
+    def _report_job_lock_key(self):
+        """Jobs con la misma clave no corren a la vez: mismo wizard, compañías y parámetros."""
+        values = json.dumps(self._report_job_values(), sort_keys=True)
+        return f"{self._name}:{sorted(self.env.companies.ids)}:{hashlib.sha1(values.encode()).hexdigest()}"
+
+    def _report_progress(self, percent):
+        """Avance del job en curso (no hace nada fuera de segundo plano)."""
+        job_id = self.env.context.get('pentalab_report_job_id')
+        if job_id:
+            self.env['pentalab.report.job'].browse(job_id)._set_progress(percent)
+
+    def _report_progress_iter(self, items, start=0, end=100, steps=20):
+        """
+        Recorre ``items`` informando el avance del job en curso de ``start``
+        a ``end`` en hasta ``steps`` pasos (cada aviso es una transacción).
+        """
+        total = len(items)
+        step = max(1, total // steps)
+        for index, item in enumerate(items):
+            if not index % step:
+                self._report_progress(start + (end - start) * index // total)
+            yield item
+
+    def action_report_enqueue(self):
+        self.ensure_one()
+        method = self.env.context.get('report_job_method')
+        if method not in self._report_job_methods:
+            raise UserError(_("El reporte no se puede generar en segundo plano."))
+        job = self.env['pentalab.report.job']._enqueue(self, method)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': job._name,
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+
+from odoo import SUPERUSER_ID, Command, api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Ejecución en curso (ver ``profiled_report``)
+_current_run = ContextVar('pentalab_report_run', default=None)
+
+# Parámetro que activa la medición de memoria (desactivada por defecto)
+TRACE_MEMORY_PARAM = 'l10n_ec_reports_penta.report_trace_memory'
+
+# tracemalloc es global al proceso: lo activa la primera ejecución medida y
+# lo detiene la última. Una ejecución solo guarda su pico si corrió sola,
+# porque el pico es uno solo para todo el proceso
+_tracing_lock = threading.Lock()
+_tracing_runs = 0
+_tracing_starts = 0
+
+
+def _start_tracing():
+    """
+    Activa tracemalloc para una ejecución.
+
+    :return: (memoria trazada al iniciar en bytes, número de inicio) o None
+        si no se mide (tracemalloc ya activado fuera de este módulo)
+    """
+    global _tracing_runs, _tracing_starts
+    with _tracing_lock:
+        if not _tracing_runs:
+            if tracemalloc.is_tracing():
+                return None
+            tracemalloc.start()
+        _tracing_runs += 1
+        _tracing_starts += 1
+        current, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return current, _tracing_starts
+
+
+def _stop_tracing(tracing):
+    """Pico de memoria asignada desde ``_start_tracing`` (MB), o False si
+    otra ejecución medida se solapó con esta."""
+    global _tracing_runs
+    if tracing is None:
+        return False
+    start_memory, start_number = tracing
+    with _tracing_lock:
+        _current, peak = tracemalloc.get_traced_memory()
+        alone = _tracing_runs == 1 and _tracing_starts == start_number
+        _tracing_runs -= 1
+        if not _tracing_runs:
+            tracemalloc.stop()
+    if not alone:
+        return False
+    return max(peak - start_memory, 0) / (1024.0 * 1024.0)
+
+
+class _ReportRun:
+    """Medición de una ejecución: fases, consultas, filas y memoria."""
+
+    def __init__(self, record, method_name):
+        self.record = record
+        self.method_name = method_name
+        self.cr = record.env.cr
+        self.phases = []
+        self.rows = 0
+        self.start = time.perf_counter()
+        self.start_queries = self.cr.sql_log_count
+        trace_memory = record.env['ir.config_parameter'].sudo().get_param(TRACE_MEMORY_PARAM)
+        self.tracing = _start_tracing() if trace_memory else None
+        self.error = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        phase = {'name': name, 'sequence': len(self.phases), 'row_count': 0}
+        self.phases.append(phase)
+        start, start_queries = time.perf_counter(), self.cr.sql_log_count
+        try:
+            yield phase
+        finally:
+            phase['duration'] = time.perf_counter() - start
+            phase['query_count'] = self.cr.sql_log_count - start_queries
+
+    def add_rows(self, count):
+        self.rows += count
+        open_phases = [phase for phase in self.phases if 'duration' not in phase]
+        if open_phases:
+            open_phases[-1]['row_count'] += count
+
+    def save(self):
+        record = self.record
+        values = {
+            'name': record._description,
+            'res_model': record._name,
+            'method': self.method_name,
+            'user_id': record.env.uid,
+            'company_id': record.env.company.id,
+            'duration': time.perf_counter() - self.start,
+            'query_count': self.cr.sql_log_count - self.start_queries,
+            'row_count': self.rows,
+            'run_peak_memory': _stop_tracing(self.tracing),
+            'state': 'error' if self.error else 'done',
+            'error': self.error,
+            'phase_ids': [Command.create(phase) for phase in self.phases],
+        }
+        # Cursor aparte: el registro queda aunque el reporte falle y se revierta
+        try:
+            with record.env.registry.cursor() as cr:
+                api.Environment(cr, SUPERUSER_ID, {})['pentalab.report.run'].create(values)
+        except Exception:
+            _logger.exception("No se pudo registrar la ejecución de %s.%s", record._name, self.method_name)
+
+
+def profiled_report(method):
+    """
+    Decorador para los métodos que generan un reporte: registra un
+    ``pentalab.report.run`` con el tiempo total, consultas SQL y filas. Si
+    ya hay una ejecución en curso (un método decorado que llama a otro), el
+    método interno se registra como una fase.
+
+    El pico de memoria (tracemalloc) solo se mide si está activado el
+    parámetro ``TRACE_MEMORY_PARAM``: traza todo el proceso y hace más
+    lento el reporte, así que la duración medida a la vez es orientativa.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        run = _current_run.get()
+        if run is not None:
+            with run.phase(method.__name__):
+                return method(self, *args, **kwargs)
+        run = _ReportRun(self, method.__name__)
+        token = _current_run.set(run)
+        try:
+            return method(self, *args, **kwargs)
+        except Exception as e:
+            run.error = str(e)
+            raise
+        finally:
+            _current_run.reset(token)
+            run.save()
+    return wrapper
+
+
+@contextlib.contextmanager
+def report_phase(name):
+    """Fase con nombre de la ejecución en curso (no hace nada fuera de ella).
+    También se puede usar como decorador: ``@report_phase('fetch')``."""
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+    with run.phase(name):
+        yield
+
+
+def report_rows(count):
+    """Suma ``count`` filas producidas a la ejecución (y fase) en curso."""
+    run = _current_run.get()
+    if run is not None:
+        run.add_rows(count)
+
+
+class PentalabReportRun(models.Model):
+    """Registro de ejecuciones de los reportes Pentalab (ver ``profiled_report``)."""
+    _name = 'pentalab.report.run'
+    _description = 'Ejecución de reporte Pentalab'
+    _order = 'id desc'
+
+    name = fields.Char('Reporte', readonly=True)
+    res_model = fields.Char('Modelo', readonly=True, index=True)
+    method = fields.Char('Método', readonly=True)
+    user_id = fields.Many2one('res.users', string='Usuario', readonly=True)
+    company_id = fields.Many2one('res.company', string='Compañía', readonly=True)
+    duration = fields.Float('Duración (s)', digits=(16, 3), readonly=True, aggregator='avg')
+    query_count = fields.Integer('Consultas SQL', readonly=True, aggregator='avg')
+    row_count = fields.Integer('Filas', readonly=True, aggregator='sum')
+    run_peak_memory = fields.Float(
+        'Memoria pico de la ejecución (MB)', digits=(16, 1), readonly=True, aggregator='max',
+        help="Pico de memoria Python asignada durante la ejecución, sobre la que ya había al iniciarla. "
+             "Solo se mide con la opción de medir memoria activada y si no hubo otra ejecución medida a la vez.")
+    state = fields.Selection([
+        ('done', 'Terminado'),
+        ('error', 'Error'),
+    ], string='Estado', readonly=True)
+    error = fields.Text('Error', readonly=True)
+    phase_ids = fields.One2many('pentalab.report.run.phase', 'run_id', string='Fases', readonly=True)
+
+
+class PentalabReportRunPhase(models.Model):
+    _name = 'pentalab.report.run.phase'
+    _description = 'Fase de una ejecución de reporte Pentalab'
+    _order = 'run_id, sequence'
+
+    run_id = fields.Many2one('pentalab.report.run', string='Ejecución', required=True, ondelete='cascade', index=True)
+    sequence = fields.Integer('Secuencia')
+    name = fields.Char('Fase', readonly=True)
+    duration = fields.Float('Duración (s)', digits=(16, 3), readonly=True)
+    query_count = fields.Integer('Consultas SQL', readonly=True)
+    row_count = fields.Integer('Filas', readonly=True)
@@ -1,10 +1,8 @@
 # -*- coding: utf-8 -*-
 import base64
-import io
 from datetime import datetime, date
 from io import BytesIO
 import re
-import openpyxl
 import xlsxwriter
 
 from datetime import timedelta
@@ -12,9 +10,9 @@ from datetime import timedelta
 from odoo import models, fields
 
 from odoo.tools.misc import format_date
-import base64
-from io import BytesIO
-from openpyxl import load_workbook
+
+from .pentalab_report_custom import ReportLinesSheet
+from .pentalab_report_run import profiled_report
 
 # DATE_FORMAT = "%Y-%m-%d"
 DATE_FORMAT = "%d/%m/%Y"
@@ -43,6 +41,7 @@ class PentalabReportWizard(models.TransientModel):
     file_data = fields.Binary("Archivo XLSX", readonly=True)
     file_name = fields.Char("Nombre del Archivo", readonly=True)
 
+    @profiled_report
     def action_generate_report(self):
 
         company = self.env['res.company'].browse(self.company_id.id)
@@ -78,17 +77,9 @@ class PentalabReportWizard(models.TransientModel):
             'unfold_all': True  # Propiedad para desplegar todas las cuentas
         }
 
-        # Generar el archivo en binario usando export_to_xlsx para ambas opciones
-        xlsx_data = report.export_to_xlsx(options)
-
-        # Leer el archivo binario y cargarlo en openpyxl para la primera opción
-        file_content1 = xlsx_data['file_content']
-        excel_file1 = io.BytesIO(file_content1)
-        workbook1 = openpyxl.load_workbook(excel_file1)
-
-        # workbook1.save('balance_mensual.xlsx')
-
-        sheet1 = workbook1.active  # Selecciona la primera hoja
+        # Líneas del reporte con la misma distribución de filas/columnas de su exportación XLSX
+        ReportCustom = self.env['pentalab.report.custom']
+        sheet1 = ReportLinesSheet(ReportCustom._get_report_rows(report, options))
 
         """Genera y descarga el informe XLSX con la lógica original (pagos, días vencidos, etc.)."""
         self.ensure_one()
@@ -158,15 +149,8 @@ class PentalabReportWizard(models.TransientModel):
                 'unfold_all': True  # Propiedad para desplegar todas las cuentas
             }
 
-            # Generar el archivo en binario usando export_to_xlsx para ambas opciones
-            xlsx_data = report_payment.export_to_xlsx(options_payment)
-
-            # Leer el archivo binario y cargarlo en openpyxl para la primera opción
-            file_content2 = xlsx_data['file_content']
-            excel_file2 = io.BytesIO(file_content2)
-            workbook2 = openpyxl.load_workbook(excel_file2)
-
-            sheet2 = workbook2.active  # Selecciona la primera hoja
+            # Líneas del reporte con la misma distribución de filas/columnas de su exportación XLSX
+            sheet2 = ReportLinesSheet(ReportCustom._get_report_rows(report_payment, options_payment))
 
             """Genera y descarga el informe XLSX con la lógica original (pagos, días vencidos, etc.)."""
             self.ensure_one()
@@ -187,10 +171,8 @@ class PentalabReportWizard(models.TransientModel):
 
                 account_move_lines_2 = self.env['account.move.line'].search(domain_2, order='name desc')
                 self.process_data(account_move_lines_2, sheet, sheet2, row, True, str(account.code))
-            workbook2.close()
 
         workbook.close()
-        workbook1.close()
         output.seek(0)
         xlsx_data = output.read()
 
@@ -380,47 +362,33 @@ class PentalabReportWizard(models.TransientModel):
 
         report = self.env['account.report'].with_company(self.company_id).browse(10)
 
-        xlsx_content = report.export_to_xlsx(options)
-
-         # Cargar archivo para edición
-        file_content = xlsx_content.get("file_content")
-        xlsx_io = BytesIO(file_content)
-        wb = load_workbook(filename=xlsx_io)
-        ws = wb.active
-
-        # Eliminar filas que no comienzan con 'fact' o 'factura' desde fila 5
-        rows_to_delete = []
-        for row in range(5, ws.max_row + 1):
-            cell_val = str(ws.cell(row=row, column=1).value or '').strip().lower()
-            if not (cell_val.startswith("fact") or cell_val.startswith("factura")):
-                rows_to_delete.append(row)
-
-        # Eliminar de abajo hacia arriba
-        for idx in reversed(rows_to_delete):
-            ws.delete_rows(idx)
+        ReportCustom = self.env['pentalab.report.custom']
+        rows = ReportCustom._get_report_rows(report, options)
+        # Filas desde la 5 (1-based): mantener solo las que comienzan con 'fact' o 'factura'
+        header, body = rows[:4], rows[4:]
+        body = [
+            line for line in body
+            if str((line['values'] or [''])[0] or '').strip().lower().startswith(("fact", "factura"))
+        ]
 
         new_totals = [0.0] * 7  # columnas D (4) a J (10)
-
-        for row in range(5, ws.max_row + 1):
+        for line in body:
             for i in range(7):
-                val = ws.cell(row=row, column=4 + i).value
+                val = line['values'][3 + i] if 3 + i < len(line['values']) else None
                 if isinstance(val, (int, float)):
                     new_totals[i] += val
 
         # Escribir totales en fila 4
+        while len(header) < 4:
+            header.append({'values': [], 'styles': []})
         for i, total in enumerate(new_totals):
-            ws.cell(row=4, column=4 + i).value = round(total, 2)
+            ReportCustom._set_cell(header[3], 3 + i, round(total, 2), 'level_0')
 
         # Escribir suma total en columna J (10), fila 4
         total_general = round(sum(new_totals), 2)
-        ws.cell(row=4, column=10).value = total_general
+        ReportCustom._set_cell(header[3], 9, total_general, 'level_0')
 
-        # Guardar archivo modificado
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        modified_xlsx = output.read()
-        
+        modified_xlsx = ReportCustom._write_rows(header + body)
         
         # Guardar como attachment
         attachment = self.env['ir.attachment'].create({
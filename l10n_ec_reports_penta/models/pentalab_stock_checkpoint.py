@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime, time, timedelta
+
+import pytz
+from dateutil.relativedelta import relativedelta
+
+from odoo import api, fields, models, tools
+
+from .stock_quant import CATEGORY_LEVELS
+
+_logger = logging.getLogger(__name__)
+
+# Agrupaciones permitidas en ``_get_stock_at``
+STOCK_AT_GROUPBY = ('company_id', 'product_id', 'warehouse_id') + tuple(
+    f'cat_l{level}_id' for level in range(1, CATEGORY_LEVELS + 1)
+)
+
+# Zona horaria de los cortes si la compañía principal no tiene una
+CUTOFF_TZ_FALLBACK = 'America/Guayaquil'
+
+
+class PentalabStockCheckpoint(models.Model):
+    """
+    Existencias valoradas a una fecha de corte.
+
+    Cada fila es la suma acumulada de ``stock_valuation_layer`` (cantidad y
+    valor) por compañía, producto y almacén hasta un fin de mes. El cron
+    guarda un punto de control por mes; el stock a cualquier fecha es el
+    punto de control anterior más las capas creadas desde entonces, sin
+    recorrer todo el historial. Los fines de mes son la medianoche local de
+    la compañía principal (la misma zona para todos los puntos de control).
+
+    El almacén de una capa es el de la ubicación interna de su movimiento
+    (destino en las entradas, origen en las salidas). Las transferencias
+    entre almacenes de una misma compañía no generan capas de valoración,
+    por lo que el reparto por almacén no las refleja; los totales por
+    compañía y producto sí son exactos.
+    """
+    _name = 'pentalab.stock.checkpoint'
+    _description = 'Punto de control de existencias a fin de mes'
+    _log_access = False
+    _order = 'date desc, company_id, product_id'
+
+    date = fields.Date('Fecha de corte', required=True, readonly=True, index=True)
+    company_id = fields.Many2one('res.company', string='Compañía', required=True, readonly=True)
+    product_id = fields.Many2one('product.product', string='Producto', required=True, readonly=True)
+    warehouse_id = fields.Many2one('stock.warehouse', string='Almacén', readonly=True)
+    quantity = fields.Float('Cantidad', digits='Product Unit of Measure', readonly=True)
+    value = fields.Float('Valor', digits='Product Price', readonly=True)
+
+    def init(self):
+        # Las deltas entre puntos de control filtran las capas por fecha de creación
+        tools.create_index(self.env.cr, 'stock_valuation_layer_create_date_index',
+                           'stock_valuation_layer', ['create_date'])
+
+    # ---------------------------
+    # Consultas
+    # ---------------------------
+    def _layers_query(self):
+        """
+        Capas de valoración con su almacén, creadas en el intervalo
+        [``date_from``, ``date_to``) (``date_from`` puede ser nulo).
+        """
+        return """
+            SELECT svl.company_id,
+                   svl.product_id,
+                   CASE WHEN svl.quantity >= 0 THEN dest.warehouse_id ELSE src.warehouse_id END AS warehouse_id,
+                   svl.quantity,
+                   svl.value
+              FROM stock_valuation_layer svl
+              LEFT JOIN stock_move sm ON sm.id = svl.stock_move_id
+              LEFT JOIN stock_location src ON src.id = sm.location_id
+              LEFT JOIN stock_location dest ON dest.id = sm.location_dest_id
+             WHERE (%(date_from)s::timestamp IS NULL OR svl.create_date >= %(date_from)s)
+               AND svl.create_date < %(date_to)s
+               AND svl.company_id = ANY(%(company_ids)s)
+        """
+
+    def _balance_query(self):
+        """Punto de control ``checkpoint`` más las capas desde entonces."""
+        return f"""
+            SELECT company_id, product_id, warehouse_id,
+                   SUM(quantity) AS quantity,
+                   SUM(value) AS value
+              FROM (
+                    SELECT company_id, product_id, warehouse_id, quantity, value
+                      FROM {self._table}
+                     WHERE date = %(checkpoint)s
+                       AND company_id = ANY(%(company_ids)s)
+                     UNION ALL
+                    {self._layers_query()}
+                   ) balance
+             GROUP BY company_id, product_id, warehouse_id
+        """
+
+    @api.model
+    def _get_cutoff_tz(self):
+        """Zona horaria de los cortes: la de la compañía principal."""
+        company = self.env['res.company'].sudo().search([], order='sequence, id', limit=1)
+        return company.partner_id.tz or CUTOFF_TZ_FALLBACK
+
+    @api.model
+    def _cutoff_datetime(self, date):
+        """Instante (UTC, sin zona) en que termina el día ``date`` en la zona de los cortes."""
+        tz = pytz.timezone(self._get_cutoff_tz())
+        end = tz.localize(datetime.combine(date + timedelta(days=1), time.min))
+        return end.astimezone(pytz.utc).replace(tzinfo=None)
+
+    @api.model
+    def _balance_params(self, cutoff, company_ids):
+        """Parámetros de ``_balance_query`` para el stock al cierre de ``cutoff``."""
+        checkpoint = self._get_checkpoint_date(cutoff)
+        return {
+            'checkpoint': checkpoint,
+            'date_from': checkpoint and self._cutoff_datetime(checkpoint),
+            'date_to': self._cutoff_datetime(cutoff),
+            'company_ids': list(company_ids),
+        }
+
+    @api.model
+    def _get_checkpoint_date(self, cutoff):
+        """Último punto de control en o antes de ``cutoff`` (None si no hay)."""
+        self.env.cr.execute(f"SELECT MAX(date) FROM {self._table} WHERE date <= %s", [cutoff])
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _stock_at_query(self, cutoff, company_ids):
+        """
+        Consulta (SQL y parámetros) del stock por producto y almacén al
+        cierre de ``cutoff``, con los niveles de categoría del producto
+        (mismos niveles que ``cat_l1_id`` ... ``cat_l6_id`` del quant).
+        """
+        self.env['stock.valuation.layer'].flush_model()
+        levels = range(1, CATEGORY_LEVELS + 1)
+        level_columns = ',\n'.join(
+            f"levels.path[{level}] AS cat_l{level}_id, c{level}.name AS cat_l{level}_name"
+            for level in levels
+        )
+        level_joins = '\n'.join(
+            f"LEFT JOIN product_category c{level} ON c{level}.id = levels.path[{level}]"
+            for level in levels
+        )
+        query = f"""
+            SELECT balance.company_id,
+                   balance.product_id,
+                   balance.warehouse_id,
+                   COALESCE(w.name, '') AS warehouse_name,
+                   COALESCE(p.default_code, '') AS default_code,
+                   COALESCE(pt.name->>'es_EC', pt.name->>'en_US', '') AS product_name,
+                   {level_columns},
+                   balance.quantity,
+                   balance.value
+              FROM ({self._balance_query()}) balance
+              JOIN product_product p ON p.id = balance.product_id
+              JOIN product_template pt ON pt.id = p.product_tmpl_id
+              LEFT JOIN stock_warehouse w ON w.id = balance.warehouse_id
+              LEFT JOIN (
+                    SELECT id, string_to_array(rtrim(parent_path, '/'), '/')::int[] AS path
+                      FROM product_category
+                   ) levels ON levels.id = pt.categ_id
+              {level_joins}
+             WHERE balance.quantity <> 0 OR balance.value <> 0
+             ORDER BY w.name, p.default_code, balance.product_id
+        """
+        return query, self._balance_params(cutoff, company_ids)
+
+    @api.model
+    def _get_stock_at(self, cutoff, company_ids=None, groupby=('product_id', 'warehouse_id')):
+        """
+        Cantidad y valor al cierre de ``cutoff`` agrupados por ``groupby``
+        (campos de ``STOCK_AT_GROUPBY``), p. ej. ``('warehouse_id', 'cat_l2_id')``.
+
+        :return: lista de dicts con las claves de ``groupby``, ``quantity`` y ``value``
+        """
+        if not groupby or any(column not in STOCK_AT_GROUPBY for column in groupby):
+            raise ValueError(f"groupby debe ser un subconjunto de {STOCK_AT_GROUPBY}")
+        company_ids = company_ids or self.env.companies.ids
+        query, params = self._stock_at_query(cutoff, company_ids)
+        columns = ', '.join(groupby)
+        self.env.cr.execute(f"""
+            SELECT {columns}, SUM(quantity) AS quantity, SUM(value) AS value
+              FROM ({query}) stock
+             GROUP BY {columns}
+             ORDER BY {columns}
+        """, params)
+        return self.env.cr.dictfetchall()
+
+    # ---------------------------
+    # Puntos de control
+    # ---------------------------
+    @api.model
+    def _create_checkpoint(self, date):
+        """Guarda el stock de todas las compañías al cierre de ``date``."""
+        cr = self.env.cr
+        # Se borra antes de buscar el punto de control anterior, para no partir de sí mismo
+        cr.execute(f"DELETE FROM {self._table} WHERE date = %s", [date])
+        company_ids = self.env['res.company'].sudo().search([]).ids
+        query = self._balance_query()
+        params = self._balance_params(date, company_ids)
+        cr.execute(f"""
+            INSERT INTO {self._table} (date, company_id, product_id, warehouse_id, quantity, value)
+            SELECT %(date)s, company_id, product_id, warehouse_id, quantity, value
+              FROM ({query}) balance
+             WHERE quantity <> 0 OR value <> 0
+        """, {**params, 'date': date})
+        _logger.info("Punto de control de existencias al %s: %s filas", date, cr.rowcount)
+
+    @api.model
+    def _cron_create_checkpoints(self):
+        """Crea los puntos de control de fin de mes que falten hasta el mes anterior."""
+        self.env.flush_all()
+        cr = self.env.cr
+        tz = self._get_cutoff_tz()
+        last_month_end = fields.Date.context_today(self.with_context(tz=tz)).replace(day=1) - timedelta(days=1)
+        cr.execute(f"SELECT MAX(date) FROM {self._table}")
+        last_checkpoint = cr.fetchone()[0]
+        if last_checkpoint:
+            month_start = last_checkpoint + timedelta(days=1)
+        else:
+            cr.execute("SELECT MIN(create_date) FROM stock_valuation_layer")
+            first_layer = cr.fetchone()[0]
+            if not first_layer:
+                return
+            month_start = pytz.utc.localize(first_layer).astimezone(pytz.timezone(tz)).date().replace(day=1)
+        month_end = month_start + relativedelta(day=31)
+        while month_end <= last_month_end:
+            # Cada mes parte del anterior: sólo recorre las capas de ese mes
+            self._create_checkpoint(month_end)
+            month_end = month_end + timedelta(days=1) + relativedelta(day=31)
+        self.invalidate_model()
+
+    @api.model
+    def _rebuild_checkpoints(self, date_from=None):
+        """Borra los puntos de control desde ``date_from`` (todos si no se
+        indica) y los vuelve a crear; p. ej. tras importar capas con fecha
+        anterior al último punto de control."""
+        if date_from:
+            self.env.cr.execute(f"DELETE FROM {self._table} WHERE date >= %s", [date_from])
+        else:
+            self.env.cr.execute(f"DELETE FROM {self._table}")
+        self._cron_create_checkpoints()
@@ -0,0 +1,15 @@
+from odoo import models
+
+
+class ProductCategory(models.Model):
+    _inherit = 'product.category'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'parent_id' in vals or 'name' in vals:
+            # Los niveles (y sus nombres) de los quants cambian para toda la
+            # subcategoría: una sentencia por categoría afectada
+            quant = self.env['stock.quant']
+            for category in self.search([('id', 'child_of', self.ids)]):
+                quant._update_category_levels("pt.categ_id = %s", [category.id])
+        return res
@@ -1,5 +1,5 @@
 # models/product_product.py
-from odoo import models, fields
+from odoo import api, models, fields
 
 class ProductProduct(models.Model):
     _inherit = 'product.product'
@@ -7,7 +7,11 @@ class ProductProduct(models.Model):
     # calidad = fields.Char(string="Calidad", compute="_compute_custom_fields")
     # matiz = fields.Char(string="Matiz", compute="_compute_custom_fields")
     # calibre = fields.Char(string="Calibre", compute="_compute_custom_fields")
-    packaging_name = fields.Char(string="Embalaje", compute="_compute_packaging")
+    # Embalaje principal (el primero según el orden de product.packaging), guardado
+    # para que los listados de quants no lean los embalajes producto por producto
+    packaging_name = fields.Char(string="Embalaje", compute="_compute_packaging", store=True)
+    packaging_qty = fields.Float(string="Cantidad por embalaje", digits='Product Unit of Measure',
+                                 compute="_compute_packaging", store=True)
 
     # def _compute_custom_fields(self):
     #     for rec in self:
@@ -36,9 +40,16 @@ class ProductProduct(models.Model):
     #         rec.calibre = calibre
 
 
+    @api.depends('packaging_ids', 'packaging_ids.name', 'packaging_ids.qty', 'packaging_ids.sequence')
     def _compute_packaging(self):
+        # Una sola búsqueda para todo el lote; viene en el orden de product.packaging
+        primary = {}
+        products = self.filtered('id')
+        if products:
+            for packaging in self.env['product.packaging'].search([('product_id', 'in', products.ids)]):
+                primary.setdefault(packaging.product_id.id, packaging)
         for rec in self:
-            if rec.packaging_ids:
-                rec.packaging_name = rec.packaging_ids[0].name
-            else:
-                rec.packaging_name = ''
\ No newline at end of file
+            # Registros nuevos (formularios): aún no están en la base
+            packaging = primary.get(rec.id) if rec.id else rec.packaging_ids[:1]
+            rec.packaging_name = packaging.name if packaging else ''
+            rec.packaging_qty = packaging.qty if packaging else 0.0
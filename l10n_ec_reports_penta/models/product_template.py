@@ -0,0 +1,11 @@
+from odoo import models
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'categ_id' in vals:
+            self.env['stock.quant']._update_category_levels("pp.product_tmpl_id = ANY(%s)", [self.ids])
+        return res
@@ -8,6 +8,17 @@ class ResConfigSettings(models.TransientModel):
         related='company_id.sales_amount_report_uafe',
         string='Sales amount reported by UAFE', readonly=False,
         help='We specify the amount that customer purchases must reach to be considered in the UAFE report.')
+
+    pentalab_report_parallel_workers = fields.Integer(
+        string='Hilos para reportes por compañía',
+        config_parameter='l10n_ec_reports_penta.report_parallel_workers',
+        help='Número máximo de compañías que se calculan a la vez en el reporte de cartera con la opción '
+             '"Calcular por compañía en paralelo". Vacío: según los núcleos del servidor.')
+    pentalab_report_trace_memory = fields.Boolean(
+        string='Medir memoria de los reportes',
+        config_parameter='l10n_ec_reports_penta.report_trace_memory',
+        help='Registra el pico de memoria de cada ejecución de reporte (tracemalloc). Traza todas las '
+             'asignaciones del proceso y hace los reportes más lentos: activarlo solo para diagnosticar.')
     
     #Pagos 
     payment_prepared_by_id = fields.Many2one(
@@ -1,9 +1,71 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields
+from odoo.tools import SQL
+
+from .pentalab_partner_aging import AGING_ACCOUNT_TYPES
+
+FOLLOWUP_ACCOUNT_TYPES = {
+    '': AGING_ACCOUNT_TYPES,
+    'both': AGING_ACCOUNT_TYPES,
+    'payable': ('liability_payable',),
+    'receivable': ('asset_receivable',),
+}
+
+# Operadores soportados por los campos de antigüedad en dominios
+AGING_SEARCH_OPERATORS = {
+    '=': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
 
 class ResPartner(models.Model):
     _inherit = "res.partner"
 
+    # Cartera de las compañías activas, leída de pentalab.partner.aging
+    pentalab_aging_total = fields.Float(
+        string='Cartera', compute='_compute_pentalab_aging', search='_search_pentalab_aging_total')
+    pentalab_aging_overdue = fields.Float(
+        string='Vencido', compute='_compute_pentalab_aging', search='_search_pentalab_aging_overdue')
+    pentalab_aging_current = fields.Float(string='Corriente', compute='_compute_pentalab_aging')
+
+    def _compute_pentalab_aging(self):
+        totals = self.env['pentalab.partner.aging']._get_totals(self.ids, self.env.companies.ids)
+        for partner in self:
+            amounts = totals.get(partner.id, {})
+            total = amounts.get('amount_residual', 0.0)
+            overdue = max(amounts.get('amount_issued', 0.0), 0.0)
+            partner.pentalab_aging_total = total
+            partner.pentalab_aging_overdue = overdue
+            partner.pentalab_aging_current = total - overdue
+
+    def _search_pentalab_aging(self, aggregate, operator, value):
+        """Subconsulta de los contactos cuyo ``aggregate`` por contacto cumple ``operator value``."""
+        if operator not in AGING_SEARCH_OPERATORS:
+            return NotImplemented
+        Aging = self.env['pentalab.partner.aging']
+        domain = [('company_id', 'in', self.env.companies.ids)]
+        query = Aging._search(domain)
+        amount = SQL("COALESCE(%s, 0.0)", Aging._read_group_select(aggregate, query))
+        if aggregate.startswith('amount_issued'):
+            amount = SQL("GREATEST(%s, 0.0)", amount)
+        query.groupby = Aging._field_to_sql(Aging._table, 'partner_id', query)
+        query.having = SQL("%s %s %s", amount, SQL(operator), value)
+        matching = query.select(query.groupby)
+        # Los contactos sin filas tienen saldo 0
+        if AGING_SEARCH_OPERATORS[operator](0.0, value):
+            with_balance = Aging._search(domain).subselect('partner_id')
+            return ['|', ('id', 'in', matching), ('id', 'not in', with_balance)]
+        return [('id', 'in', matching)]
+
+    def _search_pentalab_aging_total(self, operator, value):
+        return self._search_pentalab_aging('amount_residual:sum', operator, value)
+
+    def _search_pentalab_aging_overdue(self, operator, value):
+        return self._search_pentalab_aging('amount_issued:sum', operator, value)
+
     # ---------------------------
     # 1) Leer chips del account.report
     # ---------------------------
@@ -97,6 +159,34 @@ class ResPartner(models.Model):
     # ---------------------------
     # 5) Totales
     # ---------------------------
+    def _followup__totals_from_snapshot(self, options, allowed_company_ids):
+        """Totales desde pentalab.partner.aging; None si las opciones no lo permiten
+        (diarios, fecha de corte, conciliados) o el snapshot no es de hoy."""
+        ftype = (options.get('filter_account_type') or '').strip()
+        if (
+            ftype not in FOLLOWUP_ACCOUNT_TYPES
+            or options.get('journal_ids')
+            or options.get('show_unreconciled_only') is False
+            or (options.get('date') or {}).get('date_to')
+        ):
+            return None
+        aging = self.env['pentalab.partner.aging']
+        if not aging._is_current():
+            return None
+        company_ids = self.env['res.company'].search([
+            ('id', 'child_of', self.env.company.id),
+            ('id', 'in', allowed_company_ids),
+        ]).ids
+        amounts = aging._get_totals(self.ids, company_ids, FOLLOWUP_ACCOUNT_TYPES[ftype]).get(self.id, {})
+        total_all = amounts.get('amount_residual', 0.0)
+        total_issued = amounts.get('amount_issued', 0.0)
+        overdue_shown = total_issued if total_issued > 0 else 0.0
+        return {
+            'total_overdue': overdue_shown,
+            'total_due': total_all - overdue_shown,
+            'total_importe': total_all,
+        }
+
     def _get_followup_totals(self):
         """
         Cartera = suma con signo de residuales.
@@ -105,12 +195,17 @@ class ResPartner(models.Model):
         """
         self.ensure_one()
         options = self._followup__get_report_options()
-        domain = self._followup__domain_from_options(options)
 
         allowed_company_ids = self.env.context.get('allowed_company_ids', self.env.company.ids)
         if isinstance(allowed_company_ids, int):
             allowed_company_ids = [allowed_company_ids]
 
+        totals = self._followup__totals_from_snapshot(options, allowed_company_ids)
+        if totals is not None:
+            return totals
+
+        domain = self._followup__domain_from_options(options)
+
         aml = self.env['account.move.line'].search(domain).filtered(
             lambda l: l.company_id.id in allowed_company_ids
         )
@@ -1,6 +1,18 @@
-from odoo import models, fields, api
+import logging
+
+from odoo import models, fields, api, tools
+from odoo.osv import expression
+
+_logger = logging.getLogger(__name__)
 
 PRODUCT_CATEGORY_MODEL = 'product.category'
+# Niveles de categoría desnormalizados en el quant (cat_l1_id ... cat_l6_id)
+CATEGORY_LEVELS = 6
+CATEGORY_LEVEL_FIELDS = tuple(
+    f'cat_l{level}_{suffix}' for level in range(1, CATEGORY_LEVELS + 1) for suffix in ('id', 'name')
+) + ('cat_depth',)
+# Quants por sentencia al rellenar los niveles al instalar
+CATEGORY_LEVELS_CHUNK_SIZE = 50000
 
 class StockQuant(models.Model):
     _inherit = 'stock.quant'
@@ -12,78 +24,122 @@ class StockQuant(models.Model):
         related='location_id.warehouse_id'
     )
     packaging_name = fields.Char(related='product_id.packaging_name', string="Embalaje")
+    packaging_qty = fields.Float(related='product_id.packaging_qty', string="Cantidad por embalaje")
     main_category_id = fields.Many2one(
         PRODUCT_CATEGORY_MODEL,
         string='Categoría',
         related='product_id.categ_id',
         store=True, index= True
     )
-    # Niveles desde la RAÍZ (si no existe, queda False, manteniendo la alineación)
-    cat_l1_id = fields.Many2one('product.category', string='Nivel 1 (raíz)',
-                                compute='_compute_category_levels', store=True, index=True)
-    cat_l2_id = fields.Many2one('product.category', string='Nivel 2',
-                                compute='_compute_category_levels', store=True, index=True)
-    cat_l3_id = fields.Many2one('product.category', string='Nivel 3',
-                                compute='_compute_category_levels', store=True, index=True)
-    cat_l4_id = fields.Many2one('product.category', string='Nivel 4',
-                                compute='_compute_category_levels', store=True, index=True)
-    cat_l5_id = fields.Many2one('product.category', string='Nivel 5',
-                                compute='_compute_category_levels', store=True, index=True)
-    cat_l6_id = fields.Many2one('product.category', string='Nivel 6',
-                                compute='_compute_category_levels', store=True, index=True)
+    # Niveles desde la RAÍZ (si no existe, queda False, manteniendo la alineación).
+    # Se mantienen por SQL desde la categoría (ver ``_update_category_levels``)
+    cat_l1_id = fields.Many2one('product.category', string='Nivel 1 (raíz)', readonly=True, index=True)
+    cat_l2_id = fields.Many2one('product.category', string='Nivel 2', readonly=True, index=True)
+    cat_l3_id = fields.Many2one('product.category', string='Nivel 3', readonly=True, index=True)
+    cat_l4_id = fields.Many2one('product.category', string='Nivel 4', readonly=True, index=True)
+    cat_l5_id = fields.Many2one('product.category', string='Nivel 5', readonly=True, index=True)
+    cat_l6_id = fields.Many2one('product.category', string='Nivel 6', readonly=True, index=True)
     
     
-    cat_l1_name = fields.Char(related='cat_l1_id.name', string='Nombre Nivel 1', store=True)
-    cat_l2_name = fields.Char(related='cat_l2_id.name', string='Nombre Nivel 2', store=True)
-    cat_l3_name = fields.Char(related='cat_l3_id.name', string='Nombre Nivel 3', store=True)
-    cat_l4_name = fields.Char(related='cat_l4_id.name', string='Nombre Nivel 4', store=True)
-    cat_l5_name = fields.Char(related='cat_l5_id.name', string='Nombre Nivel 5', store=True)
-    cat_l6_name = fields.Char(related='cat_l6_id.name', string='Nombre Nivel 6', store=True)
+    cat_l1_name = fields.Char(string='Nombre Nivel 1', readonly=True)
+    cat_l2_name = fields.Char(string='Nombre Nivel 2', readonly=True)
+    cat_l3_name = fields.Char(string='Nombre Nivel 3', readonly=True)
+    cat_l4_name = fields.Char(string='Nombre Nivel 4', readonly=True)
+    cat_l5_name = fields.Char(string='Nombre Nivel 5', readonly=True)
+    cat_l6_name = fields.Char(string='Nombre Nivel 6', readonly=True)
 
-    cat_depth = fields.Integer(string='Profundidad categoría',
-                               compute='_compute_category_levels', store=True)
+    cat_depth = fields.Integer(string='Profundidad categoría', readonly=True)
     quantity = fields.Float(string="Cantidad a la mano", readonly=True)
     default_code = fields.Char(related='product_id.default_code', string="Código del producto", translate=False)
     product_name = fields.Char(related='product_id.name', string="Nombre del producto", translate=False)
+    # Sin guardar: se filtra por las combinaciones de la variante (ver
+    # ``_search_product_attribute_value_ids``), así los quants no copian los atributos
     product_attribute_value_ids = fields.Many2many(
         'product.attribute.value',
         string='Attributes',
         compute='_compute_quant_product_attributes',
-        store=True  # Must be stored to be filterable
+        search='_search_product_attribute_value_ids',
     )
 
     @api.depends('product_id.product_template_attribute_value_ids.product_attribute_value_id')
     def _compute_quant_product_attributes(self):
         for quant in self:
-            if quant.product_id:
-                value_ids = quant.product_id.product_template_attribute_value_ids.product_attribute_value_id
-                quant.product_attribute_value_ids = value_ids
-            else:
-                quant.product_attribute_value_ids = False
-                
-    @api.depends('product_id.categ_id', 'product_id.categ_id.parent_path')
-    def _compute_category_levels(self):
-        category = self.env['product.category']
-        for rec in self:
-            cat = rec.product_id.categ_id if rec.product_id and rec.product_id.categ_id else False
-            if not cat:
-                rec.update({
-                    'cat_l1_id': False, 'cat_l2_id': False, 'cat_l3_id': False,
-                    'cat_l4_id': False, 'cat_l5_id': False, 'cat_l6_id': False, 
-                    'cat_depth': 0
-                })
-                continue
+            quant.product_attribute_value_ids = quant.product_id.product_template_attribute_value_ids.product_attribute_value_id
+
+    def _search_product_attribute_value_ids(self, operator, value):
+        # Subconsulta sobre las combinaciones de la variante
+        # (product_variant_combination -> product_template_attribute_value)
+        path = 'product_template_attribute_value_ids.product_attribute_value_id'
+        if operator in expression.NEGATIVE_TERM_OPERATORS:
+            positive = expression.TERM_OPERATORS_NEGATION[operator]
+            return [('product_id', 'not any', [(path, positive, value)])]
+        return [('product_id', 'any', [(path, operator, value)])]
 
-            # parent_path es como "1/23/45/" => ids desde raíz a hoja
-            ids = [int(x) for x in cat.parent_path.split('/') if x]
-            chain = category.browse(ids)  # ya viene ordenada raíz->hoja
+    @api.model_create_multi
+    def create(self, vals_list):
+        quants = super().create(vals_list)
+        if quants:
+            quants._update_category_levels("sq.id = ANY(%s)", [quants.ids])
+        return quants
 
-            vals = {'cat_depth': len(chain)}
-            # Rellenar niveles 1..MAX_LEVELS
-            levels = ['cat_l1_id', 'cat_l2_id', 'cat_l3_id', 'cat_l4_id', 'cat_l5_id', 'cat_l6_id']
-            for i, fname in enumerate(levels):
-                vals[fname] = chain[i] if i < len(chain) else False
+    def init(self):
+        super().init()
+        # Relación de la versión anterior, cuando product_attribute_value_ids se guardaba
+        self.env.cr.execute("DROP TABLE IF EXISTS product_attribute_value_stock_quant_rel")
+        # Mismo nombre que el índice del ORM: no se duplica si ya existe
+        tools.create_index(self.env.cr, 'product_template_attribute_value__product_attribute_value_id_index',
+                           'product_template_attribute_value', ['product_attribute_value_id'])
+        # Relleno inicial por bloques de ids (sólo quants sin niveles calculados)
+        cr = self.env.cr
+        cr.execute("SELECT MIN(id), MAX(id) FROM stock_quant WHERE cat_depth IS NULL")
+        min_id, max_id = cr.fetchone()
+        if min_id is None:
+            return
+        for start in range(min_id, max_id + 1, CATEGORY_LEVELS_CHUNK_SIZE):
+            count = self._update_category_levels(
+                "sq.cat_depth IS NULL AND sq.id >= %s AND sq.id < %s",
+                [start, start + CATEGORY_LEVELS_CHUNK_SIZE],
+            )
+            _logger.info("Niveles de categoría: %s quants desde el id %s", count, start)
 
-            rec.update(vals)
+    @api.model
+    def _update_category_levels(self, condition, params):
+        """
+        Rellena ``cat_l*_id``, ``cat_l*_name`` y ``cat_depth`` de los quants
+        que cumplen ``condition`` (SQL sobre ``sq`` = stock_quant,
+        ``pp`` = product_product y ``pt`` = product_template) en una sola
+        sentencia. Los niveles se obtienen del ``parent_path`` de la categoría
+        del producto, una vez por categoría.
 
-    
\ No newline at end of file
+        :return: cantidad de quants actualizados
+        """
+        self.env['product.category'].flush_model(['name', 'parent_path'])
+        self.env['product.template'].flush_model(['categ_id'])
+        self.env['product.product'].flush_model(['product_tmpl_id'])
+        self.flush_model(['product_id'])
+        levels = range(1, CATEGORY_LEVELS + 1)
+        assignments = ',\n'.join(
+            f"cat_l{level}_id = levels.path[{level}], cat_l{level}_name = c{level}.name"
+            for level in levels
+        )
+        joins = '\n'.join(
+            f"LEFT JOIN product_category c{level} ON c{level}.id = levels.path[{level}]"
+            for level in levels
+        )
+        self.env.cr.execute(f"""
+            UPDATE stock_quant sq
+               SET {assignments},
+                   cat_depth = cardinality(levels.path)
+              FROM product_product pp
+              JOIN product_template pt ON pt.id = pp.product_tmpl_id
+              JOIN (
+                    SELECT id, string_to_array(rtrim(parent_path, '/'), '/')::int[] AS path
+                      FROM product_category
+                   ) levels ON levels.id = pt.categ_id
+              {joins}
+             WHERE sq.product_id = pp.id
+               AND {condition}
+        """, params)
+        count = self.env.cr.rowcount
+        self.invalidate_model(CATEGORY_LEVEL_FIELDS)
+        return count
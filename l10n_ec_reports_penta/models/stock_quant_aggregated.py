@@ -1,9 +1,25 @@
-from odoo import models, fields, api
+import logging
+
+from odoo import models, fields, api, tools
+
+_logger = logging.getLogger(__name__)
+
+# Fecha/hora de la última actualización de la vista materializada
+REFRESHED_AT_PARAM = 'l10n_ec_reports_penta.stock_quant_aggregated_refreshed_at'
+
 
 class StockQuantAggregated(models.Model):
+    """
+    Stock agrupado por producto y ubicación padre, materializado.
+
+    Es una vista materializada de PostgreSQL: se crea al actualizar el
+    módulo y se refresca con el cron o a pedido (``action_refresh``). El
+    refresco es concurrente, así que la exportación puede seguir leyendo
+    mientras se recalcula.
+    """
     _name = "stock.quant.aggregated"
     _description = "Stock agrupado por producto y ubicación padre"
-    _auto = False  # Es una vista SQL, no una tabla
+    _auto = False  # Vista materializada, no una tabla del ORM
 
     product_id = fields.Many2one('product.product', string="Producto", readonly=True)
     in_date = fields.Datetime(string="Fecha de ingreso", readonly=True)
@@ -27,66 +43,87 @@ class StockQuantAggregated(models.Model):
     standard_price = fields.Float(string="Costo", digits='Product Price', readonly=True)
     list_price = fields.Float(string="Precio", digits='Product Price', readonly=True)
 
-    @api.model
-    def init(self):
-        self.env.cr.execute("""DROP VIEW IF EXISTS stock_quant_aggregated CASCADE;""")
-
-        self.env.cr.execute("""
-CREATE OR REPLACE VIEW stock_quant_aggregated AS
+    def _source_query(self):
+        # El costo es company_dependent (jsonb por compañía): se toma el de la
+        # compañía del almacén
+        return """
 WITH quant_locations AS (
     SELECT
-        sq.id AS quant_id,
         sq.product_id,
         sq.quantity,
-        sq.in_date,  -- <=== AÑADIDO AQUÍ
+        sq.in_date,
         loc.warehouse_id AS warehouse_id,
-        loc.id AS location_id,
-        loc.parent_path,
-        loc.usage AS location_usage
+        loc.usage AS location_usage,
+        (string_to_array(loc.parent_path, '/'))[2]::int AS main_parent_id
     FROM stock_quant sq
     JOIN stock_location loc ON sq.location_id = loc.id
-),
-first_level_parent AS (
-    SELECT
-        quant_id,
-        product_id,
-        quantity,
-        in_date,  -- <=== AÑADIDO AQUÍ
-        warehouse_id,
-        location_usage,
-        split_part(trim(trailing '/' FROM parent_path), '/', 2)::int AS main_parent_id
-    FROM quant_locations
-    WHERE split_part(trim(trailing '/' FROM parent_path), '/', 2) IS NOT NULL
+    WHERE (string_to_array(loc.parent_path, '/'))[2] <> ''
 )
 SELECT
-    row_number() OVER (ORDER BY p.id, flp.main_parent_id) AS id,
+    row_number() OVER (ORDER BY p.id, ql.main_parent_id, ql.warehouse_id, ql.location_usage, ql.in_date) AS id,
     p.id AS product_id,
-    flp.location_usage AS location_usage,
-    flp.in_date AS in_date,
-    flp.warehouse_id AS warehouse_id,
-    flp.main_parent_id AS location_parent_id,
+    ql.location_usage AS location_usage,
+    ql.in_date AS in_date,
+    ql.warehouse_id AS warehouse_id,
+    ql.main_parent_id AS location_parent_id,
     p.default_code,
     COALESCE(pt.name->>'es_EC', pt.name->>'en_US', '') AS product_name,
     c.name AS product_category,
     c2.name AS product_group,
     c3.name AS product_line,
-    COALESCE(
-    (SELECT value::float
-     FROM jsonb_each_text(p.standard_price) LIMIT 1), 
-    0.0
-) AS standard_price,
+    COALESCE((p.standard_price->>w.company_id::text)::float, 0.0) AS standard_price,
     COALESCE(pt.list_price, 0.0)::float AS list_price,
-    COALESCE(SUM(flp.quantity), 0.0) AS quantity
-FROM first_level_parent flp
-INNER JOIN stock_warehouse w ON w.id = flp.warehouse_id
-JOIN product_product p ON p.id = flp.product_id
+    COALESCE(SUM(ql.quantity), 0.0) AS quantity
+FROM quant_locations ql
+INNER JOIN stock_warehouse w ON w.id = ql.warehouse_id
+JOIN product_product p ON p.id = ql.product_id
 JOIN product_template pt ON pt.id = p.product_tmpl_id
 LEFT JOIN product_category c ON c.id = pt.categ_id
 LEFT JOIN product_category c2 ON c2.id = c.parent_id
 LEFT JOIN product_category c3 ON c3.id = c2.parent_id
 GROUP BY
-    p.id, flp.main_parent_id,
-    p.default_code, pt.name, flp.in_date,
+    p.id, ql.main_parent_id,
+    p.default_code, pt.name, ql.in_date,
     c.name, c2.name, c3.name,
-    p.standard_price, pt.list_price, flp.warehouse_id, flp.location_usage;
-        """)
\ No newline at end of file
+    p.standard_price, pt.list_price, w.company_id, ql.warehouse_id, ql.location_usage
+        """
+
+    @api.model
+    def init(self):
+        cr = self.env.cr
+        # Elimina tanto la vista materializada como la vista simple de versiones anteriores
+        tools.drop_view_if_exists(cr, self._table)
+        cr.execute(f"CREATE MATERIALIZED VIEW {self._table} AS ({self._source_query()})")
+        # El índice único sobre id es el que permite el refresco concurrente
+        cr.execute(f"CREATE UNIQUE INDEX {self._table}_id_index ON {self._table} (id)")
+        tools.create_index(cr, f'{self._table}_in_date_usage_warehouse_index', self._table,
+                           ['in_date', 'location_usage', 'warehouse_id'])
+        tools.create_index(cr, f'{self._table}_product_id_index', self._table, ['product_id'])
+        self._set_refreshed_at()
+
+    def _set_refreshed_at(self):
+        self.env['ir.config_parameter'].sudo().set_param(
+            REFRESHED_AT_PARAM, fields.Datetime.to_string(fields.Datetime.now()))
+
+    @api.model
+    def _get_refreshed_at(self):
+        value = self.env['ir.config_parameter'].sudo().get_param(REFRESHED_AT_PARAM)
+        return fields.Datetime.to_datetime(value) if value else False
+
+    @api.model
+    def _refresh(self):
+        """Recalcula la vista sin bloquear las lecturas en curso."""
+        self.env.flush_all()
+        self.env.cr.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {self._table}")
+        self._set_refreshed_at()
+        self.invalidate_model()
+        _logger.info("Vista %s actualizada", self._table)
+
+    @api.model
+    def _cron_refresh(self):
+        self._refresh()
+
+    @api.model
+    def action_refresh(self):
+        """Actualización a pedido (p. ej. desde el wizard de exportación)."""
+        self.sudo()._refresh()
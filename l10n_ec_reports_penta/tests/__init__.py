@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+from . import test_pentalab_report_job
+from . import test_report_uafe_wizard
+from . import test_pentalab_report_benchmark
@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import random
+import time
+from datetime import timedelta
+from itertools import groupby
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import Command, fields
+from odoo.tests import HttpCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+BENCHMARK_SIZES = (10_000, 100_000, 1_000_000)
+# Apuntes aproximados que genera cada factura (producto, impuesto, por cobrar)
+LINES_PER_INVOICE = 3
+# Quants de inventario por apunte contable generado
+QUANTS_PER_LINE = 0.1
+CREATE_BATCH_SIZE = 500
+
+
+@tagged('-standard', 'pentalab_benchmark', 'post_install', '-at_install')
+class TestPentalabReportBenchmark(HttpCase):
+    """
+    Medición de los reportes Pentalab sobre un libro sintético.
+
+    Genera contactos con categorías, facturas de venta con tipo de documento
+    y número de autorización del SRI, pagos parciales, retenciones,
+    extractos bancarios, quants de inventario y sesiones de caja; luego mide
+    cada reporte (la exportación de inventario por su ruta HTTP) y deja el
+    resultado en JSON en el log y, si se indica, en un archivo. Cada tamaño
+    corre en un savepoint que se revierte al terminar. No forma parte de la
+    suite estándar::
+
+        odoo-bin -d <db> --test-tags pentalab_benchmark
+
+    Variables de entorno: ``PENTALAB_BENCHMARK_SIZES`` (apuntes contables
+    por corrida, separados por comas), ``PENTALAB_BENCHMARK_COMPANIES`` y
+    ``PENTALAB_BENCHMARK_OUTPUT`` (ruta del JSON).
+    """
+
+    def test_report_benchmark(self):
+        sizes = os.environ.get('PENTALAB_BENCHMARK_SIZES')
+        sizes = [int(size) for size in sizes.split(',')] if sizes else BENCHMARK_SIZES
+        company_count = int(os.environ.get('PENTALAB_BENCHMARK_COMPANIES', 1))
+        self.authenticate('admin', 'admin')
+        results = []
+        for size in sizes:
+            random.seed(42)
+            savepoint = self.env.cr.savepoint()
+            try:
+                start = time.perf_counter()
+                data = self._generate_ledger(size, company_count)
+                generation = time.perf_counter() - start
+                results.append({
+                    'lines': size,
+                    'companies': len(data['companies']),
+                    'invoices': len(data['invoices']),
+                    'quants': data['quant_count'],
+                    'cash_box_sessions': len(data['sessions']),
+                    'generation_seconds': round(generation, 3),
+                    'reports': self._time_reports(data),
+                })
+            finally:
+                savepoint.close(rollback=True)
+                self.env.invalidate_all()
+        output = json.dumps({
+            'database': self.env.cr.dbname,
+            'date': fields.Datetime.now(),
+            'results': results,
+        }, indent=2, default=str)
+        _logger.info("Benchmark de reportes Pentalab:\n%s", output)
+        if os.environ.get('PENTALAB_BENCHMARK_OUTPUT'):
+            with open(os.environ['PENTALAB_BENCHMARK_OUTPUT'], 'w') as f:
+                f.write(output)
+        for result in results:
+            for name, timing in result['reports'].items():
+                self.assertFalse(timing['error'], f"{name} ({result['lines']} apuntes)")
+
+    # ---------------------------
+    # Generador
+    # ---------------------------
+    def _benchmark_companies(self, company_count):
+        companies = self.env.company
+        for index in range(1, company_count):
+            company = self.env['res.company'].create({
+                'name': f"Benchmark {index}",
+                'country_id': self.env.ref('base.ec').id,
+                'currency_id': self.env.ref('base.USD').id,
+            })
+            self.env['account.chart.template'].try_loading('ec', company=company, install_demo=False)
+            self.env.user.company_ids |= company
+            companies |= company
+        return companies
+
+    def _generate_ledger(self, line_count, company_count):
+        companies = self._benchmark_companies(company_count)
+        today = fields.Date.context_today(self.env.user)
+        data = {
+            'companies': companies,
+            'invoices': self.env['account.move'],
+            'sessions': self.env['cash.box.session'] if 'cash.box.session' in self.env else [],
+            'quant_count': 0,
+            'date_from': today - relativedelta(years=1),
+            'date_to': today,
+        }
+        invoices_per_company = max(1, line_count // LINES_PER_INVOICE // len(companies))
+        quants_per_company = max(1, int(line_count * QUANTS_PER_LINE) // len(companies))
+        for company in companies:
+            env = self.env(context=dict(self.env.context, allowed_company_ids=[company.id]))
+            partners = self._generate_partners(env, max(10, invoices_per_company // 20))
+            invoices = self._generate_invoices(env, partners, invoices_per_company, data['date_from'])
+            payments = self._generate_payments(env, invoices[::3])
+            self._generate_withholdings(env, invoices[1::5])
+            self._generate_statement_lines(env, partners, invoices_per_company // 10, data['date_from'])
+            data['quant_count'] += self._generate_quants(env, quants_per_company, today.replace(day=1))
+            data['sessions'] += self._generate_cash_box_sessions(env, payments)
+            data['invoices'] |= invoices
+        self.env.flush_all()
+        return data
+
+    def _generate_partners(self, env, count):
+        categories = env['res.partner.category'].create([
+            {'name': f"Benchmark {name}"} for name in ('Mayorista', 'Minorista', 'Distribuidor', 'Relacionada')
+        ])
+        return env['res.partner'].create([
+            {
+                'name': f"Cliente benchmark {index:06d}",
+                'category_id': [Command.set(random.sample(categories.ids, random.randint(1, 2)))],
+            }
+            for index in range(count)
+        ])
+
+    def _generate_invoices(self, env, partners, count, date_from):
+        journal = env['account.journal'].search([
+            ('type', '=', 'sale'),
+            ('company_id', '=', env.company.id),
+        ], order='l10n_latam_use_documents desc, id', limit=1)
+        document_type = env['l10n_latam.document.type'].search([
+            ('code', '=', '01'),
+            ('country_id.code', '=', 'EC'),
+        ], limit=1)
+        product = env['product.product'].create({'name': 'Producto benchmark', 'list_price': 10.0})
+        days = (fields.Date.context_today(env.user) - date_from).days or 1
+        invoices = env['account.move']
+        for batch_start in range(0, count, CREATE_BATCH_SIZE):
+            vals_list = []
+            for index in range(batch_start, min(count, batch_start + CREATE_BATCH_SIZE)):
+                vals = {
+                    'move_type': 'out_invoice',
+                    'journal_id': journal.id,
+                    'partner_id': random.choice(partners.ids),
+                    'invoice_date': date_from + timedelta(days=random.randrange(days)),
+                    'invoice_line_ids': [Command.create({
+                        'product_id': product.id,
+                        'quantity': random.randint(1, 20),
+                        'price_unit': round(random.uniform(5, 500), 2),
+                    })],
+                }
+                if journal.l10n_latam_use_documents:
+                    vals.update({
+                        'l10n_latam_document_type_id': document_type.id,
+                        'l10n_latam_document_number': f"001-001-{index + 1:09d}",
+                        'l10n_ec_authorization_number': ''.join(random.choices('0123456789', k=49)),
+                    })
+                vals_list.append(vals)
+            batch = env['account.move'].create(vals_list)
+            batch.action_post()
+            invoices |= batch
+        return invoices
+
+    def _generate_payments(self, env, invoices):
+        """Pagos por la mitad de cada factura, conciliados parcialmente."""
+        journal = env['account.journal'].search([
+            ('type', '=', 'bank'),
+            ('company_id', '=', env.company.id),
+        ], limit=1)
+        all_payments = env['account.payment']
+        for batch_start in range(0, len(invoices), CREATE_BATCH_SIZE):
+            batch = invoices[batch_start:batch_start + CREATE_BATCH_SIZE]
+            payments = env['account.payment'].create([
+                {
+                    'payment_type': 'inbound',
+                    'partner_type': 'customer',
+                    'partner_id': invoice.partner_id.id,
+                    'amount': round(invoice.amount_total / 2, 2),
+                    'date': invoice.invoice_date,
+                    'journal_id': journal.id,
+                }
+                for invoice in batch
+            ])
+            payments.action_post()
+            for invoice, payment in zip(batch, payments):
+                (invoice.line_ids | payment.move_id.line_ids).filtered(
+                    lambda line: line.account_id.account_type == 'asset_receivable'
+                ).reconcile()
+            all_payments |= payments
+        return all_payments
+
+    def _generate_withholdings(self, env, invoices):
+        """Retenciones de venta: asiento en el diario de retenciones contra la cuenta por cobrar."""
+        journal = env['account.journal'].search([
+            ('l10n_ec_withhold_type', '=', 'out_withhold'),
+            ('company_id', '=', env.company.id),
+        ], limit=1) if 'l10n_ec_withhold_type' in env['account.journal']._fields else None
+        if not journal or not journal.default_account_id:
+            return
+        for invoice in invoices:
+            receivable = invoice.line_ids.filtered(lambda line: line.account_id.account_type == 'asset_receivable')
+            amount = round(invoice.amount_untaxed * 0.01, 2)
+            withhold = env['account.move'].create({
+                'move_type': 'entry',
+                'journal_id': journal.id,
+                'date': invoice.invoice_date,
+                'partner_id': invoice.partner_id.id,
+                'line_ids': [
+                    Command.create({'account_id': journal.default_account_id.id, 'debit': amount,
+                                    'partner_id': invoice.partner_id.id, 'name': 'Retención benchmark'}),
+                    Command.create({'account_id': receivable.account_id.id, 'credit': amount,
+                                    'partner_id': invoice.partner_id.id, 'name': 'Retención benchmark'}),
+                ],
+            })
+            withhold.action_post()
+            (receivable | withhold.line_ids.filtered(lambda line: line.account_id == receivable.account_id)).reconcile()
+
+    def _generate_statement_lines(self, env, partners, count, date_from):
+        journal = env['account.journal'].search([
+            ('type', '=', 'bank'),
+            ('company_id', '=', env.company.id),
+        ], limit=1)
+        days = (fields.Date.context_today(env.user) - date_from).days or 1
+        env['account.bank.statement.line'].create([
+            {
+                'journal_id': journal.id,
+                'date': date_from + timedelta(days=random.randrange(days)),
+                'payment_ref': f"Movimiento benchmark {index}",
+                'partner_id': random.choice(partners.ids),
+                'amount': round(random.uniform(-1000, 1000), 2),
+            }
+            for index in range(count)
+        ])
+
+    def _generate_quants(self, env, count, in_date):
+        """Productos almacenables en un árbol de categorías de tres niveles, con un quant cada uno."""
+        warehouse = env['stock.warehouse'].search([('company_id', '=', env.company.id)], limit=1)
+        if not warehouse:
+            return 0
+        root = env['product.category'].create({'name': 'Benchmark'})
+        groups = env['product.category'].create([
+            {'name': f"Grupo {index}", 'parent_id': root.id} for index in range(5)
+        ])
+        leaves = env['product.category'].create([
+            {'name': f"{group.name} - Artículo {index}", 'parent_id': group.id}
+            for group in groups for index in range(5)
+        ])
+        for batch_start in range(0, count, CREATE_BATCH_SIZE):
+            products = env['product.product'].create([
+                {
+                    'name': f"Producto inventario {index:07d}",
+                    'default_code': f"BM{index:07d}",
+                    'is_storable': True,
+                    'categ_id': random.choice(leaves.ids),
+                    'list_price': round(random.uniform(5, 500), 2),
+                }
+                for index in range(batch_start, min(count, batch_start + CREATE_BATCH_SIZE))
+            ])
+            env['stock.quant'].create([
+                {
+                    'product_id': product.id,
+                    'location_id': warehouse.lot_stock_id.id,
+                    'quantity': random.randint(1, 200),
+                    'in_date': in_date + timedelta(days=random.randrange(28)),
+                }
+                for product in products
+            ])
+        return count
+
+    def _generate_cash_box_sessions(self, env, payments):
+        """Una caja con una sesión cerrada por día de pago; los pagos quedan en su sesión."""
+        if 'cash.box.session' not in env or not payments:
+            return []
+        company = env.company
+
+        def account(account_type):
+            return env['account.account'].search([
+                ('account_type', '=', account_type),
+                ('company_ids', 'in', company.id),
+            ], limit=1)
+
+        cash_journal = env['account.journal'].search([('type', '=', 'cash'), ('company_id', '=', company.id)], limit=1)
+        close_journal = env['account.journal'].search([('type', '=', 'general'), ('company_id', '=', company.id)], limit=1)
+        sri_payment = env['l10n_ec.sri.payment'].search([], limit=1)
+        if not (cash_journal and close_journal and sri_payment):
+            return env['cash.box.session']
+        analytic_plan = env['account.analytic.plan'].create({'name': 'Benchmark'})
+        cash_box = env['cash.box'].create({
+            'name': f"Caja benchmark {company.id}",
+            'code': f"BM{company.id}",
+            'company_id': company.id,
+            'journal_ids': [Command.set(payments.journal_id.ids)],
+            'session_seq_id': env.ref('l10n_ec_pos_penta.seq_cash_session').id,
+            'close_account_id': account('asset_cash').id,
+            'gain_account_id': account('income').id,
+            'loss_account_id': account('expense').id,
+            'close_journal_id': close_journal.id,
+            'cash_journal_id': cash_journal.id,
+            'l10n_ec_sri_payment_id': sri_payment.id,
+            'analytic_account_id': env['account.analytic.account'].create({
+                'name': 'Benchmark', 'plan_id': analytic_plan.id,
+            }).id,
+        })
+        payments_by_date = [
+            (payment_date, env['account.payment'].union(*day_payments))
+            for payment_date, day_payments in groupby(payments.sorted('date'), key=lambda payment: payment.date)
+        ]
+        sessions = env['cash.box.session'].create([
+            {
+                'cash_id': cash_box.id,
+                'state': 'closed',
+                'opening_date': fields.Datetime.to_datetime(payment_date),
+                'closing_date': fields.Datetime.to_datetime(payment_date) + timedelta(hours=10),
+            }
+            for payment_date, _day_payments in payments_by_date
+        ])
+        for session, (_payment_date, day_payments) in zip(sessions, payments_by_date):
+            day_payments.cash_session_id = session
+        return sessions
+
+    # ---------------------------
+    # Medición
+    # ---------------------------
+    def _time_call(self, func):
+        cr = self.env.cr
+        start, start_queries = time.perf_counter(), cr.sql_log_count
+        error = None
+        try:
+            with cr.savepoint():
+                func()
+        except Exception as e:  # se informa en el resultado, no corta el benchmark
+            _logger.exception("Falló la medición")
+            error = str(e)
+        return {
+            'seconds': round(time.perf_counter() - start, 3),
+            'queries': cr.sql_log_count - start_queries,
+            'error': error,
+        }
+
+    def _export_inventory(self, export_type, month, year):
+        """Descarga completa de la exportación de inventario por su ruta HTTP."""
+        response = self.url_open(
+            f'/inventory_export_xlsx?month={month}&year={year}&export_type={export_type}',
+            timeout=3600,
+        )
+        response.raise_for_status()
+        return len(response.content)
+
+    def _time_reports(self, data):
+        env = self.env
+        date_from, date_to = data['date_from'], data['date_to']
+        company = data['companies'][:1]
+        bank_journal = env['account.journal'].search([('type', '=', 'bank'), ('company_id', '=', company.id)], limit=1)
+        # La exportación lee la vista materializada: se refresca fuera de la medición
+        env['stock.quant.aggregated']._refresh()
+        timings = {
+            'report_sales_a1_wizard': lambda: env['report.sales.a1.wizard'].create({
+                'date_start': date_from, 'date_end': date_to, 'document_type': '0',
+            }).print_report(),
+            'report_uafe_wizard': lambda: env['report.uafe.wizard'].create({
+                'year': str(date_to.year), 'month': date_to.strftime('%m'), 'domain_uafe': 'customer',
+            }).print_report(),
+            'pentalab_report_cartera_reporte_wizard': lambda: env['pentalab.report.cartera.reporte.wizard'].create({
+                'date_end': date_to,
+            }).action_generate_cartera_reporte(),
+            'bank_recon_report_wizard': lambda: env['penta.bank.recon.report.wizard'].create({
+                'company_id': company.id, 'journal_id': bank_journal.id, 'date_from': date_from, 'date_to': date_to,
+            }).action_export_xlsx(),
+            'inventory_export_xlsx': lambda: self._export_inventory('in_date', date_to.month, date_to.year),
+            'inventory_export_xlsx_month_end': lambda: self._export_inventory('month_end', date_to.month, date_to.year),
+        }
+        if data['sessions']:
+            timings['cash_box_session_summary'] = lambda: [
+                session.get_payment_summary_by_journal() for session in data['sessions']
+            ]
+        return {name: self._time_call(func) for name, func in timings.items()}
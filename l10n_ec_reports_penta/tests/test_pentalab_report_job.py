@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tools import config
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestPentalabReportJob(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Job = cls.env['pentalab.report.job']
+        cls.wizard = cls.env['pentalab.report.cartera.reporte.wizard'].create({
+            'date_end': fields.Date.today(),
+        })
+
+    def _enqueue(self):
+        return self.Job._enqueue(self.wizard, 'action_generate_cartera_reporte')
+
+    def test_job_reports_progress(self):
+        job = self._enqueue()
+        progress = []
+        set_progress = type(self.Job)._set_progress
+
+        def record_progress(records, percent):
+            progress.append(percent)
+            return set_progress(records, percent)
+
+        with patch.object(type(self.Job), '_set_progress', record_progress), \
+                patch.object(self.env.cr, 'commit', lambda: None):
+            self.Job._cron_run_jobs()
+
+        job.invalidate_recordset()
+        self.assertEqual(job.state, 'done', job.error)
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(progress, [30, 50])
+        self.assertTrue(job.attachment_ids)
+
+    def test_claim_skips_running_lock_key(self):
+        first, second = self._enqueue(), self._enqueue()
+        self.assertEqual(first.lock_key, second.lock_key)
+
+        with patch.object(self.env.cr, 'commit', lambda: None):
+            claimed = self.Job._claim_next_job()
+            self.assertEqual(claimed, first)
+            # El otro job de la misma clave espera a que termine el primero
+            self.assertFalse(self.Job._claim_next_job())
+
+    def test_cron_runs_one_job_per_call(self):
+        first, second = self._enqueue(), self._enqueue()
+
+        with patch.object(self.env.cr, 'commit', lambda: None):
+            self.Job._cron_run_jobs()
+
+        (first | second).invalidate_recordset()
+        self.assertEqual(first.state, 'done', first.error)
+        self.assertEqual(second.state, 'pending')
+
+    def test_silent_running_job_fails(self):
+        job = self._enqueue()
+        now = fields.Datetime.now()
+        job.write({
+            'state': 'running',
+            'date_start': fields.Datetime.subtract(now, hours=2),
+            'date_heartbeat': fields.Datetime.subtract(now, hours=2),
+        })
+        alive = self._enqueue()
+        alive.write({'state': 'running', 'date_start': fields.Datetime.subtract(now, hours=2), 'date_heartbeat': now})
+
+        with patch.object(self.env.cr, 'commit', lambda: None), patch.dict(config.options, {'workers': 0}):
+            self.Job._fail_stale_jobs()
+
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual(alive.state, 'running')
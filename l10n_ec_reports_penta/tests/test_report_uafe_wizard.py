@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from dateutil.relativedelta import relativedelta
+
+from odoo import Command, fields
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestReportUafeWizard(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.date = fields.Date.today().replace(day=10)
+        cls.wizard = cls.env['report.uafe.wizard'].create({
+            'year': str(cls.date.year),
+            'month': f'{cls.date.month:02d}',
+        })
+
+    def _create_paid_invoices(self, count):
+        """Facturas de cliente pagadas con un asiento conciliado en el mes."""
+        receivable = self.company_data['default_account_receivable']
+        bank_account = self.company_data['default_journal_bank'].default_account_id
+        invoices = self.env['account.move']
+        for _i in range(count):
+            invoice = self.init_invoice('out_invoice', partner=self.partner_a, invoice_date=self.date,
+                                        amounts=[100.0], post=True)
+            payment = self.env['account.move'].create({
+                'move_type': 'entry',
+                'date': self.date,
+                'journal_id': self.company_data['default_journal_misc'].id,
+                'line_ids': [
+                    Command.create({'account_id': bank_account.id, 'debit': invoice.amount_total}),
+                    Command.create({'account_id': receivable.id, 'partner_id': self.partner_a.id,
+                                    'credit': invoice.amount_total}),
+                ],
+            })
+            payment.action_post()
+            (invoice + payment).line_ids.filtered(lambda line: line.account_id == receivable).reconcile()
+            invoices |= invoice
+        return invoices
+
+    def _count_transaction_queries(self, invoices):
+        self.env.invalidate_all()
+        start = self.cr.sql_log_count
+        with self.wizard._report_tmp_path() as path:
+            self.wizard._generate_detalle_transaccion({'invoices': invoices, 'payments_by_partner': {}}, path)
+        return self.cr.sql_log_count - start
+
+    def test_prefetch_transaction_data(self):
+        invoices = self._create_paid_invoices(2)
+        data = self.wizard._prefetch_transaction_data(invoices, self.date.replace(day=1), self.date)
+        for invoice in invoices:
+            self.assertEqual(len(data[invoice.id]['payments']), 1)
+            self.assertAlmostEqual(data[invoice.id]['payment_amount'], invoice.amount_total)
+
+    def test_prefetch_transaction_data_skips_exchange_difference(self):
+        """La diferencia de cambio de la conciliación no se cuenta como pago."""
+        currency = self.setup_other_currency('EUR', rates=[
+            ('2000-01-01', 2.0),
+            (fields.Date.to_string(self.date.replace(day=1)), 4.0),
+        ])
+        receivable = self.company_data['default_account_receivable']
+        bank_account = self.company_data['default_journal_bank'].default_account_id
+        invoice = self.init_invoice('out_invoice', partner=self.partner_a,
+                                    invoice_date=self.date.replace(day=1) - relativedelta(months=1),
+                                    amounts=[200.0], taxes=self.env['account.tax'], currency=currency, post=True)
+        payment = self.env['account.move'].create({
+            'move_type': 'entry',
+            'date': self.date,
+            'journal_id': self.company_data['default_journal_misc'].id,
+            'line_ids': [
+                Command.create({'account_id': bank_account.id, 'currency_id': currency.id,
+                                'amount_currency': invoice.amount_total}),
+                Command.create({'account_id': receivable.id, 'partner_id': self.partner_a.id,
+                                'currency_id': currency.id, 'amount_currency': -invoice.amount_total}),
+            ],
+        })
+        payment.action_post()
+        (invoice + payment).line_ids.filtered(lambda line: line.account_id == receivable).reconcile()
+        exchange_move = invoice.line_ids.full_reconcile_id.exchange_move_id
+        self.assertTrue(exchange_move, "La conciliación debe generar una diferencia de cambio")
+
+        data = self.wizard._prefetch_transaction_data(invoice, self.date.replace(day=1), self.date)[invoice.id]
+        self.assertEqual(data['payments'], [payment])
+        self.assertAlmostEqual(data['payment_amount'], -payment.line_ids.filtered(
+            lambda line: line.account_id == receivable).balance)
+
+    def test_transaction_queries_do_not_grow_with_invoices(self):
+        invoices = self._create_paid_invoices(6)
+        # Primera pasada para llenar las cachés del registro
+        self._count_transaction_queries(invoices[:3])
+        queries_n = self._count_transaction_queries(invoices[:3])
+        queries_2n = self._count_transaction_queries(invoices)
+        self.assertEqual(queries_n, queries_2n)
@@ -1,10 +1,8 @@
-import base64
-from io import BytesIO
 from odoo import models, fields, api
-import xlsxwriter
 from collections import defaultdict
 from datetime import date, datetime, time
 from odoo.exceptions import UserError
+from ..models.pentalab_report_run import profiled_report, report_phase, report_rows
 
 
 ACCOUNT_TYPE_SELECTION = [
@@ -13,7 +11,9 @@ ACCOUNT_TYPE_SELECTION = [
 
 class PentalabReportAntiguedadWizard(models.TransientModel):
     _name = 'pentalab.report.antiguedad.wizard'
+    _inherit = 'pentalab.report.output.mixin'
     _description = 'Wizard para Reporte Antigüedad'
+    _report_job_methods = ('action_generate_report',)
     
      # Opción 1: varias cuentas (reemplaza al antiguo account_id)
     account_ids = fields.Many2many(
@@ -50,6 +50,7 @@ class PentalabReportAntiguedadWizard(models.TransientModel):
             if not w.account_ids and not w.account_type:
                 raise UserError("Debes seleccionar cuentas específicas o un tipo de cuenta.")
 
+    @profiled_report
     def action_generate_report(self):
         self.ensure_one()
         # Validación: o cuentas o tipo (excluyentes)
@@ -62,57 +63,79 @@ class PentalabReportAntiguedadWizard(models.TransientModel):
         else:
             file_tag = dict(ACCOUNT_TYPE_SELECTION).get(self.account_type, 'tipo')
         cutoff_date = self.date or date.today()
-        if self.account_type == 'asset_receivable':
-            # Reporte base de antiguedad
-            report = self.env.ref('account_reports.aged_receivable_report')
-            # Restar 5 anios a la fecha de corte
-            date_from = cutoff_date.replace(year=cutoff_date.year - 5, month=1, day=1)
-            # Agg fecha de corte en las opciones del reporte
-            date_options = {
-                'date': {
-                    'mode': 'range',
-                    'date_from': date_from.strftime('%Y-%m-%d'),
-                    'date_to': cutoff_date.strftime('%Y-%m-%d'),
-                    'filter': 'custom',
-                }
+
+        self.file_name = f'reporte_antiguedad_{file_tag}.xlsx'
+        with self._report_tmp_path() as path:
+            self._write_antiguedad_xlsx(path, cutoff_date)
+            attachment = self._report_attach_file(path, self.file_name)
+        return self._report_download_action(attachment)
+
+    @api.model
+    def _get_aged_receivable_rows(self, company_ids, cutoff_date, no_commercial_only):
+        """Líneas de apunte del aged receivable: ``[{'aml_id', 'name', 'columns'}]``."""
+        # Reporte base de antiguedad
+        report = self.env.ref('account_reports.aged_receivable_report')
+        # Restar 5 anios a la fecha de corte
+        date_from = cutoff_date.replace(year=cutoff_date.year - 5, month=1, day=1)
+        # Agg fecha de corte en las opciones del reporte
+        date_options = {
+            'date': {
+                'mode': 'range',
+                'date_from': date_from.strftime('%Y-%m-%d'),
+                'date_to': cutoff_date.strftime('%Y-%m-%d'),
+                'filter': 'custom',
+            }
+        }
+        # Invocamos al reporte para que aplique sus filtros y lógica
+        options = report.get_options(previous_options=date_options)
+        # Setear compania en el options
+        options['companies'] = [
+            {
+                'id': c.id,
+                'name': c.name,
+                'currency_id': c.currency_id.id,
             }
-            # Invocamos al reporte para que aplique sus filtros y lógica
-            options = report.get_options(previous_options=date_options)
-            # Setear compania en el options
-            options['companies'] = [
+            for c in self.env['res.company'].browse(company_ids)
+        ]
+        # Option para expandir lineas
+        options['unfold_all'] = True
+        # Option para mostrar la cuenta contable
+        options['show_account'] = True
+        # Options de no relaciones
+        if no_commercial_only:
+            for opt in options.get('account_type', []):
+                if opt.get('id') == 'non_trade_receivable':
+                    opt['selected'] = True
+        rows = []
+        for line in self.env['pentalab.report.lines.service']._get_lines(report, options):
+            aml_line_id = line.get("id")
+            if aml_line_id and 'account.move.line' in aml_line_id:
+                rows.append({
+                    'aml_id': int(aml_line_id.split("account.move.line~")[1]),
+                    'name': line.get('name'),
+                    'columns': [c.get('no_format', c.get('name')) for c in line.get('columns', [])],
+                })
+        return rows
+
+    @profiled_report
+    def _write_antiguedad_xlsx(self, path, cutoff_date):
+        if self.account_type == 'asset_receivable':
+            company_ids = self.env.companies.ids
+            with report_phase('fetch'):
+                rows = self._get_aged_receivable_rows(company_ids, cutoff_date, self.no_commercial_only)
+                report_rows(len(rows))
+            # Obtener lineas del reporte y procesar datos
+            amls = self.env['account.move.line'].browse([row['aml_id'] for row in rows])
+            data_lines = [
                 {
-                    'id': c.id,
-                    'name': c.name,
-                    'currency_id': c.currency_id.id,
+                    'aml': aml,
+                    'name': row['name'],
+                    'columns': row['columns'],
                 }
-                for c in self.env.companies
+                for row, aml in zip(rows, amls)
             ]
-            # Option para expandir lineas
-            options['unfold_all'] = True
-            # Option para mostrar la cuenta contable
-            options['show_account'] = True
-            # Options de no relaciones
-            if self.no_commercial_only:
-                for opt in options.get('account_type', []):
-                    if opt.get('id') == 'non_trade_receivable':
-                        opt['selected'] = True
-            # Obtener lineas del reporte y procesar datos
-            data_lines = []
-            for line in report._get_lines(options):
-                aml = self.env['account.move.line']
-                aml_line_id = line.get("id")
-                if aml_line_id and 'account.move.line' in aml_line_id:
-                    aml_id = int(aml_line_id.split("account.move.line~")[1])
-                    aml = self.env['account.move.line'].browse(aml_id)
-                    cols = [c.get('no_format', c.get('name')) for c in line.get('columns', [])]
-                    data_lines.append({
-                        'aml': aml,
-                        'name': line.get('name'),
-                        'columns': cols,
-                    })
             # XLSX
-            output = BytesIO()
-            workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+            workbook = self._report_new_workbook(path)
             sheet = workbook.add_worksheet('Movimientos')
 
             header_format = workbook.add_format({'bold': True, 'bg_color': '#DCE6F1'})
@@ -128,7 +151,7 @@ class PentalabReportAntiguedadWizard(models.TransientModel):
             for col, title in enumerate(headers):
                 sheet.write(1, col, title, header_format)
             row = 2
-            for line in data_lines:
+            for line in self._report_progress_iter(data_lines, 30, 95):
                 # Obtener datos básicos
                 invoice_name_full = line['name']
                 invoice_number = invoice_name_full
@@ -203,12 +226,12 @@ class PentalabReportAntiguedadWizard(models.TransientModel):
             # Filtro según selección (el check 'commercial_only' NO afecta los filtros)
             if self.account_ids:
                 domain.append(('account_id', 'in', self.account_ids.ids))
-                file_tag = 'varias'
             else:
                 domain.append(('account_id.account_type', '=', self.account_type))
-                file_tag = dict(ACCOUNT_TYPE_SELECTION).get(self.account_type, 'tipo')
 
-            lines = self.env['account.move.line'].search(domain, order='date desc')
+            with report_phase('fetch'):
+                lines = self.env['account.move.line'].search(domain, order='date desc')
+                report_rows(len(lines))
 
             # Agrupar balances por matching_number
             matching_balances = defaultdict(float)
@@ -217,8 +240,7 @@ class PentalabReportAntiguedadWizard(models.TransientModel):
                     matching_balances[line.matching_number] += line.debit - line.credit
 
             # XLSX
-            output = BytesIO()
-            workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+            workbook = self._report_new_workbook(path)
             sheet = workbook.add_worksheet('Movimientos')
 
             header_format = workbook.add_format({'bold': True, 'bg_color': '#DCE6F1'})
@@ -235,7 +257,7 @@ class PentalabReportAntiguedadWizard(models.TransientModel):
                 sheet.write(1, col, title, header_format)
 
             row = 2
-            for line in lines:
+            for line in self._report_progress_iter(lines, 20, 95):
                 matching_number = line.matching_number or ''
                 importe = line.debit - line.credit
                 balance_emparejamiento = matching_balances.get(matching_number, 0.0) if matching_number else 0.0
@@ -288,14 +310,3 @@ class PentalabReportAntiguedadWizard(models.TransientModel):
                     row += 1
 
         workbook.close()
-        output.seek(0)
-        file_data = base64.b64encode(output.read())
-
-        self.file_name = f'reporte_antiguedad_{file_tag}.xlsx'
-        self.file_data = file_data
-
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f"/web/content/?model={self._name}&id={self.id}&field=file_data&filename_field=file_name&download=true",
-            'target': 'new',
-        }
\ No newline at end of file
@@ -1,59 +1,221 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
-from io import BytesIO
-import base64
 from datetime import date, datetime
 import statistics
-import xlsxwriter
 from odoo.addons.penta_base.reports.xlsx_formats import get_xlsx_formats
 import re
 from collections import OrderedDict
+from itertools import chain
+from ..models.pentalab_report_run import profiled_report, report_phase, report_rows
 
 
 class PentalabReportCarteraReporteWizard(models.TransientModel):
     _name = "pentalab.report.cartera.reporte.wizard"
+    _inherit = "pentalab.report.output.mixin"
     _description = "Wizard para Reporte de Cartera (formato Reporte / no EBI)"
+    _report_job_methods = ('action_generate_cartera_reporte',)
 
     date_end = fields.Date(string="Fecha hasta", required=True)
+    parallel_companies = fields.Boolean(
+        string="Calcular por compañía en paralelo",
+        help="Calcula la cartera de cada compañía por separado y en paralelo; "
+             "útil con muchas compañías seleccionadas. Cada compañía es una sola consulta "
+             "SQL, que corre en un hilo con su propio cursor: acelera mientras el trabajo "
+             "esté en la base de datos, no el armado del archivo, que sigue en un solo núcleo.",
+    )
 
     file_name = fields.Char(string="Nombre de archivo", readonly=True)
     file_data = fields.Binary(string="Archivo", readonly=True)
 
+    @api.model
+    def _get_cartera_payment_number(self, item):
+        """Número de cuota de la línea ('#<n>' en nombre o referencia), 1 por defecto."""
+        txt = f"{item['name'] or ''} {item['ref'] or ''}"
+        m = re.search(r'#\s*(\d+)', txt)
+        return int(m.group(1)) if m else 1
+
+    def _get_cartera_items(self, cutoff_date, company_ids):
+        """
+        Líneas por cobrar abiertas a la fecha de corte, resueltas en SQL.
+        Replica el criterio del aged receivable: líneas publicadas de cuentas
+        asset_receivable cuyo saldo (considerando solo conciliaciones con
+        contraparte hasta la fecha de corte) es distinto de cero.
+        Para cada línea se devuelve el monto pagado hasta el corte y la fecha
+        del último pago, sin recorrer matched_debit_ids / matched_credit_ids.
+        """
+        if not company_ids:
+            return []
+        date_from = cutoff_date.replace(year=cutoff_date.year - 10, month=1, day=1)
+        self.env['account.move.line'].flush_model()
+        self.env['account.partial.reconcile'].flush_model()
+        self.env.cr.execute("""
+            WITH candidate AS (
+                SELECT aml.id
+                  FROM account_move_line aml
+                  JOIN account_account account ON account.id = aml.account_id
+                 WHERE account.account_type = 'asset_receivable'
+                   AND aml.parent_state = 'posted'
+                   AND aml.company_id IN %(company_ids)s
+                   AND aml.date BETWEEN %(date_from)s AND %(date_to)s
+            ),
+            partial_side AS (
+                SELECT candidate.id AS line_id,
+                       part.amount AS debit_amount,
+                       0.0 AS credit_amount,
+                       counterpart.date
+                  FROM candidate
+                  JOIN account_partial_reconcile part ON part.debit_move_id = candidate.id
+                  JOIN account_move_line counterpart ON counterpart.id = part.credit_move_id
+                 WHERE counterpart.date <= %(date_to)s
+                UNION ALL
+                SELECT candidate.id AS line_id,
+                       0.0 AS debit_amount,
+                       part.amount AS credit_amount,
+                       counterpart.date
+                  FROM candidate
+                  JOIN account_partial_reconcile part ON part.credit_move_id = candidate.id
+                  JOIN account_move_line counterpart ON counterpart.id = part.debit_move_id
+                 WHERE counterpart.date <= %(date_to)s
+            ),
+            paid AS (
+                SELECT line_id,
+                       SUM(debit_amount) AS debit_amount,
+                       SUM(credit_amount) AS credit_amount,
+                       MAX(date) AS last_payment_date
+                  FROM partial_side
+              GROUP BY line_id
+            )
+            SELECT aml.id,
+                   aml.name,
+                   aml.ref,
+                   aml.balance,
+                   aml.date,
+                   aml.date_maturity,
+                   aml.company_id,
+                   aml.partner_id,
+                   aml.move_id,
+                   aml.account_id,
+                   partner.name AS partner_name,
+                   COALESCE(paid.debit_amount, 0.0) + COALESCE(paid.credit_amount, 0.0) AS paid_amount,
+                   paid.last_payment_date
+              FROM candidate
+              JOIN account_move_line aml ON aml.id = candidate.id
+         LEFT JOIN paid ON paid.line_id = aml.id
+         LEFT JOIN res_partner partner ON partner.id = aml.partner_id
+             WHERE ROUND(aml.balance - COALESCE(paid.debit_amount, 0.0) + COALESCE(paid.credit_amount, 0.0), 2) != 0
+          ORDER BY partner.name, aml.partner_id, aml.date_maturity, aml.id
+        """, {
+            'company_ids': tuple(company_ids),
+            'date_from': date_from,
+            'date_to': cutoff_date,
+        })
+        return self.env.cr.dictfetchall()
+
+    @api.model
+    def _get_cartera_company_items(self, company_id, cutoff_date):
+        return self._get_cartera_items(cutoff_date, [company_id])
+
+    @api.model
+    def _get_cartera_items_parallel(self, cutoff_date, company_ids):
+        """``_get_cartera_items`` por compañía en paralelo, unido en el mismo orden."""
+        chunks = self._report_map_companies('_get_cartera_company_items', company_ids, cutoff_date)
+        items = list(chain.from_iterable(chunks))
+        ranks = self._report_partner_ranks(it['partner_id'] for it in items)
+        return sorted(items, key=lambda it: (
+            ranks.get(it['partner_id'], len(ranks)),
+            it['date_maturity'] is None,
+            it['date_maturity'] or date.min,
+            it['id'],
+        ))
+
+    def _get_cartera_installments(self, move_ids):
+        """
+        Para cada comprobante devuelve (total de cuotas detectado, última cuota pagada)
+        leyendo en una sola consulta las líneas por cobrar de todos los movimientos.
+        - Total: 'n/m' o 'n de m' -> m; '#<n>' -> n (solo líneas sin display_type,
+          igual que el cálculo anterior).
+        - Última cuota pagada: mayor '#<n>' de las líneas con monto pagado > 0.
+        """
+        if not move_ids:
+            return {}, {}
+        self.env.cr.execute("""
+            SELECT aml.move_id,
+                   aml.name,
+                   aml.ref,
+                   aml.display_type,
+                   aml.balance,
+                   aml.amount_residual
+              FROM account_move_line aml
+              JOIN account_account account ON account.id = aml.account_id
+             WHERE aml.move_id IN %s
+               AND account.account_type = 'asset_receivable'
+        """, [tuple(move_ids)])
+        totals_by_move = {}
+        last_paid_by_move = {}
+        for line in self.env.cr.dictfetchall():
+            move_id = line['move_id']
+            text = f"{line['name'] or ''} {line['ref'] or ''}"
+            if not line['display_type']:
+                max_total = totals_by_move.get(move_id, 0)
+                m1 = re.search(r'(\d+)\s*/\s*(\d+)', text)
+                if m1:
+                    max_total = max(max_total, int(m1.group(2)))
+                m2 = re.search(r'(\d+)\s*de\s*(\d+)', text)
+                if m2:
+                    max_total = max(max_total, int(m2.group(2)))
+                for n in re.findall(r'#\s*(\d+)', text):
+                    max_total = max(max_total, int(n))
+                totals_by_move[move_id] = max_total
+
+            original = abs(line['balance'] or 0.0)
+            residual = abs(line['amount_residual'] or 0.0)
+            paid = max(0.0, min(original, original - residual))
+            if paid > 0.0001:
+                m = re.search(r'#\s*(\d+)', text.lower())
+                if m:
+                    last_paid_by_move[move_id] = max(last_paid_by_move.get(move_id, 0), int(m.group(1)))
+        return totals_by_move, last_paid_by_move
+
+    def _get_cartera_warehouses(self):
+        """
+        Almacenes indexados por (l10n_ec_emission, l10n_ec_entity), en el orden
+        de búsqueda habitual, para resolver el almacén de cada factura sin una
+        búsqueda por línea.
+        """
+        warehouses = {}
+        for wh in self.env['stock.warehouse'].search([
+            ('l10n_ec_emission', '!=', False),
+            ('l10n_ec_entity', '!=', False),
+        ]):
+            warehouses.setdefault((wh.l10n_ec_emission, wh.l10n_ec_entity), (wh.id, wh.name))
+        return warehouses
+
+    @profiled_report
     def action_generate_cartera_reporte(self):
         self.ensure_one()
         cutoff_date = self.date_end or date.today()
 
-        report = self.env.ref('account_reports.aged_receivable_report')
-        date_from = cutoff_date.replace(year=cutoff_date.year - 10, month=1, day=1)
-        options = report.get_options(previous_options={
-            'date': {
-                'mode': 'range',
-                'date_from': date_from.strftime('%Y-%m-%d'),
-                'date_to': cutoff_date.strftime('%Y-%m-%d'),
-                'filter': 'custom',
-            }
-        })
-
-        options['companies'] = [
-            {'id': c.id, 'name': c.name, 'currency_id': c.currency_id.id}
-            for c in self.env.companies
-        ]
-        options['unfold_all'] = True
-        options['show_account'] = True
-
-        # === Recolectar líneas del aged (usamos la línea aml como pivote) ===
-        items = []
-        for line in report._get_lines(options):
-            lid = line.get("id")
-            if lid and 'account.move.line' in lid:
-                aml_id = int(lid.split("account.move.line~")[1])
-                aml = self.env['account.move.line'].browse(aml_id)
-                items.append({'aml': aml})
+        # === Recolectar líneas abiertas a la fecha de corte ===
+        if self.parallel_companies and len(self.env.companies) > 1:
+            items = self._get_cartera_items_parallel(cutoff_date, self.env.companies.ids)
+        else:
+            items = self._get_cartera_items(cutoff_date, self.env.companies.ids)
+        report_rows(len(items))
+        self._report_progress(30)
+
+        partners = self.env['res.partner'].browse({it['partner_id'] for it in items if it['partner_id']})
+        moves = self.env['account.move'].browse({it['move_id'] for it in items})
+        accounts = self.env['account.account'].browse({it['account_id'] for it in items})
+        companies = self.env['res.company'].browse({it['company_id'] for it in items})
+        partner_by_id = {p.id: p for p in partners}
+        move_by_id = {m.id: m for m in moves}
+        account_by_id = {a.id: a for a in accounts}
+        company_by_id = {c.id: c for c in companies}
 
         all_cat_map = OrderedDict()  # key: nombre lower -> valor mostrado (primera forma vista)
         for it in items:
-            partner = it['aml'].partner_id
+            partner = partner_by_id.get(it['partner_id'])
             if not partner or not partner.category_id:
                 continue
             for cat in partner.category_id:
@@ -66,62 +228,47 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
         all_cat_items = sorted(all_cat_map.items(), key=lambda kv: kv[1].lower())
         dynamic_category_headers = [disp_name for _, disp_name in all_cat_items]
 
-        # === Helpers ===
-        def _days_between(d1, d2):
-            if d1 and d2:
-                return (fields.Date.to_date(d1) - fields.Date.to_date(d2)).days
-            return 0
-
-        def _get_line_payment_number(aml):
-            txt = f"{aml.name or ''} {(getattr(aml, 'ref', '') or '')}"
-            m = re.search(r'#\s*(\d+)', txt)
-            return int(m.group(1)) if m else 1
-
-        def _line_residual_amount(aml):
-            return abs(aml.amount_residual or 0.0)
-
-        def _original_line_amount(aml):
-            if aml is None:
-                return 0.0
-            return abs(aml.balance if aml.balance is not None else (aml.debit - aml.credit))
-
-        def _line_paid_amount(aml):
-            original = _original_line_amount(aml)
-            residual = _line_residual_amount(aml)
-            paid = original - residual
-            if paid < 0:
-                paid = 0.0
-            if paid > original:
-                paid = original
-            return paid
-
-        def _count_total_installments_for_move(move):
-            """
-            Total SIN usar términos de pago.
-            Escanea TODAS las líneas receivable del move:
-            - 'n/m' o 'n de m' -> usa m como total
-            - '#<n>'           -> n como candidato a total
-            """
-            if not move:
-                return 1
-            max_total = 0
-            for l in move.line_ids:
-                if not (l.account_id and l.account_id.account_type == 'asset_receivable') or l.display_type:
-                    continue
-                text = f"{l.name or ''} {(getattr(l, 'ref', '') or '')}"
-                m1 = re.search(r'(\d+)\s*/\s*(\d+)', text)
-                if m1:
-                    max_total = max(max_total, int(m1.group(2)))
-                m2 = re.search(r'(\d+)\s*de\s*(\d+)', text)
-                if m2:
-                    max_total = max(max_total, int(m2.group(2)))
-                for n in re.findall(r'#\s*(\d+)', text):
-                    try:
-                        max_total = max(max_total, int(n))
-                    except Exception:
-                        pass
-            return max_total or 1
+        warehouses = self._get_cartera_warehouses()
+        totals_by_move_db, last_paid_by_move = self._get_cartera_installments(list(move_by_id))
+
+        # === Precompute totales por move ===
+        # 1) Máximo REF_CUOTA visto en los ITEMS del aged
+        max_cuota_from_items = {}
+        for it in items:
+            n = self._get_cartera_payment_number(it)  # solo '#<n>'
+            if n > max_cuota_from_items.get(it['move_id'], 0):
+                max_cuota_from_items[it['move_id']] = n
+
+        # 2) Total final por move = max(total en asientos, max REF_CUOTA visto en items)
+        totals_by_move = {}
+        for mv_id in move_by_id:
+            totals_by_move[mv_id] = max(totals_by_move_db.get(mv_id) or 1, max_cuota_from_items.get(mv_id, 1))
+
+        self._report_progress(50)
 
+        # === XLSX ===
+        self.file_name = f"cartera_reporte_{cutoff_date.strftime('%Y%m%d')}.xlsx"
+        with self._report_tmp_path() as path:
+            self._write_cartera_xlsx(
+                path, cutoff_date, items,
+                all_cat_items=all_cat_items,
+                dynamic_category_headers=dynamic_category_headers,
+                partner_by_id=partner_by_id,
+                move_by_id=move_by_id,
+                account_by_id=account_by_id,
+                company_by_id=company_by_id,
+                totals_by_move=totals_by_move,
+                last_paid_by_move=last_paid_by_move,
+                warehouses=warehouses,
+            )
+            attachment = self._report_attach_file(path, self.file_name)
+        return self._report_download_action(attachment)
+
+    @report_phase('xlsx')
+    def _write_cartera_xlsx(self, path, cutoff_date, items, all_cat_items, dynamic_category_headers,
+                            partner_by_id, move_by_id, account_by_id, company_by_id,
+                            totals_by_move, last_paid_by_move, warehouses):
+        # === Helpers ===
         def _warehouse_from_invoice(move):
             """
             Extrae '002-001-...' desde move.name y busca el warehouse:
@@ -141,14 +288,7 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
             emission = m.group(1)  # punto de emisión
             entity = m.group(2)    # entidad emisora
 
-            domain = [
-                ('l10n_ec_emission', '=', entity),
-                ('l10n_ec_entity', '=', emission),
-            ]
-
-            wh = self.env['stock.warehouse'].search(domain, limit=1)
-
-            return (wh.id, wh.name) if wh else (None, None)
+            return warehouses.get((entity, emission), (None, None))
 
         def _bucket_edad_vencida(dias):
             """Clasifica los días vencidos en rangos solicitados.
@@ -174,48 +314,6 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
                 return 'Mas de 5 anios'
             return f'Mas de {years} anios'
 
-        def _paid_until_cutoff(aml, cutoff_date_local):
-            """
-            Suma únicamente las conciliaciones (account.partial.reconcile) cuya
-            contraparte tenga fecha <= cutoff_date.
-            Evita doble conteo uniendo matched_debit_ids y matched_credit_ids.
-            """
-            if not aml:
-                return 0.0
-            partials = set(aml.matched_debit_ids) | set(aml.matched_credit_ids)
-            total = 0.0
-            for pr in partials:
-                # Determina la línea contraparte del pago/cobro
-                if pr.debit_move_id.id == aml.id:
-                    counter_ml = pr.credit_move_id
-                else:
-                    counter_ml = pr.debit_move_id
-                pay_date = counter_ml.date or counter_ml.move_id.date
-                if pay_date and fields.Date.to_date(pay_date) <= fields.Date.to_date(cutoff_date_local):
-                    total += float(pr.amount or 0.0)
-            # No exceder el original
-            return min(total, _original_line_amount(aml))
-
-        def _residual_as_of(aml, cutoff_date_local):
-            original = _original_line_amount(aml)
-            paid = _paid_until_cutoff(aml, cutoff_date_local)
-            return max(0.0, original - paid)
-
-        def _last_payment_date_until_cutoff(aml, cutoff_date_local):
-            """
-            Última fecha de pago de ESTA línea, pero solo hasta cutoff_date.
-            """
-            dates = []
-            if not aml:
-                return None
-            partials = set(aml.matched_debit_ids) | set(aml.matched_credit_ids)
-            for pr in partials:
-                counter_ml = pr.credit_move_id if pr.debit_move_id.id == aml.id else pr.debit_move_id
-                d = counter_ml.date or counter_ml.move_id.date
-                if d and fields.Date.to_date(d) <= fields.Date.to_date(cutoff_date_local):
-                    dates.append(fields.Date.to_date(d))
-            return max(dates) if dates else None
-
         def _pick_cliente_category(partner):
             """
             Devuelve (id, name) de la categoría que cumpla:
@@ -243,33 +341,6 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
             # 3) sin match
             return (None, None)
 
-        def _last_paid_installment_number(move):
-            """
-            Retorna la mayor cuota pagada (int) del comprobante 'move', buscando patrones '#<num>'
-            en las líneas por cobrar (asset_receivable) que tengan monto pagado > 0.
-            Si no encuentra nada, retorna 0.
-            """
-            if not move:
-                return 0
-            max_num = 0
-            for l in move.line_ids:
-                if l.account_id and l.account_id.account_type == 'asset_receivable':
-                    # pagado en la línea (usamos helper existente)
-                    original = abs(l.balance if l.balance is not None else (l.debit - l.credit))
-                    residual = abs(l.amount_residual or 0.0)
-                    paid = max(0.0, min(original, original - residual))
-                    if paid > 0.0001:
-                        txt = f"{l.name or ''} {(getattr(l, 'ref', '') or '')}".lower()
-                        m = re.search(r'#\s*(\d+)', txt)
-                        if m:
-                            try:
-                                num = int(m.group(1))
-                                if num > max_num:
-                                    max_num = num
-                            except Exception:
-                                pass
-            return max_num
-
         def _ref_cod_pais_value(partner):
             """
             Devuelve el código de país para REF_COD_PAIS en modo 'Reporte':
@@ -280,8 +351,7 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
                 return 'ND'
             return code
 
-        def _map_transaccion(aml_local):
-            mv = aml_local.move_id
+        def _map_transaccion(mv):
             doc_name = (mv.l10n_latam_document_type_id.name or '').strip().lower() if mv.l10n_latam_document_type_id else ''
 
             # 1 = Factura cliente
@@ -303,49 +373,7 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
             # Todo lo demás se trata como factura (por defecto)
             return 1
 
-        def _last_payment_date_line(aml):
-            dates = []
-            if not aml:
-                return None
-            for part in (aml.matched_credit_ids or self.env['account.partial.reconcile']):
-                d = part.credit_move_id.date or part.credit_move_id.move_id.date
-                if d:
-                    dates.append(fields.Date.to_date(d))
-            for part in (aml.matched_debit_ids or self.env['account.partial.reconcile']):
-                d = part.debit_move_id.date or part.debit_move_id.move_id.date
-                if d:
-                    dates.append(fields.Date.to_date(d))
-            return max(dates) if dates else None
-
-        # === Precompute totales por move ===
-        # 1) Máximo REF_CUOTA visto en los ITEMS del aged
-        max_cuota_from_items = {}
-        for it in items:
-            aml = it['aml']
-            mv = aml.move_id
-            if not mv:
-                continue
-            n = _get_line_payment_number(aml)  # solo '#<n>'
-            prev = max_cuota_from_items.get(mv.id, 0)
-            if n > prev:
-                max_cuota_from_items[mv.id] = n
-
-        # 2) Total detectado en asientos (líneas receivable del move)
-        totals_by_move_db = {}
-        for it in items:
-            aml = it['aml']
-            mv = aml.move_id
-            if mv and mv.id not in totals_by_move_db:
-                totals_by_move_db[mv.id] = _count_total_installments_for_move(mv)
-
-        # 3) Total final por move = max(total_db, max REF_CUOTA visto en items)
-        totals_by_move = {}
-        for mv_id in set(list(totals_by_move_db.keys()) + list(max_cuota_from_items.keys())):
-            totals_by_move[mv_id] = max(totals_by_move_db.get(mv_id, 1), max_cuota_from_items.get(mv_id, 1))
-
-        # === XLSX ===
-        output = BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+        workbook = self._report_new_workbook(path)
         formats = get_xlsx_formats(workbook)
         sheet = workbook.add_worksheet('Cartera')
 
@@ -418,14 +446,14 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
 
         row = 2
         for it in items:
-            aml = it['aml']
-            partner = aml.partner_id
-            move = aml.move_id
-            account = aml.account_id
+            partner = partner_by_id.get(it['partner_id'])
+            move = move_by_id.get(it['move_id'])
+            account = account_by_id.get(it['account_id'])
+            company = company_by_id.get(it['company_id'])
+            balance = float(it['balance'] or 0.0)
 
             # Fechas base
-            fecha_venc_linea = aml.date_maturity or aml.date
-            fecha_venc_factura = move.invoice_date_due if move else None
+            fecha_venc_linea = it['date_maturity'] or it['date']
             fecha_factura = move.date if move else None
 
             # Cálculos
@@ -440,23 +468,22 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
             ref_periodicidad_days = 0
             if fecha_factura and fecha_venc_linea:
                 ref_periodicidad_days = abs((fecha_factura - fecha_venc_linea).days)
-            cuota_num = _get_line_payment_number(aml)  # '#<n>' de la línea
-            trans_val = _map_transaccion(aml)
+            cuota_num = self._get_cartera_payment_number(it)  # '#<n>' de la línea
+            trans_val = _map_transaccion(move)
             total_cuotas = 0 if trans_val == 7 else totals_by_move.get(move.id, 1)
 
-            # 1) Base (como ya lo tienes)
-            valor_original = _original_line_amount(aml)           # absoluto para cálculos
-            pagado_asof = _paid_until_cutoff(aml, cutoff_date)    # absoluto
-            saldo_asof = _residual_as_of(aml, cutoff_date)        # absoluto
+            # 1) Base: pagado hasta la fecha de corte, sin exceder el original
+            valor_original = abs(balance)                                  # absoluto para cálculos
+            pagado_asof = min(float(it['paid_amount'] or 0.0), valor_original)  # absoluto
+            saldo_asof = max(0.0, valor_original - pagado_asof)            # absoluto
 
             # 2) Signo del documento (usa el balance REAL de la línea)
-            sign = 1 if float(aml.balance or 0.0) >= 0 else -1
+            sign = 1 if balance >= 0 else -1
 
             # 3) Versiones firmadas para el reporte
-            ref_valor_signed = float(aml.balance or 0.0)          # ya viene con su signo real
             ref_cancelado_signed = sign * float(pagado_asof)
             ref_saldo_signed = sign * float(saldo_asof)           # saldo a la fecha de corte
-            last_pay = _last_payment_date_until_cutoff(aml, cutoff_date)
+            last_pay = it['last_payment_date']
 
             # Saldos por estado
             days_remaining = (fecha_venc_linea - cutoff_date).days if fecha_venc_linea else 0
@@ -466,7 +493,7 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
             tipo_label = 'VENCIDO' if es_vencido else 'POR VENCER'
 
             col = 0
-            sheet.write(row, col, (aml.company_id.token_ebi if hasattr(aml.company_id, 'token_ebi') and aml.company_id.token_ebi else 'ND'), formats['border']); col += 1
+            sheet.write(row, col, (company.token_ebi if hasattr(company, 'token_ebi') and company.token_ebi else 'ND'), formats['border']); col += 1
             sheet.write(row, col, cutoff_date.strftime('%d-%m-%Y'), formats['date']); col += 1
             sheet.write_number(row, col, float(partner.credit_limit or 0.0), formats['number']); col += 1
 
@@ -508,7 +535,7 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
             sheet.write_number(row, col, int(cuota_num), formats['border']); col += 1
             sheet.write_number(row, col, int(total_cuotas), formats['border']); col += 1
 
-            sheet.write_number(row, col, float(aml.balance or 0.0), formats['number']); col += 1  # REF_VALOR (ORIGINAL)
+            sheet.write_number(row, col, balance, formats['number']); col += 1                    # REF_VALOR (ORIGINAL)
             sheet.write_number(row, col, ref_cancelado_signed, formats['number']); col += 1       # REF_CANCELADO
             sheet.write_number(row, col, ref_saldo_signed, formats['number']); col += 1           # REF_SALDO
             sheet.write_number(row, col, 0.0, formats['number']); col += 1                        # REF_DOCUMENTADO
@@ -563,7 +590,7 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
             garantia_txt = getattr(partner, 'guarantee_note', False) or 'ND'
             sheet.write(row, col, garantia_txt, formats['border']); col += 1  # GARANTIA_CONTACTO
 
-            ultima_cuota = _last_paid_installment_number(move)
+            ultima_cuota = last_paid_by_move.get(move.id, 0)
             sheet.write_number(row, col, int(ultima_cuota), formats['border']); col += 1  # ULTIMA_CUOTA_PAGADA
 
             partner_cat_keys = set()
@@ -683,12 +710,3 @@ class PentalabReportCarteraReporteWizard(models.TransientModel):
         ws_src.hide()
         ws_out.activate()
         workbook.close()
-        output.seek(0)
-        self.file_data = base64.b64encode(output.read())
-        self.file_name = f"cartera_reporte_{cutoff_date.strftime('%Y%m%d')}.xlsx"
-
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f"/web/content/?model={self._name}&id={self.id}&field=file_data&filename_field=file_name&download=true",
-            'target': 'new',
-        }
@@ -1,16 +1,16 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields
-import base64
-import io
-from odoo.tools.misc import xlsxwriter
 from odoo.addons.penta_base.reports.xlsx_formats import get_xlsx_formats
 from odoo.tools import format_invoice_number
 from openpyxl.utils import get_column_letter
+from ..models.pentalab_report_run import profiled_report, report_phase, report_rows
 
 
 class ReportPurchaseA2Wizard(models.TransientModel):
     _name = 'report.purchase.a2.wizard'
+    _inherit = 'pentalab.report.output.mixin'
     _description = 'Wizard to generate report sales A1'
+    _report_job_methods = ('print_report',)
 
     def _get_selection_opcions(self):
         options = [('0', 'Todos')]
@@ -23,6 +23,7 @@ class ReportPurchaseA2Wizard(models.TransientModel):
     date_end = fields.Date(string='Hasta', required=True)
     document_type = fields.Selection(selection=lambda self: self._get_selection_opcions(), default='0', string='Tipo documento', required=True)
     
+    @report_phase('fetch')
     def _get_invoices_data(self):
         # Generar data para reporte
         inv_domain = [
@@ -35,29 +36,21 @@ class ReportPurchaseA2Wizard(models.TransientModel):
         if self.document_type != '0':
             inv_domain.append(('l10n_latam_document_type_id', '=', int(self.document_type)))
         invoices = self.env['account.move'].search(inv_domain, order='invoice_date asc')
+        report_rows(len(invoices))
         return invoices
     
+    @profiled_report
     def print_report(self):
-        report = self.generate_xlsx_report()
         today = fields.Date.context_today(self)
         file_name = f"ComprasA2_{today.strftime('%d_%m_%Y')}.xlsx"
-        attachment = self.env['ir.attachment'].create({
-            'name': file_name,
-            'type': 'binary',
-            'datas': base64.b64encode(report),
-            'res_model': self._name,
-            'res_id': self.id,
-            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        })
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
+        with self._report_tmp_path() as path:
+            self.generate_xlsx_report(path)
+            attachment = self._report_attach_file(path, file_name)
+        return self._report_download_action(attachment)
     
-    def generate_xlsx_report(self):
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    @profiled_report
+    def generate_xlsx_report(self, path):
+        workbook = self._report_new_workbook(path)
         worksheet = workbook.add_worksheet("Compras A2")
         # Formatos
         formats = get_xlsx_formats(workbook)
@@ -110,22 +103,19 @@ class ReportPurchaseA2Wizard(models.TransientModel):
         worksheet.merge_range('A4:B4', 'Reporte:')
         worksheet.write('C4', 'COMPRAS A2')
         row = 5
-        # Mapear titulos
+        # Mapear titulos (dos filas de alto; en modo constant_memory las filas se
+        # escriben en orden, por lo que no se combinan celdas entre filas)
         for col, header in enumerate(headers):
-            worksheet.merge_range(row, col, row + 1, col, header, formats['header_bg'])
+            worksheet.write(row, col, header, formats['header_bg'])
         row += 1
+        for col in range(len(headers)):
+            worksheet.write_blank(row, col, None, formats['header_bg'])
         # Mapear datos
         cont = 1
-        for invoice in invoices:
-            # Obtenemos tags (invoice_line_ids)
-            unique_tag_groups = []
-            for line in invoice.invoice_line_ids:
-                tag_names = sorted(line.tax_tag_ids.mapped('name'))
-                if tag_names and tag_names not in unique_tag_groups:
-                    unique_tag_groups.append(tag_names)
-            # Si no hay tags, ponemos una lista con un solo elemento '' para que haga una fila igual
-            tags_to_iterate = [", ".join(tags) for tags in unique_tag_groups] if unique_tag_groups else ['']
-            for tag_name in tags_to_iterate:
+        # Bases e impuestos por factura, etiquetas y grupo de impuestos
+        amounts_by_invoice = invoices._get_report_tax_group_amounts(tax_groups)
+        for invoice in self._report_progress_iter(invoices, 10, 95):
+            for tag_name, base_per_group, iva_per_group in amounts_by_invoice[invoice.id]:
                 row += 1
                 worksheet.write(row, 0, cont, formats['center'])
                 worksheet.write(row, 1, invoice.partner_id.l10n_latam_identification_type_id.name or '', formats['center'])
@@ -143,38 +133,11 @@ class ReportPurchaseA2Wizard(models.TransientModel):
                 worksheet.write(row, 8, format_invoice_number(invoice.name) or '', formats['border'])
                 worksheet.write(row, 9, invoice.l10n_ec_authorization_number or '', formats['border'])
                 worksheet.write(row, 10, invoice.invoice_date.strftime("%d/%m/%Y") or '', formats['border'])
-                # Mapear impuestos
-                base_per_group = {tg.id: 0.0 for tg in tax_groups}
-                iva_per_group = {tg.id: 0.0 for tg in tax_groups}
-                # Buscar todas las líneas que contienen este mismo tag
-                tag_lines = invoice.invoice_line_ids.filtered(
-                    lambda l, tag=tag_name: ", ".join(sorted(l.tax_tag_ids.mapped('name'))) == tag
-                )
-                for line in tag_lines:
-                    # Para cada impuesto en la línea
-                    for tax in line.tax_ids:
-                        tax_group_id = tax.tax_group_id.id
-                        if tax_group_id in tax_groups.ids:
-                            discounted_price = line.price_unit * (1 - (line.discount / 100.0))
-                            # Calcular los montos (base e impuesto)
-                            taxes_res = tax.compute_all(
-                                discounted_price,
-                                currency=invoice.currency_id,
-                                quantity=line.quantity,
-                                product=line.product_id,
-                                partner=invoice.partner_id,
-                                rounding_method='round_globally',
-                            )
-                            base_amount = taxes_res['total_excluded']
-                            iva_amount = round(sum(t['amount'] for t in taxes_res['taxes']), 2)
-                            # Sumar al grupo correspondiente
-                            base_per_group[tax_group_id] += base_amount
-                            iva_per_group[tax_group_id] += iva_amount
                 for tg in tax_groups:
-                    worksheet.write(row, tax_struct[tg.id]['base'], base_per_group[tg.id], formats['number'])
-                    worksheet.write(row, tax_struct[tg.id]['iva'], iva_per_group[tg.id], formats['number'])
+                    worksheet.write(row, tax_struct[tg.id]['base'], base_per_group.get(tg.id, 0.0), formats['number'])
+                    worksheet.write(row, tax_struct[tg.id]['iva'], round(iva_per_group.get(tg.id, 0.0), 2), formats['number'])
                 # Total compra
-                total_line = sum(base_per_group.values()) + sum(iva_per_group.values())
+                total_line = sum(base_per_group.values()) + sum(round(iva, 2) for iva in iva_per_group.values())
                 worksheet.write(row, tax_col, total_line, formats['number']) 
                 # Casilla Retenciones
                 has_posted_withhold = any(ret.state == 'posted' for ret in invoice.l10n_ec_withhold_ids)
@@ -184,6 +147,4 @@ class ReportPurchaseA2Wizard(models.TransientModel):
                 worksheet.write(row, tax_col+4, invoice.l10n_ec_sri_payment_id.name if invoice.l10n_ec_sri_payment_id else '', formats['border'])
                 worksheet.write(row, tax_col+5, invoice.ref or '', formats['border'])
                 cont += 1
-        workbook.close()
-        output.seek(0)
-        return output.read()
\ No newline at end of file
+        workbook.close()
\ No newline at end of file
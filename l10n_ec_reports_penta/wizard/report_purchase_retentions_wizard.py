@@ -1,16 +1,17 @@
 from odoo import models, fields
-import base64
-import io
 import math
-from odoo.tools.misc import xlsxwriter
+from ..models.pentalab_report_run import profiled_report, report_phase, report_rows
 
 class ReportPurchaseRetentionsWizard(models.TransientModel):
     _name = 'report.purchase.retentions.wizard'
+    _inherit = 'pentalab.report.output.mixin'
     _description = 'Wizard to generate report purchase and retentions'
+    _report_job_methods = ('print_report',)
 
     date_start = fields.Date(string='Date start')
     date_end = fields.Date(string='Date end')
     
+    @report_phase('fetch')
     def _get_invoices_data(self):
         # Generar data para reporte
         invoices = self.env['account.move'].search([
@@ -19,6 +20,7 @@ class ReportPurchaseRetentionsWizard(models.TransientModel):
             ('invoice_date', '<=', self.date_end),
             ('move_type', '=', 'in_invoice')
             ], order='invoice_date asc')
+        report_rows(len(invoices))
         return invoices
     
     def _get_retentions_data(self, invoice):
@@ -31,25 +33,17 @@ class ReportPurchaseRetentionsWizard(models.TransientModel):
             retentions = move_obj
         return retentions
     
+    @profiled_report
     def print_report(self):
-        report = self.generate_xlsx_report()
-        attachment = self.env['ir.attachment'].create({
-            'name': 'ComprasRetenciones.xlsx',
-            'type': 'binary',
-            'datas': base64.b64encode(report),
-            'res_model': self._name,
-            'res_id': self.id,
-            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        })
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
+        file_name = 'ComprasRetenciones.xlsx'
+        with self._report_tmp_path() as path:
+            self.generate_xlsx_report(path)
+            attachment = self._report_attach_file(path, file_name)
+        return self._report_download_action(attachment)
         
-    def generate_xlsx_report(self):
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    @profiled_report
+    def generate_xlsx_report(self, path):
+        workbook = self._report_new_workbook(path)
         worksheet = workbook.add_worksheet("ComprasRetenciones")
         # Formatos
         bold_center = workbook.add_format({'bold': True, 'align': 'center', 'valign': 'vcenter', 'border': 1})
@@ -75,9 +69,13 @@ class ReportPurchaseRetentionsWizard(models.TransientModel):
         worksheet.merge_range('A1:K1', 'REPORTE DE COMPRAS', title_format)
         worksheet.merge_range('L1:P1', 'RETENCIONES RENTA', title_format)
         worksheet.merge_range('Q1:S1', 'RETENCIONES IVA', title_format)
-        worksheet.merge_range('T1:T2', 'VALOR A PAGAR', title_format)
-        worksheet.merge_range('U1:U2', 'NÚMERO RETENCIÓN', title_format)
+        # T y U ocupan dos filas; en modo constant_memory las filas se escriben
+        # en orden, por lo que no se combinan celdas entre filas
+        worksheet.write('T1', 'VALOR A PAGAR', title_format)
+        worksheet.write('U1', 'NÚMERO RETENCIÓN', title_format)
         row = 1
+        worksheet.write_blank(row, 19, None, title_format)
+        worksheet.write_blank(row, 20, None, title_format)
         # Subtitulo
         worksheet.write(row, 0, 'CANT', bold_center)
         worksheet.write(row, 1, 'FECHA', bold_center)
@@ -100,7 +98,7 @@ class ReportPurchaseRetentionsWizard(models.TransientModel):
         worksheet.write(row, 18, '100%', bold_center)
         cont = 1
         # Mapear datos
-        for invoice in invoices:
+        for invoice in self._report_progress_iter(invoices, 10, 95):
             row += 1
             worksheet.write(row, 0, cont, center)
             worksheet.write(row, 1, invoice.invoice_date.strftime('%d/%m/%Y') if invoice.date else '', center)
@@ -172,5 +170,3 @@ class ReportPurchaseRetentionsWizard(models.TransientModel):
         worksheet.write_formula(row, 18, f"SUM(S3:S{row})", bold_center)
         worksheet.write_formula(row, 19, f"SUM(T3:T{row})", bold_center)
         workbook.close()
-        output.seek(0)
-        return output.read()
@@ -1,15 +1,15 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
-import base64
-import io
-from odoo.tools.misc import xlsxwriter
 from odoo.addons.penta_base.reports.xlsx_formats import get_xlsx_formats
 from odoo.tools import format_invoice_number
+from ..models.pentalab_report_run import profiled_report, report_phase, report_rows
 
 
 class ReportRetentionsA3Wizard(models.TransientModel):
     _name = 'report.retentions.a3.wizard'
+    _inherit = 'pentalab.report.output.mixin'
     _description = 'Wizard to generate report retentions A3'
+    _report_job_methods = ('print_report',)
     
     date_start = fields.Date(string='Desde', required=True)
     date_end = fields.Date(string='Hasta', required=True)
@@ -81,6 +81,7 @@ class ReportRetentionsA3Wizard(models.TransientModel):
             return percent < val
         return True
 
+    @report_phase('fetch')
     def _get_moves_data(self):
         # Generar data para reporte
         move_domain = [
@@ -90,29 +91,21 @@ class ReportRetentionsA3Wizard(models.TransientModel):
             ('journal_id.l10n_ec_withhold_type', '=', 'in_withhold'),
         ]
         moves = self.env['account.move'].search(move_domain, order='date asc')
+        report_rows(len(moves))
         return moves
     
+    @profiled_report
     def print_report(self):
-        report = self.generate_xlsx_report()
         today = fields.Date.context_today(self)
         file_name = f"RetencionesComprasA3_{today.strftime('%d_%m_%Y')}.xlsx"
-        attachment = self.env['ir.attachment'].create({
-            'name': file_name,
-            'type': 'binary',
-            'datas': base64.b64encode(report),
-            'res_model': self._name,
-            'res_id': self.id,
-            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        })
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
+        with self._report_tmp_path() as path:
+            self.generate_xlsx_report(path)
+            attachment = self._report_attach_file(path, file_name)
+        return self._report_download_action(attachment)
     
-    def generate_xlsx_report(self):
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    @profiled_report
+    def generate_xlsx_report(self, path):
+        workbook = self._report_new_workbook(path)
         worksheet = workbook.add_worksheet("Retencion compras A3")
         # Formatos
         formats = get_xlsx_formats(workbook)
@@ -153,7 +146,7 @@ class ReportRetentionsA3Wizard(models.TransientModel):
         # Mapear datos
         row += 1
         cont = 1
-        for move in moves:
+        for move in self._report_progress_iter(moves, 10, 95):
             invoice = move.line_ids.mapped('l10n_ec_withhold_invoice_id').id
             if invoice:
                 invoice = self.env['account.move'].browse(invoice)
@@ -207,6 +200,4 @@ class ReportRetentionsA3Wizard(models.TransientModel):
                     worksheet.write(row, 14, account_name, formats['border'])
                     row += 1
                     cont += 1
-        workbook.close()
-        output.seek(0)
-        return output.read()
\ No newline at end of file
+        workbook.close()
\ No newline at end of file
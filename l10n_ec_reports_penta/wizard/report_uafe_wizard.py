@@ -1,16 +1,17 @@
 from odoo import models, fields
 from datetime import datetime, date
 import calendar
+import contextlib
 import zipfile
-import base64
-import io
 from collections import defaultdict
-from odoo.tools.misc import xlsxwriter
-from odoo.tools import remove_accents, sanitize_text, extract_numbers
+from odoo.tools import SQL, remove_accents, sanitize_text, extract_numbers
+from ..models.pentalab_report_run import profiled_report, report_phase, report_rows
 
 class ReportUafeWizard(models.TransientModel):
     _name = 'report.uafe.wizard'
+    _inherit = 'pentalab.report.output.mixin'
     _description = 'Wizard to generate report UAFE'
+    _report_job_methods = ('print_report',)
 
     year = fields.Selection(
         selection=lambda self: [(str(y), str(y)) for y in range(datetime.now().year - 5, datetime.now().year + 2)],
@@ -48,79 +49,130 @@ class ReportUafeWizard(models.TransientModel):
     total_valores_bienes = fields.Integer(string='Total Valores y Bienes', readonly=True)
     total_valor_total = fields.Integer(string='Total General', readonly=True)
     
-    def _total_payments_by_partner(self, moves):
-        totals = {}
-        processed = set()
-        # Recorrer pagos tipo account.move
-        for move in moves:
-            for line in move.line_ids:
-                matched_lines = line.matched_debit_ids | line.matched_credit_ids
-                for matched in matched_lines:
-                    # Identificador único para evitar duplicados
-                    key = (matched.id,)
-                    if key in processed:
-                        continue
-                    processed.add(key)
-                    reconciled_line = matched.debit_move_id if matched.debit_move_id.move_id.move_type in ('out_invoice','in_invoice') else matched.credit_move_id
-                    if reconciled_line.move_id.move_type in ('out_invoice','in_invoice'):
-                        inv = reconciled_line.move_id
-                        partner = inv.partner_id
-                        totals.setdefault(partner.id, {'partner': partner, 'total': 0.0})
-                        totals[partner.id]['total'] += matched.amount
-        return totals
-    
-    def _get_data_for_reports(self, date_start, date_end, uafe_domain):
-        # Filtrar facturas que tengan líneas con números de serie
-        def _has_serial_number(inv):
-            for line in inv.invoice_line_ids:
-                if (
-                    line.product_id.is_storable
-                    and line.product_id.tracking in ('serial', 'lot')
-                ):
-                    return True
-            return False
+    def _get_reconciliation_graph(self, date_start, date_end, uafe_domain):
+        """
+        Recorre en una sola consulta el grafo de conciliaciones de los pagos
+        del periodo:
+
+        - asientos de pago (``entry``) publicados entre fechas con líneas de
+          contactos del dominio UAFE;
+        - conciliaciones parciales de esos asientos y la factura del otro
+          lado (la del débito si es factura, si no la del crédito; se omiten
+          las que contienen 'RC' en el número);
+        - todas las conciliaciones parciales de esas facturas, sumadas por el
+          contacto de la factura.
+
+        Retorna una lista de diccionarios ``kind`` ('invoice' / 'partner'),
+        ``res_id``, ``amount`` (total pagado del contacto) y ``has_serial``
+        (factura con productos almacenables con lote o serie).
+        """
         # Definir filtros según uafe_domain
         m_partner_domain = ['|', ('customer_rank', '>', 0), ('supplier_rank', '>', 0)]
         if uafe_domain == "customer":
             m_partner_domain = [('customer_rank', '>', 0)]
         elif uafe_domain == "supplier":
             m_partner_domain = [('supplier_rank', '>', 0)]
-        # Obtener asientos de pagos entre fechas y con facturas relacinadas
-        moves = self.env['account.move'].search(
-            [
-                ('date', '>=', date_start),
-                ('date', '<=', date_end),
-                ('state', '=', 'posted'),
-                ('move_type', '=', 'entry'),
-                ('line_ids.partner_id', 'in', self.env['res.partner'].search(m_partner_domain).ids)
-            ]
-        ).filtered(lambda m: m.has_reconciled_entries)
-        # Obtener facturas relacionadas a pagos y asientos de pagos
-        invoice_ids_from_moves = []
-        for move in moves:
-            for line in move.line_ids:
-                # Revisar si la línea tiene pagos conciliados
-                matched_lines = line.matched_debit_ids | line.matched_credit_ids
-                for matched in matched_lines:
-                    debit_move = matched.debit_move_id.move_id
-                    credit_move = matched.credit_move_id.move_id
-                    # Si el asiento es de factura
-                    if debit_move.move_type in ('out_invoice', 'in_invoice') and 'RC' not in debit_move.name:
-                        invoice_ids_from_moves.append(debit_move.id)
-                    elif credit_move.move_type in ('out_invoice', 'in_invoice') and 'RC' not in credit_move.name:
-                        invoice_ids_from_moves.append(credit_move.id)
-                    """
-                    reconciled_line = matched.debit_move_id if matched.debit_move_id.move_id.move_type in ('out_invoice','in_invoice') else matched.credit_move_id
-                    # Asegurarse que la línea pertenece a una factura
-                    if reconciled_line.move_id.move_type in ('out_invoice','in_invoice', 'entry') and 'RC' not in reconciled_line.move_id.name:
-                        invoice_ids_from_moves.append(reconciled_line.move_id.id)
-                    """
-        invoices_from_moves = self.env['account.move'].browse(list(set(invoice_ids_from_moves)))
-        # Unir todas las facturas
-        invoice_ids = list(set(invoices_from_moves.ids))
-        invoices = self.env['account.move'].browse(invoice_ids)
-        invoices = invoices.filtered(_has_serial_number)
-        total_partners = self._total_payments_by_partner(invoices_from_moves)
+        payment_query = self.env['account.move']._search([
+            ('date', '>=', date_start),
+            ('date', '<=', date_end),
+            ('state', '=', 'posted'),
+            ('move_type', '=', 'entry'),
+            ('line_ids.partner_id', 'in', self.env['res.partner']._search(m_partner_domain)),
+        ])
+        self.env.flush_all()
+        self.env.cr.execute(SQL("""
+            WITH payment_moves AS (
+                %(payment_moves)s
+            ),
+            payment_partials AS (
+                SELECT apr.debit_move_id, apr.credit_move_id
+                  FROM account_partial_reconcile apr
+                  JOIN account_move_line aml ON aml.id = apr.debit_move_id
+                 WHERE aml.move_id IN (SELECT id FROM payment_moves)
+                 UNION
+                SELECT apr.debit_move_id, apr.credit_move_id
+                  FROM account_partial_reconcile apr
+                  JOIN account_move_line aml ON aml.id = apr.credit_move_id
+                 WHERE aml.move_id IN (SELECT id FROM payment_moves)
+            ),
+            invoices AS (
+                SELECT DISTINCT CASE
+                           WHEN debit_move.move_type IN ('out_invoice', 'in_invoice')
+                                AND COALESCE(debit_move.name, '') NOT LIKE %(rc)s THEN debit_move.id
+                           WHEN credit_move.move_type IN ('out_invoice', 'in_invoice')
+                                AND COALESCE(credit_move.name, '') NOT LIKE %(rc)s THEN credit_move.id
+                       END AS id
+                  FROM payment_partials pp
+                  JOIN account_move_line debit_line ON debit_line.id = pp.debit_move_id
+                  JOIN account_move debit_move ON debit_move.id = debit_line.move_id
+                  JOIN account_move_line credit_line ON credit_line.id = pp.credit_move_id
+                  JOIN account_move credit_move ON credit_move.id = credit_line.move_id
+            ),
+            invoice_partials AS (
+                SELECT apr.id, apr.amount, apr.debit_move_id, apr.credit_move_id
+                  FROM account_partial_reconcile apr
+                  JOIN account_move_line aml ON aml.id = apr.debit_move_id
+                 WHERE aml.move_id IN (SELECT id FROM invoices)
+                 UNION
+                SELECT apr.id, apr.amount, apr.debit_move_id, apr.credit_move_id
+                  FROM account_partial_reconcile apr
+                  JOIN account_move_line aml ON aml.id = apr.credit_move_id
+                 WHERE aml.move_id IN (SELECT id FROM invoices)
+            ),
+            partner_paid AS (
+                SELECT CASE
+                           WHEN debit_move.move_type IN ('out_invoice', 'in_invoice') THEN debit_move.partner_id
+                           ELSE credit_move.partner_id
+                       END AS partner_id,
+                       ip.amount
+                  FROM invoice_partials ip
+                  JOIN account_move_line debit_line ON debit_line.id = ip.debit_move_id
+                  JOIN account_move debit_move ON debit_move.id = debit_line.move_id
+                  JOIN account_move_line credit_line ON credit_line.id = ip.credit_move_id
+                  JOIN account_move credit_move ON credit_move.id = credit_line.move_id
+                 WHERE debit_move.move_type IN ('out_invoice', 'in_invoice')
+                    OR credit_move.move_type IN ('out_invoice', 'in_invoice')
+            )
+            SELECT 'invoice' AS kind,
+                   inv.id AS res_id,
+                   NULL::numeric AS amount,
+                   EXISTS (
+                       SELECT 1
+                         FROM account_move_line aml
+                         JOIN product_product pp ON pp.id = aml.product_id
+                         JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                        WHERE aml.move_id = inv.id
+                          AND aml.display_type IN ('product', 'line_section', 'line_note')
+                          AND pt.is_storable
+                          AND pt.tracking IN ('serial', 'lot')
+                   ) AS has_serial
+              FROM invoices inv
+             WHERE inv.id IS NOT NULL
+             UNION ALL
+            SELECT 'partner', partner_id, SUM(amount), NULL
+              FROM partner_paid
+          GROUP BY partner_id
+          ORDER BY kind, res_id
+        """, payment_moves=payment_query.subselect(), rc='%RC%'))
+        return self.env.cr.dictfetchall()
+
+    @report_phase('fetch')
+    def _get_data_for_reports(self, date_start, date_end, uafe_domain):
+        invoice_ids_with_serial = []
+        paid_by_partner = {}
+        for row in self._get_reconciliation_graph(date_start, date_end, uafe_domain):
+            if row['kind'] == 'invoice':
+                # Filtrar facturas que tengan líneas con números de serie
+                if row['has_serial']:
+                    invoice_ids_with_serial.append(row['res_id'])
+            elif row['res_id']:
+                paid_by_partner[row['res_id']] = row['amount'] or 0.0
+        invoices = self.env['account.move'].browse(invoice_ids_with_serial)
+        partners = self.env['res.partner'].browse(list(paid_by_partner))
+        total_partners = {
+            partner.id: {'partner': partner, 'total': paid_by_partner[partner.id]}
+            for partner in partners
+        }
         # Filtrar facturas solo de clientes que superen el valor definido
         sales_amount_threshold = self.env.company.sales_amount_report_uafe or 0.0
         if sales_amount_threshold > 0.0:
@@ -128,21 +180,126 @@ class ReportUafeWizard(models.TransientModel):
             invoices = invoices.filtered(lambda inv: inv.partner_id.id in partners_over_limit)
             # Reasignar total_partners solo con los que cumplen
             total_partners = partners_over_limit
+        report_rows(len(invoices))
         return {
             'invoices': invoices,
             'payments_by_partner': total_partners,
         }
         
-    def _get_retentions_data(self, invoice):
-        # Obtener datos de retenciones de la factura
-        data = invoice.l10n_ec_action_view_withholds()
-        move_obj = self.env['account.move']
-        if data and data['res_id']:
-            retentions = move_obj.browse(data['res_id'])
-        else:
-            retentions = move_obj
+    def _get_retentions_by_invoice(self, invoices):
+        """
+        Retenciones por factura, en lote. Igual que
+        ``l10n_ec_action_view_withholds`` (usado antes factura por factura),
+        solo se considera la retención cuando la factura tiene una única.
+        """
+        groups = self.env['account.move.line']._read_group(
+            [('l10n_ec_withhold_invoice_id', 'in', invoices.ids)],
+            ['l10n_ec_withhold_invoice_id'],
+            ['move_id:array_agg'],
+        )
+        retentions = {}
+        for invoice, move_ids in groups:
+            move_ids = set(move_ids)
+            if len(move_ids) == 1:
+                retentions[invoice.id] = move_ids
         return retentions
-    
+
+    def _prefetch_transaction_data(self, invoices, date_from, date_to):
+        """
+        Carga en lote los pagos, conciliaciones y retenciones de las facturas
+        para el detalle de transacciones.
+
+        Retorna ``{invoice_id: {'payments': [account.move], 'payment_amount': float,
+        'retention_total': float}}`` donde ``payments`` son los asientos
+        conciliados con la factura dentro del periodo (en el orden del widget
+        de pagos), ``payment_amount`` el valor pagado por esos asientos que no
+        son retenciones y ``retention_total`` la suma de retenciones en
+        porcentaje del periodo.
+        """
+        result = {
+            invoice.id: {'payments': [], 'payment_amount': 0.0, 'retention_total': 0.0}
+            for invoice in invoices
+        }
+        if not invoices:
+            return result
+        retentions_by_invoice = self._get_retentions_by_invoice(invoices)
+        self.env.flush_all()
+        # Conciliaciones entre las líneas de la factura y sus contrapartidas
+        self.env.cr.execute("""
+            SELECT apr.id AS partial_id,
+                   apr.amount,
+                   inv_line.move_id AS invoice_id,
+                   inv_line.display_type = 'payment_term' AS is_payment_term,
+                   inv_line.id = apr.debit_move_id AS invoice_is_debit,
+                   pay_line.move_id AS payment_move_id,
+                   pay_line.reconciled AS payment_line_reconciled,
+                   pay_line.matching_number,
+                   EXISTS (
+                       SELECT 1
+                         FROM account_partial_reconcile exchange
+                        WHERE exchange.exchange_move_id = pay_line.move_id
+                   ) AS is_exchange
+              FROM account_partial_reconcile apr
+              JOIN account_move_line inv_line ON inv_line.id IN (apr.debit_move_id, apr.credit_move_id)
+              JOIN account_move_line pay_line ON pay_line.id = CASE
+                       WHEN inv_line.id = apr.debit_move_id THEN apr.credit_move_id
+                       ELSE apr.debit_move_id
+                   END
+             WHERE inv_line.move_id = ANY(%s)
+               AND pay_line.move_id != inv_line.move_id
+          ORDER BY apr.id
+        """, [invoices.ids])
+        partials = self.env.cr.dictfetchall()
+        payment_move_ids = {p['payment_move_id'] for p in partials}
+        payment_moves = self.env['account.move'].browse(list(payment_move_ids))
+        moves_by_id = {move.id: move for move in payment_moves}
+        # Débitos y créditos de cada asiento de pago por número de conciliación
+        self.env.cr.execute("""
+            SELECT move_id, matching_number, SUM(debit), SUM(credit)
+              FROM account_move_line
+             WHERE move_id = ANY(%s)
+               AND matching_number IS NOT NULL
+          GROUP BY move_id, matching_number
+        """, [list(payment_move_ids)])
+        matching_totals = {(r[0], r[1]): (r[2], r[3]) for r in self.env.cr.fetchall()}
+
+        payments_in_period = {}
+        for move in payment_moves:
+            payments_in_period[move.id] = move.date and date_from <= move.date <= date_to
+        for partial in partials:
+            invoice_data = result[partial['invoice_id']]
+            move_id = partial['payment_move_id']
+            # Solo los pagos del widget de la factura del periodo (líneas de
+            # plazo de pago, sin diferencias de cambio)
+            if not (partial['is_payment_term'] and not partial['is_exchange'] and payments_in_period[move_id]):
+                continue
+            if moves_by_id[move_id] not in invoice_data['payments']:
+                invoice_data['payments'].append(moves_by_id[move_id])
+            # Valor pagado por esos asientos, salvo retenciones
+            if (
+                not partial['payment_line_reconciled']
+                or move_id in retentions_by_invoice.get(partial['invoice_id'], ())
+            ):
+                continue
+            debit, credit = matching_totals.get((move_id, partial['matching_number']), (0.0, 0.0))
+            # Factura al débito: se suman los créditos del pago, y viceversa
+            total_lines = credit if partial['invoice_is_debit'] else debit
+            invoice_data['payment_amount'] += min(partial['amount'], total_lines)
+
+        # Retenciones en porcentaje del periodo
+        retention_moves = self.env['account.move'].browse(
+            list({move_id for move_ids in retentions_by_invoice.values() for move_id in move_ids})
+        )
+        retention_by_id = {move.id: move for move in retention_moves}
+        for invoice_id, move_ids in retentions_by_invoice.items():
+            for retention in (retention_by_id[move_id] for move_id in move_ids):
+                if date_from <= retention.date <= date_to:
+                    for line in retention.l10n_ec_withhold_line_ids:
+                        for tax in line.tax_ids:
+                            if tax.amount_type == 'percent':
+                                result[invoice_id]['retention_total'] += line.l10n_ec_withhold_tax_amount
+        return result
+
     def _get_identification_type(self, value):
         if not value or not isinstance(value, str):
             return ''
@@ -156,6 +313,7 @@ class ReportUafeWizard(models.TransientModel):
         elif v.startswith('id extranjera'):
             return 'A'
         
+    @profiled_report
     def print_report(self):
         return self.generate_uafe_reports()
     
@@ -172,42 +330,32 @@ class ReportUafeWizard(models.TransientModel):
         self.total_tarjeta = 0
         self.total_valores_bienes = 0
         self.total_valor_total = 0
-        zip_buffer = io.BytesIO()
         # Mapear datos necesarios para el reporte
         year = int(self.year)
         month = int(self.month)
         last_day = calendar.monthrange(year, month)[1]
         datas = self._get_data_for_reports(date(year, month, 1), date(year, month, last_day), self.domain_uafe)
-        with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-            report_files = {
-                'DETALLECLIENTE.xlsx': self._generate_detalle_cliente(datas),
-                'DETALLEOPERACION.xlsx': self._generate_detalle_operacion(datas),
-                'DETALLETRANSACCION.xlsx': self._generate_detalle_transaccion(datas),
-                'CABECERA.xlsx': self._generate_cabecera(datas),
-            }
-
-            for filename, content in report_files.items():
-                zip_file.writestr(filename, content)
-
-        zip_buffer.seek(0)
-        attachment = self.env['ir.attachment'].create({
-            'name': 'UAFE_Reports.zip',
-            'type': 'binary',
-            'datas': base64.b64encode(zip_buffer.read()),
-            'res_model': self._name,
-            'res_id': self.id,
-            'mimetype': 'application/zip',
-        })
-
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
+        self._report_progress(20)
+        report_generators = {
+            'DETALLECLIENTE.xlsx': self._generate_detalle_cliente,
+            'DETALLEOPERACION.xlsx': self._generate_detalle_operacion,
+            'DETALLETRANSACCION.xlsx': self._generate_detalle_transaccion,
+            'CABECERA.xlsx': self._generate_cabecera,
         }
+        with contextlib.ExitStack() as stack:
+            zip_path = stack.enter_context(self._report_tmp_path(suffix='.zip'))
+            with zipfile.ZipFile(zip_path, 'w') as zip_file:
+                for index, (filename, generator) in enumerate(report_generators.items(), 1):
+                    path = stack.enter_context(self._report_tmp_path())
+                    generator(datas, path)
+                    zip_file.write(path, filename)
+                    self._report_progress(20 + 80 * index // len(report_generators))
+            attachment = self._report_attach_file(zip_path, 'UAFE_Reports.zip', mimetype='application/zip')
+        return self._report_download_action(attachment)
     
-    def _generate_detalle_cliente(self, datas):
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    @profiled_report
+    def _generate_detalle_cliente(self, datas, path):
+        workbook = self._report_new_workbook(path)
         worksheet = workbook.add_worksheet("Detalle Cliente")
         # Ancho de columnas
         worksheet.set_column('A:A', 15)
@@ -254,12 +402,10 @@ class ReportUafeWizard(models.TransientModel):
             worksheet.write(row, 10, customer.industry_id and customer.industry_id.code or '')
             worksheet.write(row, 11, int(datas['payments_by_partner'].get(customer.id, {}).get('total', 0.00)) or 0)
         workbook.close()
-        output.seek(0)
-        return output.read()
     
-    def _generate_detalle_operacion(self, datas):
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    @profiled_report
+    def _generate_detalle_operacion(self, datas, path):
+        workbook = self._report_new_workbook(path)
         worksheet = workbook.add_worksheet("Detalle Operacion")
         # Ancho de columnas
         worksheet.set_column('A:A', 15)
@@ -357,12 +503,10 @@ class ReportUafeWizard(models.TransientModel):
                     operation_count += 1
         self.total_reg_operaciones = operation_count
         workbook.close()
-        output.seek(0)
-        return output.read()
     
-    def _generate_detalle_transaccion(self, datas):
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    @profiled_report
+    def _generate_detalle_transaccion(self, datas, path):
+        workbook = self._report_new_workbook(path)
         worksheet = workbook.add_worksheet("Detalle Transaccion")
         # Ancho de columnas
         worksheet.set_column('A:A', 15)
@@ -402,73 +546,16 @@ class ReportUafeWizard(models.TransientModel):
         last_day = calendar.monthrange(year, month)[1]
         # Mapear pagos de facturas
         transaction_count = 0
+        total_creditos = total_debitos = total_valores_bienes = total_valor_total = 0
         process_payments = {}
         invoices = datas['invoices']
+        transaction_data = self._prefetch_transaction_data(invoices, date(year, month, 1), date(year, month, last_day))
         invoices_sorted = sorted(invoices, key=lambda inv: (inv.partner_id.vat or '', inv.name or ''))
         for invoice in invoices_sorted:
-            move_payments = []
-            total_payment_amount = 0.0
-            # mapear pagos directos
-            result = invoice.open_payments()
-            retentions = self._get_retentions_data(invoice)
-            payment_id = result.get('res_id', False)
-            if isinstance(payment_id, int) and payment_id > 0:
-                pay = self.env['account.payment'].browse(payment_id)
-                move_payments.append(pay.move_id)
-            # mapear pagos de asientos POS
-            if invoice.invoice_payments_widget and invoice.invoice_payments_widget['content']:
-                for pays in invoice.invoice_payments_widget['content']:
-                    move_payments.append(pays['move_id'])
-            processed_moves = set()
-            list_payments = []
-            for move_payment in move_payments:
-                # Asegurarnos de tener un ID
-                if hasattr(move_payment, 'id'):
-                    move_payment = move_payment.id
-                # Evitar duplicados
-                if move_payment in processed_moves:
-                    continue
-                processed_moves.add(move_payment)
-                payment = self.env['account.move'].browse(move_payment)
-                # Validar fechas de reporte
-                if payment.date >= date(year, month, 1) and payment.date <= date(year, month, last_day):
-                    list_payments.append(payment)
-                    # Validar que no sea una retencion
-                    if payment.id not in retentions.ids:
-                        for line in payment.line_ids:
-                            # Comporbamos si la línea está reconciliada
-                            if line.reconciled:
-                                # Obtenemos los matched lines
-                                for rec_line in line.matched_debit_ids + line.matched_credit_ids:
-                                    # Verificamos si la factura está relacionada (DEBITO)
-                                    if rec_line.debit_move_id.move_id.id == invoice.id:
-                                        # Obtenemos el numero de conciliación
-                                        matching_number = line.matching_number
-                                        # Buscamos las líneas de conciliación relacionadas al numero de conciliación y al pago
-                                        c_lines = self.env['account.move.line'].search([
-                                            ('move_id', '=', payment.id),
-                                            ('matching_number', '=', matching_number)
-                                        ])
-                                        # Sumamos los valores de las líneas de crédito
-                                        c_total_lines = sum(c_lines.mapped('credit'))
-                                        if rec_line.amount < c_total_lines:
-                                            c_total_lines = rec_line.amount
-                                        total_payment_amount += c_total_lines
-                                    # Verificamos si la factura está relacionada (CREDITO)
-                                    if rec_line.credit_move_id.move_id.id == invoice.id:
-                                        # Obtenemos el numero de conciliación
-                                        matching_number = line.matching_number
-                                        # Buscamos las líneas de conciliación relacionadas al numero de conciliación y al pago
-                                        d_lines = self.env['account.move.line'].search([
-                                            ('move_id', '=', payment.id),
-                                            ('matching_number', '=', matching_number)
-                                        ])
-                                        matching_number = line.matching_number
-                                        # Sumamos los valores de las líneas de debito
-                                        d_total_lines = sum(d_lines.mapped('debit'))
-                                        if rec_line.amount < c_total_lines:
-                                            d_total_lines = rec_line.amount
-                                        total_payment_amount += d_total_lines
+            invoice_data = transaction_data[invoice.id]
+            list_payments = invoice_data['payments']
+            total_payment_amount = invoice_data['payment_amount']
+            retention_total = invoice_data['retention_total']
             total_invoice_lines = 0
             for line in invoice.invoice_line_ids:
                 if line.quantity > 1:
@@ -512,10 +599,10 @@ class ReportUafeWizard(models.TransientModel):
                     worksheet.write(row, 5, '192')
                     # cliente
                     if invoice.move_type in ('out_invoice', 'out_refund'):
-                        self.total_creditos += payment_amount
+                        total_creditos += payment_amount
                     # proveedor
                     else:
-                        self.total_debitos += payment_amount
+                        total_debitos += payment_amount
                     worksheet.write(row, 6, payment_amount if invoice.move_type not in ('out_invoice', 'out_refund') else 0)
                     worksheet.write(row, 7, payment_amount if invoice.move_type in ('out_invoice', 'out_refund') else 0)
                     worksheet.write(row, 8, '0')
@@ -533,16 +620,8 @@ class ReportUafeWizard(models.TransientModel):
                         worksheet.write(row, 10, payment_amount)
                         self.total_tarjeta += payment_amount
                     """
-                    retention_total = 0
-                    # Retenciones
-                    for retention in retentions:
-                        if retention.date >= date(year, month, 1) and retention.date <= date(year, month, last_day):
-                            for line in retention.l10n_ec_withhold_line_ids:
-                                for tax in line.tax_ids:
-                                    if tax.amount_type == 'percent':
-                                        retention_total += line.l10n_ec_withhold_tax_amount
-                    self.total_valores_bienes += retention_total
-                    self.total_valor_total += int(payment_amount) + int(retention_total)
+                    total_valores_bienes += retention_total
+                    total_valor_total += int(payment_amount) + int(retention_total)
                     worksheet.write(row, 11, int(retention_total))
                     worksheet.write(row, 12, int(payment_amount) + int(retention_total))
                     worksheet.write(row, 13, sanitize_text(payment.currency_id.name))
@@ -558,13 +637,15 @@ class ReportUafeWizard(models.TransientModel):
                     worksheet.write(row, 23, 'NO APLICA')
                     transaction_count += 1
         self.total_reg_transacciones = transaction_count
+        self.total_creditos += total_creditos
+        self.total_debitos += total_debitos
+        self.total_valores_bienes += total_valores_bienes
+        self.total_valor_total += total_valor_total
         workbook.close()
-        output.seek(0)
-        return output.read()
     
-    def _generate_cabecera(self, datas):
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    @profiled_report
+    def _generate_cabecera(self, datas, path):
+        workbook = self._report_new_workbook(path)
         worksheet = workbook.add_worksheet("Detalle Transaccion")
         # Ancho de columnas
         worksheet.set_column('A:A', 15)
@@ -603,6 +684,4 @@ class ReportUafeWizard(models.TransientModel):
         worksheet.write(1, 12, self.total_tarjeta)
         worksheet.write(1, 13, self.total_valores_bienes)
         worksheet.write(1, 14, self.total_valor_total)
-        workbook.close()
-        output.seek(0)
-        return output.read()
\ No newline at end of file
+        workbook.close()
\ No newline at end of file
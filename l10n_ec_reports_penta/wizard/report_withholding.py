@@ -1,15 +1,15 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
-import base64
-import io
-from odoo.tools.misc import xlsxwriter
 from odoo.addons.penta_base.reports.xlsx_formats import get_xlsx_formats
 from odoo.tools import format_invoice_number
+from ..models.pentalab_report_run import profiled_report, report_phase, report_rows
 
 
 class ReportSalesWithholdingWizard(models.TransientModel):
 	_name = 'report.sales.withholding.wizard'
+	_inherit = 'pentalab.report.output.mixin'
 	_description = 'Wizard to generate sales withholdings report'
+	_report_job_methods = ('print_report',)
 
 	date_start = fields.Date(string='Desde', required=True)
 	date_end = fields.Date(string='Hasta', required=True)
@@ -94,6 +94,7 @@ class ReportSalesWithholdingWizard(models.TransientModel):
 			return percent < val
 		return True
 
+	@report_phase('fetch')
 	def _get_moves_data(self):
 		# Generar data para reporte
 		move_domain = [
@@ -102,29 +103,22 @@ class ReportSalesWithholdingWizard(models.TransientModel):
 			('l10n_ec_withhold_date', '<=', self.date_end),
 			('journal_id.l10n_ec_withhold_type', '=', 'out_withhold'),
 		]
-		return self.env['account.move'].search(move_domain, order='l10n_ec_withhold_date asc')
+		moves = self.env['account.move'].search(move_domain, order='l10n_ec_withhold_date asc')
+		report_rows(len(moves))
+		return moves
 
+	@profiled_report
 	def print_report(self):
-		report = self.generate_xlsx_report()
 		today = fields.Date.context_today(self)
 		file_name = f"RetencionesVentas_{today.strftime('%d_%m_%Y')}.xlsx"
-		attachment = self.env['ir.attachment'].create({
-			'name': file_name,
-			'type': 'binary',
-			'datas': base64.b64encode(report),
-			'res_model': self._name,
-			'res_id': self.id,
-			'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-		})
-		return {
-			'type': 'ir.actions.act_url',
-			'url': f'/web/content/{attachment.id}?download=true',
-			'target': 'self',
-		}
+		with self._report_tmp_path() as path:
+			self.generate_xlsx_report(path)
+			attachment = self._report_attach_file(path, file_name)
+		return self._report_download_action(attachment)
 
-	def generate_xlsx_report(self):
-		output = io.BytesIO()
-		workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+	@profiled_report
+	def generate_xlsx_report(self, path):
+		workbook = self._report_new_workbook(path)
 		worksheet = workbook.add_worksheet("Retenciones Ventas")
 		# Formatos
 		formats = get_xlsx_formats(workbook)
@@ -163,7 +157,7 @@ class ReportSalesWithholdingWizard(models.TransientModel):
 		moves = self._get_moves_data()
 		iva_tax_groups = self.env['account.tax.group'].search([('type_ret', 'in', ['withholding_iva_sales'])])
 		rent_tax_groups = self.env['account.tax.group'].search([('type_ret', 'in', ['withholding_rent_sales'])])
-		for move in moves:
+		for move in self._report_progress_iter(moves, 10, 95):
 			invoice = move.line_ids.mapped('l10n_ec_withhold_invoice_id').id
 			if invoice:
 				invoice = self.env['account.move'].browse(invoice)
@@ -233,5 +227,3 @@ class ReportSalesWithholdingWizard(models.TransientModel):
 				row += 1
 				count += 1
 		workbook.close()
-		output.seek(0)
-		return output.read()